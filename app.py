@@ -49,7 +49,10 @@ from flask_session import Session
 import sqlite3
 # Library to perform HTTP requests
 import requests
-from requests.exceptions import RequestException
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException, HTTPError
+# Per-host circuit breakers of the Kaspa API client
+from urllib.parse import urlparse
 # Date and duration management
 from datetime import datetime, timedelta, timezone
 # Time zone management
@@ -63,6 +66,8 @@ import random
 # For saving logs and DB backup
 import os
 import shutil
+# Compression of the database backups
+import gzip
 # Also to check the validity of vendor addresses
 import re
 # For clean application shutdown
@@ -70,11 +75,94 @@ import signal
 import sys
 # Transaction order management
 from operator import itemgetter
+# Bounded in-memory set of recently processed transactions
+from collections import OrderedDict
+# Locks shared between the scheduler threads
+import threading
+# Thread pool used to check the monitored wallets in parallel
+from concurrent.futures import ThreadPoolExecutor as WatcherPoolExecutor, wait as wait_futures, Future
+# Job queue of the database writer thread
+import queue
+# Decoding of the Kaspa node wRPC messages and fingerprint of the building configuration
+import json
+import hashlib
+# Decorators of the database writer tasks (keep the name and docstring of the wrapped function)
+import functools
+# Optional: UTXO change notifications over wRPC (TRANSACTION_SOURCE = 'utxo_subscription')
+try:
+    import websocket
+except ImportError:
+    websocket = None
+# Optional: columnar production engine (PRODUCTION_ENGINE = 'numpy', see requirements-numpy.txt)
+try:
+    import numpy
+except ImportError:
+    numpy = None
 # ThreadPoolExecutor to manage scheduler tasks
 from apscheduler.executors.pool import ThreadPoolExecutor
 # Import configuration
 from config import *
 
+# Optional settings (defaults used when they are not defined in config.py)
+# Number of transactions requested per page from the Kaspa API
+KASPA_API_PAGE_SIZE = globals().get('KASPA_API_PAGE_SIZE', 50)
+# Maximum number of pages fetched in a single poll while catching up to the ingestion cursor
+KASPA_INGEST_MAX_PAGES = globals().get('KASPA_INGEST_MAX_PAGES', 200)
+# Number of recently processed transaction IDs kept in memory for deduplication
+RECENT_TX_CACHE_SIZE = globals().get('RECENT_TX_CACHE_SIZE', 5000)
+# Kaspa API client: connection and read timeouts (seconds) and keep-alive connections kept per host
+KASPA_API_CONNECT_TIMEOUT = globals().get('KASPA_API_CONNECT_TIMEOUT', 5)
+KASPA_API_READ_TIMEOUT = globals().get('KASPA_API_READ_TIMEOUT', 50)
+KASPA_API_MAX_CONNECTIONS = globals().get('KASPA_API_MAX_CONNECTIONS', 10)
+# Monitored wallets: number of addresses fetched in parallel and time budget (seconds) of one check cycle
+MONITOR_MAX_WORKERS = globals().get('MONITOR_MAX_WORKERS', 8)
+MONITOR_CYCLE_DEADLINE = globals().get('MONITOR_CYCLE_DEADLINE', max(CHECK_INTERVAL * 0.75, 1))
+# Monitored wallets: page size used to fetch the transactions newer than the sighting cursor of an address
+MONITOR_PROBE_SIZE = globals().get('MONITOR_PROBE_SIZE', 10)
+# SQLite connection pool: idle connections kept open, page cache (KiB) and memory-mapped I/O (bytes) per connection,
+# time (ms) a connection waits for a lock before failing, and prepared statements cached per connection
+DB_POOL_ENABLED = globals().get('DB_POOL_ENABLED', True)
+DB_POOL_SIZE = globals().get('DB_POOL_SIZE', 16)
+DB_CACHE_SIZE_KB = globals().get('DB_CACHE_SIZE_KB', 16384)
+DB_MMAP_SIZE = globals().get('DB_MMAP_SIZE', 256 * 1024 * 1024)
+DB_BUSY_TIMEOUT_MS = globals().get('DB_BUSY_TIMEOUT_MS', 5000)
+DB_STATEMENT_CACHE_SIZE = globals().get('DB_STATEMENT_CACHE_SIZE', 256)
+# Database writer thread: jobs waiting in its queue, seconds a caller waits for room in a full queue,
+# and deposits merged into one batch (see DatabaseWriter)
+DB_WRITER_QUEUE_SIZE = globals().get('DB_WRITER_QUEUE_SIZE', 1000)
+DB_WRITER_SUBMIT_TIMEOUT = globals().get('DB_WRITER_SUBMIT_TIMEOUT', 30)
+DB_WRITER_MAX_BATCH = globals().get('DB_WRITER_MAX_BATCH', 500)
+# API endpoints read from a snapshot refreshed after each committed write instead of the live database (see SnapshotPool)
+API_READ_SNAPSHOT = globals().get('API_READ_SNAPSHOT', True)
+# Kaspa API retries: exponential backoff (seconds) with jitter and maximum number of re-enqueued attempts
+KASPA_API_RETRY_BASE_DELAY = globals().get('KASPA_API_RETRY_BASE_DELAY', 2)
+KASPA_API_RETRY_MAX_DELAY = globals().get('KASPA_API_RETRY_MAX_DELAY', 120)
+KASPA_API_MAX_RETRIES = globals().get('KASPA_API_MAX_RETRIES', 5)
+# Kaspa API circuit breaker: consecutive failures that open the circuit of a host and seconds before a probe request
+KASPA_API_BREAKER_THRESHOLD = globals().get('KASPA_API_BREAKER_THRESHOLD', 5)
+KASPA_API_BREAKER_RESET_TIMEOUT = globals().get('KASPA_API_BREAKER_RESET_TIMEOUT', 30)
+# Source of new transactions: 'polling' (the API is polled every CHECK_INTERVAL) or 'utxo_subscription'
+# (UTXO change notifications from a Kaspa node wRPC endpoint, polling only as gap-filler every TRANSACTION_GAP_FILL_INTERVAL seconds)
+TRANSACTION_SOURCE = globals().get('TRANSACTION_SOURCE', 'polling')
+KASPA_WRPC_URL = globals().get('KASPA_WRPC_URL', 'ws://127.0.0.1:18110')
+TRANSACTION_GAP_FILL_INTERVAL = globals().get('TRANSACTION_GAP_FILL_INTERVAL', 600)
+# Database backups: pages copied per step of the online backup and pause (seconds) between steps,
+# days a dated backup is kept, and whether each backup is restored and checked after it is written
+BACKUP_PAGES_PER_STEP = globals().get('BACKUP_PAGES_PER_STEP', 1024)
+BACKUP_STEP_SLEEP = globals().get('BACKUP_STEP_SLEEP', 0.005)
+BACKUP_RETENTION_DAYS = globals().get('BACKUP_RETENTION_DAYS', 14)
+BACKUP_VERIFY = globals().get('BACKUP_VERIFY', True)
+# History archival: database attached as 'archive', age (days) after which history rows are moved there,
+# and share of free pages above which the main database is vacuumed after an archival run
+ARCHIVE_DB_NAME = globals().get('ARCHIVE_DB_NAME', os.path.splitext(DB_NAME)[0] + '_archive.db')
+ARCHIVE_HORIZON_DAYS = globals().get('ARCHIVE_HORIZON_DAYS', 30)
+ARCHIVE_VACUUM_FREE_RATIO = globals().get('ARCHIVE_VACUUM_FREE_RATIO', 0.25)
+# Per-parcel production and zkaspa credits: 'python' (reference loop) or 'numpy' (columnar engine, needs requirements-numpy.txt)
+PRODUCTION_ENGINE = globals().get('PRODUCTION_ENGINE', 'python')
+# Daily zkaspa distribution applied by a single set-based UPDATE, instead of computing
+# the balances with PRODUCTION_ENGINE and writing them back parcel by parcel
+ZKASPA_DISTRIBUTION_SQL = globals().get('ZKASPA_DISTRIBUTION_SQL', True)
+
 # Get the absolute path of the directory containing your application
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 # Create the 'logs' folder if it doesn't exist
@@ -115,6 +203,12 @@ Session(app)
 # Avoid having logs every minute for the sale of players' plots
 last_log_time = None
 
+# Recently processed transaction IDs (insertion ordered, bounded to RECENT_TX_CACHE_SIZE)
+recent_processed_tx_ids = OrderedDict()
+recent_processed_tx_lock = threading.Lock()
+# Held while the main address is being polled
+ingestion_lock = threading.Lock()
+
 @app.before_request
 def check_origin():
     if request.method != 'OPTIONS':
@@ -175,42 +269,193 @@ def rotate_logs():
     except Exception as e:
         log_message(f"Error during log rotation: {e}")
 
+"""
+snapshot_database(target_file, database=DB_NAME):
+Copies a live database (the main one by default) into target_file with the SQLite online backup API.
+
+The source connection holds a read transaction during the copy: in WAL mode, writers are not blocked and
+the copy is a consistent snapshot (without it, every commit made by another connection restarts the backup).
+Pages are copied by batches of BACKUP_PAGES_PER_STEP with a pause of BACKUP_STEP_SLEEP between batches.
+
+Returns:
+- int: Number of pages copied.
+"""
+def snapshot_database(target_file, database=DB_NAME):
+    source = sqlite3.connect(database, isolation_level=None, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+    target = sqlite3.connect(target_file)
+    try:
+        source.execute("BEGIN")
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        page_count = source.execute("PRAGMA page_count").fetchone()[0]
+        source.backup(target, pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_SLEEP)
+        source.execute("COMMIT")
+        return page_count
+    finally:
+        target.close()
+        source.close()
+
+"""
+compress_file(source_file, target_file):
+Gzips source_file into target_file. The file is written under a temporary name and renamed once complete.
+"""
+def compress_file(source_file, target_file):
+    temporary_file = target_file + '.tmp'
+    with open(source_file, 'rb') as source, gzip.open(temporary_file, 'wb', compresslevel=6) as target:
+        shutil.copyfileobj(source, target, 1024 * 1024)
+    os.replace(temporary_file, target_file)
+
+"""
+restore_database_backup(backup_file, target_file):
+Restores a backup (gzipped or not) into target_file and checks it with PRAGMA integrity_check.
+
+Returns:
+- tuple: (integrity_check result, number of parcels) of the restored database.
+"""
+def restore_database_backup(backup_file, target_file):
+    if backup_file.endswith('.gz'):
+        with gzip.open(backup_file, 'rb') as source, open(target_file, 'wb') as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+    else:
+        shutil.copyfile(backup_file, target_file)
+
+    conn = sqlite3.connect(target_file)
+    try:
+        integrity = conn.execute("PRAGMA integrity_check").fetchone()[0]
+        parcel_count = conn.execute("SELECT COUNT(*) FROM parcels").fetchone()[0]
+        return integrity, parcel_count
+    finally:
+        conn.close()
+
+"""
+link_latest_backup(backup_dir, backup_file):
+Points kasland_backup_latest.db.gz at backup_file with a hard link (no second copy of the data).
+If the file system does not support hard links, kasland_backup_latest.txt contains the name of the latest backup instead.
+"""
+def link_latest_backup(backup_dir, backup_file):
+    latest_backup = os.path.join(backup_dir, 'kasland_backup_latest.db.gz')
+    latest_pointer = os.path.join(backup_dir, 'kasland_backup_latest.txt')
+    temporary_link = latest_backup + '.tmp'
+    try:
+        if os.path.exists(temporary_link):
+            os.remove(temporary_link)
+        os.link(backup_file, temporary_link)
+        os.replace(temporary_link, latest_backup)
+        if os.path.exists(latest_pointer):
+            os.remove(latest_pointer)
+    except OSError as e:
+        log_message(f"Hard link to the latest backup not possible ({e}), writing a pointer file")
+        with open(latest_pointer, 'w') as pointer:
+            pointer.write(os.path.basename(backup_file) + '\n')
+        if os.path.exists(latest_backup):
+            os.remove(latest_backup)
+
+    # Full copy written by the previous backup format
+    legacy_latest = os.path.join(backup_dir, 'kasland_backup_latest.db')
+    if os.path.exists(legacy_latest):
+        os.remove(legacy_latest)
+
+"""
+backup_archive_database(backup_dir):
+Refreshes the backup of the archive database (kasland_archive_backup.db.gz) when archive_history() has moved
+rows since it was written. A single copy is kept: archived rows never change, they are only added.
+
+Returns:
+- bool: True if the archive backup was refreshed.
+"""
+def backup_archive_database(backup_dir):
+    archive_backup = os.path.join(backup_dir, 'kasland_archive_backup.db.gz')
+    conn = get_db_connection()
+    try:
+        updated_at = conn.execute("SELECT value FROM game_parameters WHERE key = 'archive_updated_at'").fetchone()
+    finally:
+        conn.close()
+    if updated_at is None or (os.path.exists(archive_backup) and os.path.getmtime(archive_backup) >= float(updated_at['value'])):
+        return False
+
+    snapshot_file = os.path.join(backup_dir, 'kasland_archive_backup.db.snapshot')
+    try:
+        step_start = time.perf_counter()
+        snapshot_database(snapshot_file, ARCHIVE_DB_NAME)
+        compress_file(snapshot_file, archive_backup)
+    finally:
+        if os.path.exists(snapshot_file):
+            os.remove(snapshot_file)
+    log_message(f"Archive database backup completed: {archive_backup} ({time.perf_counter() - step_start:.2f} s)")
+    return True
+
 """
 Performs a database backup.
 - Creates a backup folder if it doesn't exist.
-- Generates a dated backup file and a 'latest' copy.
-- Deletes backups older than 14 days.
+- Takes an online snapshot of the database (see snapshot_database), without blocking the writers.
+- Compresses it into a dated backup file and points the 'latest' backup at it (see link_latest_backup).
+- Restores the backup into a scratch file and checks its integrity (BACKUP_VERIFY).
+- Deletes backups older than BACKUP_RETENTION_DAYS days.
+- Refreshes the backup of the archive database if it has changed (see backup_archive_database).
 - Handles exceptions related to files, permissions, and other errors.
-- Records actions and errors in the logs.
+- Records actions, timings and errors in the logs.
+
+Returns:
+- dict: Timings (seconds) and sizes of the backup, None on error.
 """
 def backup_database():
+    snapshot_file = None
+    restore_file = None
     try:
         # Create a folder for backups if it doesn't exist
         backup_dir = os.path.join(BASE_DIR, 'backups')
         os.makedirs(backup_dir, exist_ok=True)
 
+        if not os.path.exists(DB_NAME):
+            raise FileNotFoundError(DB_NAME)
+
         # Backup file name with the current date
         current_date = datetime.now().strftime("%Y%m%d")
-        backup_file = os.path.join(backup_dir, f'kasland_backup_{current_date}.db')
-
-        # Copy the current database
-        shutil.copy2(DB_NAME, backup_file)
-
-        # Keep a copy with a fixed name for easy access to the latest backup
-        latest_backup = os.path.join(backup_dir, 'kasland_backup_latest.db')
-        shutil.copy2(backup_file, latest_backup)
-
-        log_message(f"Database backup completed: {backup_file}")
+        backup_file = os.path.join(backup_dir, f'kasland_backup_{current_date}.db.gz')
+        snapshot_file = os.path.join(backup_dir, f'kasland_backup_{current_date}.db.snapshot')
+        if os.path.exists(snapshot_file):
+            os.remove(snapshot_file)
+
+        report = {}
+        step_start = time.perf_counter()
+        report['pages'] = snapshot_database(snapshot_file)
+        report['snapshot_seconds'] = time.perf_counter() - step_start
+
+        step_start = time.perf_counter()
+        compress_file(snapshot_file, backup_file)
+        report['compress_seconds'] = time.perf_counter() - step_start
+        report['database_bytes'] = os.path.getsize(snapshot_file)
+        report['backup_bytes'] = os.path.getsize(backup_file)
+        os.remove(snapshot_file)
+        snapshot_file = None
+
+        link_latest_backup(backup_dir, backup_file)
+
+        log_message(f"Database backup completed: {backup_file} ({report['pages']} pages, "
+                    f"{report['database_bytes'] / 1024 / 1024:.1f} MiB compressed to {report['backup_bytes'] / 1024 / 1024:.1f} MiB, "
+                    f"snapshot {report['snapshot_seconds']:.2f} s, compression {report['compress_seconds']:.2f} s)")
+
+        if BACKUP_VERIFY:
+            restore_file = os.path.join(backup_dir, 'kasland_restore_check.db')
+            step_start = time.perf_counter()
+            integrity, parcel_count = restore_database_backup(backup_file, restore_file)
+            report['restore_seconds'] = time.perf_counter() - step_start
+            report['integrity'] = integrity
+            if integrity == 'ok':
+                log_message(f"Backup verified: restored in {report['restore_seconds']:.2f} s, integrity ok, {parcel_count} parcels")
+            else:
+                log_message(f"Error: Backup {backup_file} failed the integrity check after restore: {integrity}")
 
-        # Delete old backups (more than 14 days old)
+        # Delete old backups (more than BACKUP_RETENTION_DAYS days old)
         for old_file in os.listdir(backup_dir):
-            if old_file.startswith('kasland_backup_') and old_file.endswith('.db') and old_file != 'kasland_backup_latest.db':
+            if old_file.startswith('kasland_backup_latest') or old_file.endswith(('.tmp', '.snapshot')):
+                continue
+            if old_file.startswith('kasland_backup_') and old_file.endswith(('.db', '.db.gz')):
                 file_path = os.path.join(backup_dir, old_file)
-                match = re.match(r'kasland_backup_(\d{8})\.db', old_file)
+                match = re.match(r'kasland_backup_(\d{8})\.db(\.gz)?$', old_file)
                 if match:
                     try:
                         file_date = datetime.strptime(match.group(1), "%Y%m%d")
-                        if datetime.now() - file_date > timedelta(days=14):
+                        if datetime.now() - file_date > timedelta(days=BACKUP_RETENTION_DAYS):
                             os.remove(file_path)
                             log_message(f"Old backup deleted: {old_file}")
                     except ValueError as e:
@@ -218,12 +463,23 @@ def backup_database():
                 else:
                     log_message(f"Backup file ignored (invalid name format): {old_file}")
 
+        report['archive_backed_up'] = backup_archive_database(backup_dir)
+        return report
+
     except FileNotFoundError:
         log_message("Error: Source database file does not exist. No backup performed.")
     except PermissionError:
         log_message("Error: Insufficient permissions to perform the backup.")
     except Exception as e:
         log_message(f"Unexpected error during database backup: {e}")
+    finally:
+        for scratch_file in (snapshot_file, restore_file):
+            if scratch_file and os.path.exists(scratch_file):
+                try:
+                    os.remove(scratch_file)
+                except OSError as e:
+                    log_message(f"Error removing backup scratch file {scratch_file}: {e}")
+    return None
 
 """
 Handles the clean shutdown of the program.
@@ -240,10 +496,19 @@ def signal_handler(sig, frame):
     # Stop the scheduler
     if scheduler.running:
         scheduler.shutdown(wait=False)
+
+    # Drop the monitored wallet checks that have not started yet
+    monitor_executor.shutdown(wait=False, cancel_futures=True)
+
+    # Stop receiving pushed transactions
+    transaction_source.stop()
+
+    # Let the queued writes finish
+    db_writer.stop()
     
     # Properly terminate database connections
-    # (if you have a connection pool, for example)
-    #close_db_connections()
+    db_pool.close_all()
+    api_snapshots.close_all()
     time.sleep(1)  # Wait 1 second before exiting
     sys.exit(0)
 
@@ -251,19 +516,421 @@ signal.signal(signal.SIGINT, signal_handler)
 signal.signal(signal.SIGTERM, signal_handler)
 
 """
-Establishes and returns a connection to the SQLite database.
-Configures the connection to return Row type objects.
+PooledConnection:
+SQLite connection handed out by ConnectionPool.
+
+close() gives the connection back to its pool instead of closing it (after rolling back any
+uncommitted transaction, as a real close would). A connection bound to a Flask request
+ignores close(): it is given back at the end of the request (see release_request_connection).
+"""
+class PooledConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = None
+        self.request_bound = False
+
+    def close(self):
+        if self.request_bound:
+            return
+        if self.pool is not None:
+            self.pool.release(self)
+        else:
+            super().close()
+
+    def close_for_good(self):
+        super().close()
+
+"""
+History tables that only grow: (table, key column, age column, age column holds an ISO date).
+Rows older than ARCHIVE_HORIZON_DAYS are moved to the archive database by archive_history().
+"""
+HISTORY_TABLES = [
+    ('processed_transactions', 'transaction_id', 'processed_at', False),
+    ('fee_payments', 'id', 'payment_date', False),
+    ('events', 'id', 'end_time', False),
+    ('daily_stats', 'date', 'date', True),
+]
+
+"""
+attach_archive(conn):
+Attaches the archive database (ARCHIVE_DB_NAME) as 'archive' and creates the temporary views
+history_<table> (main and archive rows) used by the queries that need the whole history.
+The archive tables are created by ensure_archive_schema() at startup.
+"""
+def attach_archive(conn):
+    conn.execute("ATTACH DATABASE ? AS archive", (ARCHIVE_DB_NAME,))
+    create_history_views(conn)
+
+"""
+Creates the temporary views history_<table> over the main and archive rows on an archive-attached connection.
+"""
+def create_history_views(conn):
+    for table, _, _, _ in HISTORY_TABLES:
+        conn.execute(f"CREATE TEMP VIEW IF NOT EXISTS history_{table} AS SELECT * FROM main.{table} UNION ALL SELECT * FROM archive.{table}")
+
+"""
+ConnectionPool:
+Pool of SQLite connections shared by the scheduler threads and the Flask requests.
+
+- Connections are opened with check_same_thread disabled, but a connection is only used
+  by the thread that acquired it until it is released.
+- At most max_idle connections are kept open, the others are closed when released.
+- Every connection is configured once when opened: WAL journal (readers are no longer blocked
+  by the minute-level writers), synchronous=NORMAL, page cache, memory-mapped I/O, busy timeout
+  and prepared statement cache. The archive database is attached to it (see attach_archive).
+"""
+class ConnectionPool:
+    def __init__(self, database, max_idle=DB_POOL_SIZE):
+        self.database = database
+        self.max_idle = max_idle
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def connect(self):
+        conn = sqlite3.connect(self.database, factory=PooledConnection, check_same_thread=False,
+                               timeout=DB_BUSY_TIMEOUT_MS / 1000, cached_statements=DB_STATEMENT_CACHE_SIZE)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{int(DB_CACHE_SIZE_KB)}")
+        conn.execute(f"PRAGMA mmap_size={int(DB_MMAP_SIZE)}")
+        conn.execute(f"PRAGMA busy_timeout={int(DB_BUSY_TIMEOUT_MS)}")
+        attach_archive(conn)
+        conn.execute("PRAGMA archive.journal_mode=WAL")
+        conn.pool = self
+        return conn
+
+    def acquire(self):
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+        return self.connect()
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error as e:
+            log_message(f"Error while releasing a database connection: {e}")
+            conn.close_for_good()
+            return
+        with self.lock:
+            if len(self.idle) < self.max_idle:
+                self.idle.append(conn)
+                return
+        conn.close_for_good()
+
+    """
+    Closes the idle connections (the connections in use are closed when released).
+    """
+    def close_all(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+            self.max_idle = 0
+        for conn in idle:
+            conn.close_for_good()
+
+db_pool = ConnectionPool(DB_NAME)
+
+"""
+SnapshotPool:
+Pool of read-only connections serving the API endpoints from a consistent snapshot (API_READ_SNAPSHOT).
+
+Each connection holds a WAL read transaction: all the queries of a request see the same committed state,
+whatever the writer commits in the meantime. The snapshot is refreshed after each committed write
+(see DatabaseWriter.add_listener): invalidate() ends the read transactions of the idle connections, so
+that they do not hold back checkpoints, and acquire() starts a new one on the next request.
+"""
+class SnapshotPool(ConnectionPool):
+    def __init__(self, database, max_idle=DB_POOL_SIZE):
+        super().__init__(database, max_idle)
+        self.generation = 0
+
+    def connect(self):
+        conn = super().connect()
+        conn.execute("PRAGMA query_only=ON")
+        conn.snapshot_generation = None
+        return conn
+
+    def acquire(self):
+        conn = super().acquire()
+        with self.lock:
+            generation = self.generation
+        if conn.snapshot_generation != generation:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.execute("BEGIN")
+            # The transaction is deferred: the first read takes the snapshot
+            conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+            conn.snapshot_generation = generation
+        return conn
+
+    def release(self, conn):
+        with self.lock:
+            if len(self.idle) < self.max_idle:
+                if conn.snapshot_generation != self.generation and conn.in_transaction:
+                    conn.rollback()
+                    conn.snapshot_generation = None
+                self.idle.append(conn)
+                return
+        conn.close_for_good()
+
+    """
+    Called after each committed write: the next requests read the new state.
+    """
+    def invalidate(self):
+        with self.lock:
+            self.generation += 1
+            for conn in self.idle:
+                try:
+                    if conn.in_transaction:
+                        conn.rollback()
+                    conn.snapshot_generation = None
+                except sqlite3.Error as e:
+                    log_message(f"Error while refreshing an API read snapshot: {e}")
+
+api_snapshots = SnapshotPool(DB_NAME)
+
+"""
+Returns a connection to the SQLite database, configured to return Row type objects.
 Used in all functions requiring database access.
+
+- With DB_POOL_ENABLED, the connection comes from the pool (see ConnectionPool) and close() gives it back.
+  During a Flask request, the same connection is returned for the whole request and given back
+  at its end by release_request_connection(). With API_READ_SNAPSHOT, it is a read-only connection
+  holding a snapshot of the last committed writes (see SnapshotPool).
+- Otherwise, a new connection is opened (and closed by close()).
 """
 def get_db_connection():
     try:
-        conn = sqlite3.connect(DB_NAME)
-        conn.row_factory = sqlite3.Row
-        return conn
+        if not DB_POOL_ENABLED:
+            conn = sqlite3.connect(DB_NAME)
+            conn.row_factory = sqlite3.Row
+            attach_archive(conn)
+            return conn
+        if has_request_context():
+            if 'db_conn' not in g:
+                g.db_conn = api_snapshots.acquire() if API_READ_SNAPSHOT else db_pool.acquire()
+                g.db_conn.request_bound = True
+            return g.db_conn
+        return db_pool.acquire()
     except sqlite3.Error as e:
         log_message(f"Error connecting to the database: {e}")
         return None
 
+"""
+Gives the connection of the request back to the pool at the end of each Flask request.
+"""
+@app.teardown_request
+def release_request_connection(exception=None):
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        conn.request_bound = False
+        conn.close()
+
+"""
+DatabaseWriter:
+Single thread through which every game-state mutation goes (see the functions decorated with @db_writer.task).
+
+- Callers submit a function and wait for its result: writes are serialized in-process, so they never compete
+  for the SQLite write lock, and readers (Flask requests, Kaspa API checks) only see committed WAL snapshots.
+- The queue is bounded (DB_WRITER_QUEUE_SIZE): when it is full, callers wait up to DB_WRITER_SUBMIT_TIMEOUT
+  seconds for room, then get queue.Full.
+- A task called from the writer thread itself (a task calling another task) runs inline.
+- Consecutive queued calls of a batch task (@db_writer.batch_task, one list argument, one result per item)
+  are merged into a single call of up to DB_WRITER_MAX_BATCH items: deposits that arrive while the writer
+  is busy are applied in one SQLite transaction.
+- Listeners are called after each job, once its writes are committed (API snapshot refresh).
+- Metrics: queue depth at submission, time spent waiting in the queue and running (see get_stats).
+"""
+class DatabaseWriter:
+    def __init__(self, max_queue=DB_WRITER_QUEUE_SIZE):
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.pending = []  # Jobs taken from the queue but not merged into the current batch
+        self.listeners = []
+        self.thread = None
+        self.stats_lock = threading.Lock()
+        self.stats = self._empty_stats()
+
+    def _empty_stats(self):
+        return {"jobs": 0, "merged": 0, "errors": 0, "max_depth": 0, "total_wait": 0.0, "max_wait": 0.0, "total_run": 0.0}
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._run_loop, name='db-writer', daemon=True)
+            self.thread.start()
+
+    """
+    Stops the writer once the queued jobs have run, waiting at most timeout seconds to queue the stop
+    and as much for the thread. Jobs submitted after the stop are failed, so that no caller waits forever.
+    """
+    def stop(self, timeout=10):
+        if self.thread is not None and self.thread.is_alive():
+            try:
+                self.queue.put(None, timeout=timeout)
+            except queue.Full:
+                log_message(f"Database writer queue still full after {timeout} s, the writer is not stopped.")
+                return
+            self.thread.join(timeout)
+        if self.thread is not None and not self.thread.is_alive():
+            self._fail_queued_jobs()
+
+    """
+    Fails the futures of the jobs left in the queue once the writer loop has exited.
+    """
+    def _fail_queued_jobs(self):
+        jobs = self.pending
+        self.pending = []
+        while True:
+            try:
+                jobs.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        for job in jobs:
+            if job is not None and job[3].set_running_or_notify_cancel():
+                job[3].set_exception(RuntimeError("The database writer is stopped"))
+
+    """
+    Registers a callable invoked on the writer thread after each job (its writes are committed).
+    """
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def on_writer_thread(self):
+        return threading.current_thread() is self.thread
+
+    def submit(self, func, args=(), kwargs=None, batch=False):
+        future = Future()
+        if self.on_writer_thread() or self.thread is None or not self.thread.is_alive():
+            # Reentrant call, or writer not running (startup, shutdown): run in the caller's thread
+            self._execute(future, func, args, kwargs or {})
+            return future
+        depth = self.queue.qsize()
+        with self.stats_lock:
+            self.stats["max_depth"] = max(self.stats["max_depth"], depth + 1)
+        self.queue.put((func, args, kwargs or {}, future, time.monotonic(), batch), timeout=DB_WRITER_SUBMIT_TIMEOUT)
+        return future
+
+    def run(self, func, *args, **kwargs):
+        return self.submit(func, args, kwargs).result()
+
+    """
+    Decorator: calls of the function run on the writer thread.
+    """
+    def task(self, func):
+        @functools.wraps(func)
+        def run_on_writer(*args, **kwargs):
+            return self.run(func, *args, **kwargs)
+        run_on_writer.direct = func
+        return run_on_writer
+
+    """
+    Decorator for functions taking a list and returning one result per item: queued calls are merged.
+    """
+    def batch_task(self, func):
+        @functools.wraps(func)
+        def run_on_writer(items):
+            return self.submit(func, (list(items),), batch=True).result()
+        run_on_writer.direct = func
+        return run_on_writer
+
+    def _execute(self, future, func, args, kwargs):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(func(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+
+    def _next_job(self):
+        if self.pending:
+            return self.pending.pop(0)
+        return self.queue.get()
+
+    def _run_loop(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                self._fail_queued_jobs()
+                return
+            func, args, kwargs, future, _, batch = job
+            jobs = [job]
+            if batch:
+                # Merge the batch calls of the same function waiting behind this one
+                items = len(args[0])
+                while items < DB_WRITER_MAX_BATCH:
+                    try:
+                        next_job = self.pending.pop(0) if self.pending else self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if next_job is None or not next_job[5] or next_job[0] is not func \
+                            or items + len(next_job[1][0]) > DB_WRITER_MAX_BATCH:
+                        self.pending.insert(0, next_job)
+                        break
+                    jobs.append(next_job)
+                    items += len(next_job[1][0])
+
+            started_at = time.monotonic()
+            if len(jobs) == 1:
+                self._execute(future, func, args, kwargs)
+            else:
+                merged_future = Future()
+                self._execute(merged_future, func, ([item for job in jobs for item in job[1][0]],), {})
+                offset = 0
+                for _, job_args, _, job_future, _, _ in jobs:
+                    count = len(job_args[0])
+                    if not job_future.set_running_or_notify_cancel():
+                        offset += count
+                        continue
+                    if merged_future.exception() is not None:
+                        job_future.set_exception(merged_future.exception())
+                    else:
+                        job_future.set_result(merged_future.result()[offset:offset + count])
+                    offset += count
+            finished_at = time.monotonic()
+            for listener in self.listeners:
+                try:
+                    listener()
+                except Exception as e:
+                    log_message(f"Error in a database writer listener: {e}")
+
+            with self.stats_lock:
+                for _, _, _, job_future, job_enqueued_at, _ in jobs:
+                    wait = started_at - job_enqueued_at
+                    self.stats["jobs"] += 1
+                    self.stats["total_wait"] += wait
+                    self.stats["max_wait"] = max(self.stats["max_wait"], wait)
+                    if job_future.exception() is not None:
+                        self.stats["errors"] += 1
+                self.stats["merged"] += len(jobs) - 1
+                self.stats["total_run"] += finished_at - started_at
+
+    """
+    Returns the writer metrics since the last reset: jobs run, jobs merged into a batch, errors,
+    current and maximum queue depth, average and maximum wait in the queue, time spent running (seconds).
+    """
+    def get_stats(self, reset=False):
+        with self.stats_lock:
+            stats = dict(self.stats)
+            if reset:
+                self.stats = self._empty_stats()
+        stats["depth"] = self.queue.qsize()
+        stats["avg_wait"] = stats["total_wait"] / stats["jobs"] if stats["jobs"] else 0.0
+        return stats
+
+db_writer = DatabaseWriter()
+db_writer.add_listener(api_snapshots.invalidate)
+db_writer.start()
+
+"""
+Logs the database writer metrics (queue depth, wait and run times) and resets them.
+"""
+def log_db_writer_stats():
+    stats = db_writer.get_stats(reset=True)
+    log_message(f"Database writer: {stats['jobs']} jobs ({stats['merged']} merged into batches, {stats['errors']} errors), "
+                f"queue depth {stats['depth']} (max {stats['max_depth']}), wait avg {stats['avg_wait'] * 1000:.1f} ms "
+                f"max {stats['max_wait'] * 1000:.1f} ms, busy {stats['total_run']:.2f} s")
+
 """
 Determines the building type and variant based on the sent amount.
 
@@ -284,6 +951,7 @@ Parameters:
 - current_variant (str, optional): The current building variant, if applicable.
 - building_types (list, optional): List of available building types. 
   If not provided, it will be retrieved from the database.
+- conn (sqlite3.Connection, optional): Connection to use. If not provided, a new one is opened and closed.
 
 Returns:
 - tuple: (building_type, variant) or (None, None) if no appropriate type is found.
@@ -294,10 +962,11 @@ Note:
 - Uses a database connection to retrieve necessary information.
 - Logs detailed messages for tracking the determination process.
 """
-def determine_building_type(amount, current_variant=None, building_types=None):
-    conn = None
+def determine_building_type(amount, current_variant=None, building_types=None, conn=None):
+    own_connection = conn is None
     try:
-        conn = get_db_connection()
+        if own_connection:
+            conn = get_db_connection()
         cursor = conn.cursor()
         
         try:
@@ -346,12 +1015,7 @@ def determine_building_type(amount, current_variant=None, building_types=None):
                 if amount >= min_amount - SLIPPAGE_TOLERANCE:
                     # Check if the maximum number of this building type has been reached
                     if max_count is not None:
-                        cursor.execute('''
-                            SELECT COUNT(*) 
-                            FROM parcels 
-                            WHERE building_type = ?
-                        ''', (name,))
-                        count = cursor.fetchone()[0]
+                        count = get_building_count(cursor, name)
                         if count >= max_count:
                             log_message(f"Maximum number reached for {name}")
                             continue  # Move to the next building type if max is reached
@@ -398,7 +1062,7 @@ def determine_building_type(amount, current_variant=None, building_types=None):
         return None, None
 
     finally:
-        if conn:
+        if own_connection and conn:
             conn.close()
 
     return None, None
@@ -417,138 +1081,840 @@ def update_fee_dates_for_building_type(conn, cursor, building_type, new_fee_freq
     """, (new_fee_frequency, current_time, new_fee_frequency, building_type))
     log_message(f"Updated fee dates for building type {building_type}")
 
-'''
-init_db():
-Initializes and updates the game's database.
+"""
+tx_id_to_blob(tx_id):
+Converts a transaction ID (64 hexadecimal digits, as returned by the Kaspa API) to the 32-byte BLOB
+stored in processed_transactions. IDs that are not hexadecimal (never returned by the API) are stored as
+their UTF-8 bytes.
+"""
+def tx_id_to_blob(tx_id):
+    try:
+        return bytes.fromhex(tx_id)
+    except ValueError:
+        return tx_id.encode()
 
-Process:
-1. Creates necessary tables if they don't exist.
-2. Updates existing building types and adds new types.
-3. Updates building variants.
-4. Updates characteristics of existing plots for each building type.
-5. Checks and updates all building types for existing plots in a single pass:
-   - Handles both changes to existing types and newly added types.
-   - Updates all relevant characteristics (fee_amount, fee_frequency, energy_consumption, etc.).
-6. Adds new plots if necessary to reach the desired total number.
-7. Recalculates the map size.
-8. Updates game statistics and parameters.
-9. Handles updating variants for existing plots, ensuring they are valid.
-10. Saves modifications and logs important information at each step.
+"""
+tx_id_from_blob(blob):
+Converts a transaction ID stored in processed_transactions back to its hexadecimal form (see tx_id_to_blob).
+"""
+def tx_id_from_blob(blob):
+    if len(blob) == 32:
+        return blob.hex()
+    return blob.decode(errors='replace')
 
-This function ensures the database is up to date with the latest building configurations,
-including newly added types and modifications to existing characteristics,
-while preserving data integrity and optimizing the update process.
+"""
+Schema migrations.
 
-'''
-def init_db():
-    global MAP_SIZE
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+init_db creates the tables as they were first released; every later schema change is a migration step.
+The version of the schema is stored in game_parameters ('schema_version') and the pending steps are
+applied in order at startup, each in its own transaction, by run_migrations().
+Steps must be idempotent (IF NOT EXISTS, columns checked before being added), since a database may
+already hold part of a change that predates the step.
+"""
 
-        log_message("Initializing database...")
+"""
+Migration 1: indexes of the hot-path queries (see HOT_QUERIES).
+"""
+def migrate_hot_path_indexes(cursor):
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_parcels_owner_address ON parcels(owner_address)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_parcels_building_type ON parcels(building_type)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_parcels_next_fee_date ON parcels(next_fee_date)")
+    # Few parcels are for sale at a time: a partial index stays small
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_parcels_for_sale ON parcels(is_for_sale) WHERE is_for_sale = 1")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_wallets_to_monitor_status ON wallets_to_monitor(status)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_wallets_to_monitor_address ON wallets_to_monitor(address)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_events_start_end ON events(start_time, end_time)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_events_end_time ON events(end_time)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_fee_payments_parcel_id ON fee_payments(parcel_id)")
 
-        # Block for table creation
-        try:   
-            # Create tables if they don't already exist
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS parcels (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    owner_address TEXT,
-                    building_type TEXT,
-                    building_variant TEXT,
-                    purchase_amount REAL,
-                    purchase_date REAL,
-                    last_fee_payment REAL,
-                    last_fee_check REAL,
-                    last_fee_amount REAL,
-                    fee_frequency INTEGER,
-                    next_fee_date REAL,
-                    x INTEGER,
-                    y INTEGER,
-                    energy_production INTEGER DEFAULT 0,
-                    energy_consumption INTEGER DEFAULT 0,
-                    zkaspa_production REAL DEFAULT 0,
-                    zkaspa_balance REAL DEFAULT 0,
-                    is_special BOOLEAN DEFAULT 0,
-                    is_for_sale BOOLEAN DEFAULT 0,
-                    sale_price REAL,
-                    type TEXT DEFAULT 'grass',
-                    rarity TEXT
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS processed_transactions (
-                    transaction_id TEXT PRIMARY KEY,
-                    processed_at REAL
-                )
-            ''')
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS wallets (
-                    address TEXT PRIMARY KEY,
-                    total_amount REAL,
-                    transaction_count INTEGER,
-                    last_transaction_id TEXT,
-                    last_transaction_timestamp REAL
-                )
-            ''')
-            
-            # Create a new table to store game parameters
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS game_parameters (
-                    key TEXT PRIMARY KEY,
-                    value TEXT
-                )
-            ''')
+"""
+Adds the missing columns of a table.
 
-            # Create the table for building types
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS building_types (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT UNIQUE,
-                    min_amount REAL,
-                    max_amount REAL,
-                    fee_amount REAL,
-                    fee_frequency INTEGER,
-                    building_category TEXT,
-                    energy_production INTEGER,
-                    energy_consumption INTEGER,
-                    zkaspa_production REAL,
-                    max_count INTEGER
-                )
-            ''')
+Parameters:
+- cursor (sqlite3.Cursor): Cursor of the migration
+- table (str): Table name
+- columns (list): (column name, column definition) pairs
+"""
+def add_missing_columns(cursor, table, columns):
+    cursor.execute(f"PRAGMA table_info({table})")
+    existing_columns = {row['name'] for row in cursor.fetchall()}
+    for column, definition in columns:
+        if column not in existing_columns:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
 
-            # Create the table for building variants
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS building_variants (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    building_type TEXT,
-                    variant TEXT,
-                    probability REAL,
-                    UNIQUE(building_type, variant)
-                )
-            ''')
+"""
+Migration 2: columns added after the tables were first released.
+- wallets_to_monitor: sighting cursor of the monitored wallets.
+- fee_payments: transaction_id, written by process_existing_parcel but missing from the original table.
+"""
+def migrate_added_columns(cursor):
+    add_missing_columns(cursor, 'wallets_to_monitor', [('last_seen_tx_id', 'TEXT'), ('last_seen_block_time', 'INTEGER')])
+    add_missing_columns(cursor, 'fee_payments', [('transaction_id', 'TEXT')])
 
-            # Create the table for fee payments
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS fee_payments (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    parcel_id INTEGER,
-                    payment_date REAL,
-                    amount REAL,
-                    building_type TEXT,
-                    FOREIGN KEY (parcel_id) REFERENCES parcels(id)
-                )
-            ''')
+"""
+rebuild_parcel_counters(cursor):
+Recomputes the materialized parcel counters (building_counts and parcel_occupancy) from the parcels table.
+"""
+def rebuild_parcel_counters(cursor):
+    cursor.execute("DELETE FROM building_counts")
+    cursor.execute('''
+        INSERT INTO building_counts (building_type, count)
+        SELECT building_type, COUNT(*) FROM parcels WHERE building_type IS NOT NULL GROUP BY building_type
+    ''')
+    cursor.execute('''
+        INSERT OR REPLACE INTO parcel_occupancy (id, total, occupied)
+        SELECT 1, COUNT(*), COUNT(owner_address) FROM parcels
+    ''')
 
-            # Create the table for random events
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS events (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    event_type TEXT,
-                    start_time REAL,
-                    end_time REAL,
+"""
+Migration 3: materialized parcel counters, kept exact by triggers on every parcel mutation.
+- building_counts: number of parcels per building type (enforcement of max_count).
+- parcel_occupancy: single row with the total number of parcels and the number of owned ones (full map check).
+"""
+def migrate_parcel_counters(cursor):
+    cursor.execute("CREATE TABLE IF NOT EXISTS building_counts (building_type TEXT PRIMARY KEY, count INTEGER NOT NULL DEFAULT 0)")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS parcel_occupancy (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            total INTEGER NOT NULL DEFAULT 0,
+            occupied INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS parcels_counters_insert AFTER INSERT ON parcels
+        BEGIN
+            INSERT INTO building_counts (building_type, count) SELECT NEW.building_type, 1 WHERE NEW.building_type IS NOT NULL
+            ON CONFLICT(building_type) DO UPDATE SET count = count + 1;
+            UPDATE parcel_occupancy SET total = total + 1, occupied = occupied + (NEW.owner_address IS NOT NULL) WHERE id = 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS parcels_counters_delete AFTER DELETE ON parcels
+        BEGIN
+            UPDATE building_counts SET count = count - 1 WHERE building_type = OLD.building_type;
+            UPDATE parcel_occupancy SET total = total - 1, occupied = occupied - (OLD.owner_address IS NOT NULL) WHERE id = 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS parcels_counters_building_type AFTER UPDATE OF building_type ON parcels
+        WHEN OLD.building_type IS NOT NEW.building_type
+        BEGIN
+            UPDATE building_counts SET count = count - 1 WHERE building_type = OLD.building_type;
+            INSERT INTO building_counts (building_type, count) SELECT NEW.building_type, 1 WHERE NEW.building_type IS NOT NULL
+            ON CONFLICT(building_type) DO UPDATE SET count = count + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS parcels_counters_owner AFTER UPDATE OF owner_address ON parcels
+        WHEN (OLD.owner_address IS NULL) != (NEW.owner_address IS NULL)
+        BEGIN
+            UPDATE parcel_occupancy SET occupied = occupied + (NEW.owner_address IS NOT NULL) - (OLD.owner_address IS NOT NULL) WHERE id = 1;
+        END
+    ''')
+    rebuild_parcel_counters(cursor)
+
+# A parcel is free (available to new players) when it has no owner and no purchase amount
+FREE_PARCEL_CONDITION = "{row}.owner_address IS NULL AND COALESCE({row}.purchase_amount, 0) = 0"
+
+"""
+rebuild_free_parcels(cursor):
+Recomputes the free-parcel pool (free_parcels) from the parcels table, with dense slots 1..n.
+"""
+def rebuild_free_parcels(cursor):
+    cursor.execute("DELETE FROM free_parcels")
+    cursor.execute(f'''
+        INSERT INTO free_parcels (slot, parcel_id)
+        SELECT ROW_NUMBER() OVER (ORDER BY id), id FROM parcels p WHERE {FREE_PARCEL_CONDITION.format(row='p')}
+    ''')
+
+"""
+Migration 4: pool of free parcels with dense slot numbers (1..n), kept by triggers on every parcel mutation,
+so that get_unassigned_parcel() picks a random free parcel with two index lookups.
+- A parcel that becomes free is appended at slot n + 1.
+- A parcel that is no longer free is removed and the parcel of the last slot moves into its slot.
+"""
+def migrate_free_parcels(cursor):
+    cursor.execute("CREATE TABLE IF NOT EXISTS free_parcels (slot INTEGER PRIMARY KEY, parcel_id INTEGER NOT NULL UNIQUE)")
+    append = '''
+            INSERT INTO free_parcels (slot, parcel_id) VALUES ((SELECT COALESCE(MAX(slot), 0) + 1 FROM free_parcels), NEW.id);
+    '''
+    # The removed slot is negated first, so that the last slot can move into it without a conflict
+    remove = '''
+            UPDATE free_parcels SET slot = -slot WHERE parcel_id = OLD.id;
+            UPDATE free_parcels SET slot = (SELECT -slot FROM free_parcels WHERE parcel_id = OLD.id)
+            WHERE slot = (SELECT MAX(slot) FROM free_parcels)
+              AND slot > (SELECT -slot FROM free_parcels WHERE parcel_id = OLD.id);
+            DELETE FROM free_parcels WHERE parcel_id = OLD.id;
+    '''
+    free_old = FREE_PARCEL_CONDITION.format(row='OLD')
+    free_new = FREE_PARCEL_CONDITION.format(row='NEW')
+    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS parcels_free_insert AFTER INSERT ON parcels WHEN {free_new} BEGIN {append} END")
+    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS parcels_free_delete AFTER DELETE ON parcels WHEN {free_old} BEGIN {remove} END")
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS parcels_free_taken AFTER UPDATE OF owner_address, purchase_amount ON parcels
+        WHEN ({free_old}) AND NOT ({free_new}) BEGIN {remove} END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS parcels_free_released AFTER UPDATE OF owner_address, purchase_amount ON parcels
+        WHEN NOT ({free_old}) AND ({free_new}) BEGIN {append} END
+    ''')
+    rebuild_free_parcels(cursor)
+
+"""
+Migration 5: indexes on the age columns of the history tables, used by archive_history() to select the rows to move.
+"""
+def migrate_history_age_indexes(cursor):
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_processed_transactions_processed_at ON processed_transactions(processed_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_fee_payments_payment_date ON fee_payments(payment_date)")
+
+"""
+Migration 6: processed_transactions keyed on the 32-byte binary transaction ID, without rowid.
+The hexadecimal TEXT key was stored twice (table and primary key index) at 64 bytes each; the BLOB key is
+stored once, in the table b-tree. The conversion happens at the boundary (tx_id_to_blob, tx_id_from_blob).
+The archive table is converted as well, so that history_processed_transactions keeps one key type.
+"""
+def migrate_processed_transactions_blob(cursor):
+    insert_cursor = cursor.connection.cursor()
+    # The rename checks every view of the connection, and the archive tables may not exist yet
+    for table, _, _, _ in HISTORY_TABLES:
+        cursor.execute(f"DROP VIEW IF EXISTS temp.history_{table}")
+    for schema in ('main', 'archive'):
+        cursor.execute(f"SELECT sql FROM {schema}.sqlite_master WHERE type = 'table' AND name = 'processed_transactions'")
+        definition = cursor.fetchone()
+        if definition is None or 'WITHOUT ROWID' in definition['sql'].upper():
+            continue
+        cursor.execute(f'''
+            CREATE TABLE {schema}.processed_transactions_blob (
+                transaction_id BLOB PRIMARY KEY,
+                processed_at REAL
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute(f"SELECT transaction_id, processed_at FROM {schema}.processed_transactions")
+        while True:
+            rows = cursor.fetchmany(10000)
+            if not rows:
+                break
+            insert_cursor.executemany(f"INSERT OR IGNORE INTO {schema}.processed_transactions_blob (transaction_id, processed_at) VALUES (?, ?)",
+                                      [(tx_id_to_blob(row['transaction_id']), row['processed_at']) for row in rows])
+        cursor.execute(f"DROP TABLE {schema}.processed_transactions")
+        cursor.execute(f"ALTER TABLE {schema}.processed_transactions_blob RENAME TO processed_transactions")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_processed_transactions_processed_at ON processed_transactions(processed_at)")
+    create_history_views(cursor.connection)
+
+"""
+Rarity tiers of the building variants: (rarity, highest variant probability of the tier), rarest first.
+The last tier takes every higher probability. Shared by determine_rarity_and_multiplier and the SQL of
+the production aggregates (rarity_case_sql).
+"""
+RARITY_TIERS = [
+    ('Mythic', 0.001),      # ≤0.1%
+    ('Legendary', 0.015),   # 0.1-1.5%
+    ('Epic', 0.05),         # 1-5%
+    ('Rare', 0.1),          # 5-10%
+    ('Uncommon', 0.2),      # 10-20%
+    ('Common', 0.4),        # 20-40%
+    ('Basic', None),        # >40%
+]
+
+"""
+Determines the rarity and corresponding multiplier of a building variant based on its probability.
+
+Parameters:
+- probability (float): Variant probability. A variant without probability is 'Basic', as in rarity_case_sql
+
+Returns:
+- tuple: A tuple containing two elements:
+    - str: Rarity level ('Mythic', 'Legendary', 'Epic', 'Rare', 'Uncommon', 'Common', or 'Basic')
+    - float: Corresponding rarity multiplier from the RARITY_MULTIPLIERS dictionary
+"""
+def determine_rarity_and_multiplier(probability):
+    for rarity, limit in RARITY_TIERS:
+        if limit is None or (probability is not None and probability <= limit):
+            return rarity, RARITY_MULTIPLIERS[rarity]
+
+"""
+Returns the SQL CASE expression giving the rarity tier of a variant probability (see RARITY_TIERS).
+"""
+def rarity_case_sql(probability):
+    conditions = " ".join(f"WHEN {probability} <= {limit!r} THEN '{rarity}'" for rarity, limit in RARITY_TIERS if limit is not None)
+    return f"CASE {conditions} ELSE '{RARITY_TIERS[-1][0]}' END"
+
+"""
+Returns the SELECT giving the contribution of a parcel row (NEW or OLD in a trigger) to production_totals,
+with sign 1 (added) or -1 (removed). Parcels without a known variant do not contribute, as in calculate_production.
+"""
+def production_contribution_sql(row, sign):
+    return f'''
+        SELECT {rarity_case_sql('bv.probability')}, substr({row}.building_type, 1, 12) = 'wind_turbine',
+               {sign}, {sign} * COALESCE({row}.energy_production, 0), {sign} * COALESCE({row}.energy_consumption, 0),
+               {sign} * COALESCE({row}.zkaspa_production, 0)
+        FROM building_variants bv
+        WHERE bv.building_type = {row}.building_type AND bv.variant = {row}.building_variant
+    '''
+
+PRODUCTION_TOTALS_UPSERT = '''
+    INSERT INTO production_totals (rarity, wind_turbine, parcels, energy_production, energy_consumption, zkaspa_production)
+    {contribution}
+    ON CONFLICT (rarity, wind_turbine) DO UPDATE SET
+        parcels = parcels + excluded.parcels,
+        energy_production = energy_production + excluded.energy_production,
+        energy_consumption = energy_consumption + excluded.energy_consumption,
+        zkaspa_production = zkaspa_production + excluded.zkaspa_production;
+'''
+
+"""
+rebuild_production_totals(cursor):
+Recomputes production_totals from the parcels table (startup after a building configuration change,
+since the variant probabilities, hence the rarity tiers, may have changed).
+"""
+def rebuild_production_totals(cursor):
+    cursor.execute("DELETE FROM production_totals")
+    cursor.execute(f'''
+        INSERT INTO production_totals (rarity, wind_turbine, parcels, energy_production, energy_consumption, zkaspa_production)
+        SELECT {rarity_case_sql('bv.probability')}, substr(p.building_type, 1, 12) = 'wind_turbine', COUNT(*),
+               SUM(COALESCE(p.energy_production, 0)), SUM(COALESCE(p.energy_consumption, 0)), SUM(COALESCE(p.zkaspa_production, 0))
+        FROM parcels p
+        JOIN building_variants bv ON bv.building_type = p.building_type AND bv.variant = p.building_variant
+        WHERE p.building_type IS NOT NULL
+        GROUP BY 1, 2
+    ''')
+
+"""
+Migration 7: base production totals per rarity tier (and wind turbine or not), kept by triggers on every
+parcel mutation. calculate_production applies the event, rarity and wind turbine multipliers to these few rows
+instead of reading every parcel.
+"""
+def migrate_production_totals(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS production_totals (
+            rarity TEXT NOT NULL,
+            wind_turbine INTEGER NOT NULL,
+            parcels INTEGER NOT NULL DEFAULT 0,
+            energy_production REAL NOT NULL DEFAULT 0,
+            energy_consumption REAL NOT NULL DEFAULT 0,
+            zkaspa_production REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (rarity, wind_turbine)
+        )
+    ''')
+    add = PRODUCTION_TOTALS_UPSERT.format(contribution=production_contribution_sql('NEW', 1))
+    remove = PRODUCTION_TOTALS_UPSERT.format(contribution=production_contribution_sql('OLD', -1))
+    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS parcels_production_insert AFTER INSERT ON parcels BEGIN {add} END")
+    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS parcels_production_delete AFTER DELETE ON parcels BEGIN {remove} END")
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS parcels_production_update
+        AFTER UPDATE OF building_type, building_variant, energy_production, energy_consumption, zkaspa_production ON parcels
+        BEGIN {remove} {add} END
+    ''')
+    rebuild_production_totals(cursor)
+
+"""
+refresh_variant_rarity(cursor):
+Stores the rarity tier and multiplier of every building variant (building_variants.rarity and rarity_multiplier),
+computed once from its probability instead of for every parcel read. A variant without probability is 'Basic'.
+
+Returns:
+- int: Number of variants whose rarity or multiplier changed
+"""
+def refresh_variant_rarity(cursor):
+    cursor.execute("SELECT id, probability, rarity, rarity_multiplier FROM building_variants")
+    updates = []
+    for variant in cursor.fetchall():
+        rarity, rarity_multiplier = determine_rarity_and_multiplier(variant['probability'])
+        if (rarity, rarity_multiplier) != (variant['rarity'], variant['rarity_multiplier']):
+            updates.append((rarity, rarity_multiplier, variant['id']))
+    cursor.executemany("UPDATE building_variants SET rarity = ?, rarity_multiplier = ? WHERE id = ?", updates)
+    return len(updates)
+
+# Rarity of the variant of a parcel row (NEW in a trigger, or parcels), NULL for a parcel without a known variant
+PARCEL_RARITY_SQL = "(SELECT bv.rarity FROM building_variants bv WHERE bv.building_type = {row}.building_type AND bv.variant = {row}.building_variant)"
+
+"""
+sync_parcel_rarity(cursor):
+Copies the rarity of the variants onto parcels.rarity (after the variants have changed).
+"""
+def sync_parcel_rarity(cursor):
+    rarity = PARCEL_RARITY_SQL.format(row='parcels')
+    cursor.execute(f"UPDATE parcels SET rarity = {rarity} WHERE rarity IS NOT {rarity}")
+
+"""
+Migration 8: rarity tier and multiplier stored per building variant and denormalized onto parcels.rarity,
+kept by triggers when the building or the variant of a parcel changes (the writes of rarity are overridden).
+"""
+def migrate_variant_rarity(cursor):
+    add_missing_columns(cursor, 'building_variants', [('rarity', 'TEXT'), ('rarity_multiplier', 'REAL')])
+    refresh_variant_rarity(cursor)
+    rarity = PARCEL_RARITY_SQL.format(row='NEW')
+    for trigger, event in (('parcels_rarity_insert', 'INSERT'), ('parcels_rarity_update', 'UPDATE OF building_type, building_variant, rarity')):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {trigger} AFTER {event} ON parcels
+            WHEN NEW.rarity IS NOT {rarity}
+            BEGIN
+                UPDATE parcels SET rarity = {rarity} WHERE id = NEW.id;
+            END
+        ''')
+    sync_parcel_rarity(cursor)
+
+# Ordered migration steps: (version, description, function taking a cursor)
+SCHEMA_MIGRATIONS = [
+    (1, "Indexes of the hot-path queries", migrate_hot_path_indexes),
+    (2, "Columns added after the first release", migrate_added_columns),
+    (3, "Materialized parcel counters", migrate_parcel_counters),
+    (4, "Free-parcel pool", migrate_free_parcels),
+    (5, "History age indexes", migrate_history_age_indexes),
+    (6, "Binary processed transaction IDs", migrate_processed_transactions_blob),
+    (7, "Production totals", migrate_production_totals),
+    (8, "Rarity per building variant", migrate_variant_rarity),
+]
+
+"""
+get_building_count(cursor, building_type):
+Returns the number of parcels of a building type (materialized by the parcel counter triggers).
+"""
+def get_building_count(cursor, building_type):
+    cursor.execute("SELECT count FROM building_counts WHERE building_type = ?", (building_type,))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+"""
+get_schema_version(cursor):
+Returns the schema version stored in game_parameters (0 if the database has never been migrated).
+"""
+def get_schema_version(cursor):
+    cursor.execute("SELECT value FROM game_parameters WHERE key = 'schema_version'")
+    row = cursor.fetchone()
+    return int(row['value']) if row else 0
+
+"""
+run_migrations(conn):
+Applies the pending migration steps in order, each in its own transaction together with the new schema version.
+A failing step is rolled back and the error is raised: later steps are not applied.
+
+Parameters:
+- conn (sqlite3.Connection): Connection with no transaction in progress
+
+Returns:
+- int: The schema version after migration
+"""
+def run_migrations(conn):
+    cursor = conn.cursor()
+    version = get_schema_version(cursor)
+    for step_version, description, migrate in SCHEMA_MIGRATIONS:
+        if step_version <= version:
+            continue
+        start_time = time.perf_counter()
+        try:
+            cursor.execute("BEGIN")
+            migrate(cursor)
+            cursor.execute("INSERT OR REPLACE INTO game_parameters (key, value) VALUES ('schema_version', ?)", (str(step_version),))
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            log_message(f"Error applying schema migration {step_version} ({description}): {e}")
+            raise
+        version = step_version
+        log_message(f"Schema migration {step_version} applied: {description} ({time.perf_counter() - start_time:.3f} s)")
+    return version
+
+# Hot-path queries checked by check_query_plans(): (name, query, sample parameters)
+HOT_QUERIES = [
+    ("parcel of a player", "SELECT * FROM parcels WHERE owner_address = ?", ('kaspa:x',)),
+    ("plot for sale of a player", "SELECT id, purchase_amount, building_type, building_variant FROM parcels WHERE owner_address = ? AND is_for_sale = 1", ('kaspa:x',)),
+    ("parcels of a building type", "SELECT id, owner_address FROM parcels WHERE building_type = ? AND owner_address IS NOT NULL", ('small_house',)),
+    ("building type count", "SELECT count FROM building_counts WHERE building_type = ?", ('small_house',)),
+    ("overdue fees", """
+        SELECT p.id, p.owner_address, p.building_type, p.last_fee_payment, p.next_fee_date, b.fee_amount, b.fee_frequency
+        FROM parcels p
+        JOIN building_types b ON p.building_type = b.name
+        WHERE p.next_fee_date < ?
+    """, (0,)),
+    ("plots for sale", "SELECT id, sale_price FROM parcels WHERE is_for_sale = 1", ()),
+    ("pending monitored wallets", "SELECT * FROM wallets_to_monitor WHERE status = 'pending'", ()),
+    ("monitored wallets of a seller", "DELETE FROM wallets_to_monitor WHERE address = ?", ('kaspa:x',)),
+    ("current event", "SELECT event_type, energy_multiplier, zkaspa_multiplier FROM events WHERE ? BETWEEN start_time AND end_time ORDER BY start_time DESC LIMIT 1", (0,)),
+    ("event in progress", "SELECT * FROM events WHERE end_time > ?", (0,)),
+    ("fee payments of a parcel", "SELECT * FROM fee_payments WHERE parcel_id = ?", (1,)),
+    ("free parcel pick", "SELECT p.id, p.x, p.y FROM free_parcels f JOIN parcels p ON p.id = f.parcel_id WHERE f.slot >= ? ORDER BY f.slot LIMIT 1", (1,)),
+    ("processed transaction", "SELECT 1 FROM processed_transactions WHERE transaction_id = ?", (bytes(32),)),
+    ("processed transaction (history)", "SELECT 1 FROM history_processed_transactions WHERE transaction_id = ?", (bytes(32),)),
+    ("daily stats (history)", "SELECT * FROM history_daily_stats WHERE date = ?", ('2000-01-01',)),
+    ("transactions to archive", "SELECT transaction_id FROM processed_transactions WHERE processed_at < ? ORDER BY processed_at LIMIT 500", (0,)),
+    ("wallet", "SELECT * FROM wallets WHERE address = ?", ('kaspa:x',)),
+]
+
+"""
+check_query_plans(conn):
+Runs EXPLAIN QUERY PLAN on the hot-path queries and logs those that do a full table scan
+(a SCAN step that does not go through an index).
+
+Parameters:
+- conn (sqlite3.Connection): Connection to check
+
+Returns:
+- list: Names of the queries doing a full scan (empty if every hot query uses an index)
+"""
+def check_query_plans(conn):
+    full_scans = []
+    for name, query, params in HOT_QUERIES:
+        try:
+            plan = conn.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+        except sqlite3.Error as e:
+            log_message(f"Error checking the query plan of '{name}': {e}")
+            continue
+        scans = [row['detail'] for row in plan
+                 if row['detail'].startswith('SCAN ') and 'USING INDEX' not in row['detail'] and 'USING COVERING INDEX' not in row['detail']]
+        if scans:
+            full_scans.append(name)
+            log_message(f"Query plan check: '{name}' does a full scan ({'; '.join(scans)})")
+    if not full_scans:
+        log_message(f"Query plan check: the {len(HOT_QUERIES)} hot-path queries use an index.")
+    return full_scans
+
+"""
+ensure_archive_schema(conn):
+Creates the history tables in the archive database from their definition in the main database,
+and adds the columns the main tables gained since (the history_<table> views need the same columns).
+"""
+def ensure_archive_schema(conn):
+    cursor = conn.cursor()
+    for table, _, _, _ in HISTORY_TABLES:
+        cursor.execute("SELECT 1 FROM archive.sqlite_master WHERE type = 'table' AND name = ?", (table,))
+        if cursor.fetchone() is None:
+            cursor.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table,))
+            definition = cursor.fetchone()['sql']
+            cursor.execute(re.sub(r'^CREATE TABLE\s+(IF NOT EXISTS\s+)?', 'CREATE TABLE archive.', definition, count=1))
+            continue
+        cursor.execute(f"PRAGMA archive.table_info({table})")
+        archive_columns = {row['name'] for row in cursor.fetchall()}
+        cursor.execute(f"PRAGMA main.table_info({table})")
+        for row in cursor.fetchall():
+            if row['name'] not in archive_columns:
+                cursor.execute(f"ALTER TABLE archive.{table} ADD COLUMN {row['name']} {row['type']}")
+    cursor.execute("CREATE INDEX IF NOT EXISTS archive.idx_fee_payments_parcel_id ON fee_payments(parcel_id)")
+    conn.commit()
+
+"""
+archive_history():
+Moves the rows of the history tables (HISTORY_TABLES) older than ARCHIVE_HORIZON_DAYS to the archive database.
+
+- Rows are moved by batches of 500: copied to the archive and committed, then deleted from the main database.
+  An interruption between the two steps leaves rows in both databases (the next run removes them from the
+  main one), never in none.
+- The main database is vacuumed when more than ARCHIVE_VACUUM_FREE_RATIO of its pages are free, so that it
+  stays small enough for the page cache and the daily backup shrinks accordingly.
+- Queries that need the whole history use the history_<table> views (see attach_archive).
+
+Returns:
+- dict: Number of rows moved per table, None on error.
+"""
+@db_writer.task
+def archive_history():
+    log_message("archive_history function called.")
+    start_time = time.perf_counter()
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        cutoff_time = time.time() - ARCHIVE_HORIZON_DAYS * 24 * 60 * 60
+        cutoff_date = (datetime.now().date() - timedelta(days=ARCHIVE_HORIZON_DAYS)).isoformat()
+        moved = {}
+        for table, key_column, age_column, age_is_date in HISTORY_TABLES:
+            cursor.execute(f"PRAGMA main.table_info({table})")
+            columns = ", ".join(row['name'] for row in cursor.fetchall())
+            moved[table] = 0
+            while True:
+                cursor.execute(f"SELECT {key_column} FROM main.{table} WHERE {age_column} < ? ORDER BY {age_column} LIMIT 500",
+                               (cutoff_date if age_is_date else cutoff_time,))
+                keys = [row[0] for row in cursor.fetchall()]
+                if not keys:
+                    break
+                placeholders = ",".join("?" * len(keys))
+                cursor.execute(f"INSERT OR IGNORE INTO archive.{table} ({columns}) SELECT {columns} FROM main.{table} WHERE {key_column} IN ({placeholders})", keys)
+                conn.commit()
+                cursor.execute(f"DELETE FROM main.{table} WHERE {key_column} IN ({placeholders})", keys)
+                conn.commit()
+                moved[table] += len(keys)
+
+        if any(moved.values()):
+            cursor.execute("INSERT OR REPLACE INTO game_parameters (key, value) VALUES ('archive_updated_at', ?)", (str(time.time()),))
+            conn.commit()
+
+        cursor.execute("PRAGMA main.freelist_count")
+        free_pages = cursor.fetchone()[0]
+        cursor.execute("PRAGMA main.page_count")
+        page_count = cursor.fetchone()[0]
+        vacuumed = bool(page_count) and free_pages / page_count > ARCHIVE_VACUUM_FREE_RATIO
+        if vacuumed:
+            cursor.execute("VACUUM main")
+            cursor.execute("PRAGMA main.page_count")
+            page_count = cursor.fetchone()[0]
+
+        log_message("History archival: " + ", ".join(f"{table} {count}" for table, count in moved.items())
+                    + f" rows moved, main database {page_count} pages{' (vacuumed)' if vacuumed else ''}, "
+                    f"{time.perf_counter() - start_time:.2f} s")
+        return moved
+
+    except sqlite3.Error as e:
+        if conn:
+            conn.rollback()
+        log_message(f"SQLite error during history archival: {e}")
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        log_message(f"Unexpected error during history archival: {e}")
+    finally:
+        if conn:
+            conn.close()
+    return None
+
+"""
+building_types_fingerprint():
+Returns a content hash of the building configuration (BUILDING_TYPES, the slippage tolerance
+used to select a building type and the rarity multipliers stored with the variants).
+init_db only reconciles the parcels when it has changed.
+"""
+def building_types_fingerprint():
+    content = json.dumps({"building_types": BUILDING_TYPES, "slippage_tolerance": SLIPPAGE_TOLERANCE,
+                          "rarity_multipliers": RARITY_MULTIPLIERS}, sort_keys=True, default=str)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+"""
+reconcile_parcel_buildings(cursor):
+Reassigns the building type of every owned parcel from the configuration, in a few set-based statements.
+
+Same selection rule as determine_building_type: the type with the highest minimum amount that the
+purchase amount reaches (with the slippage tolerance) and whose max_count is not reached.
+- Types are filled from the most expensive one. The slots of a capped type go first to the parcels that
+  already hold it (a parcel no longer counts against its own type), then by parcel ID.
+- A parcel for which no type is suitable keeps its current type.
+- Reassigned parcels get the characteristics of their new type and keep their variant if it is still valid.
+- Then every owned parcel whose variant no longer exists in the configuration gets a new random variant
+  (weighted by the variant probabilities).
+
+Parameters:
+- cursor (sqlite3.Cursor): Cursor of the init_db transaction (building_types already synchronized)
+
+Returns:
+- dict: Number of parcels reassigned ('reassigned') and of variants replaced ('variants')
+"""
+def reconcile_parcel_buildings(cursor):
+    cursor.execute("DROP TABLE IF EXISTS temp.reconcile_parcels")
+    cursor.execute('''
+        CREATE TEMP TABLE reconcile_parcels AS
+        SELECT id, purchase_amount, building_type AS current_type, building_variant AS current_variant, NULL AS new_type
+        FROM parcels
+        WHERE owner_address IS NOT NULL
+    ''')
+    cursor.execute("DROP TABLE IF EXISTS temp.reconcile_variants")
+    cursor.execute("CREATE TEMP TABLE reconcile_variants (building_type TEXT, variant TEXT, probability REAL, PRIMARY KEY (building_type, variant))")
+    cursor.executemany("INSERT OR REPLACE INTO reconcile_variants VALUES (?, ?, ?)",
+                       [(building['name'], variant, probability) for building in BUILDING_TYPES for variant, probability in building['variants']])
+
+    # One statement per type, from the most expensive one
+    for building in sorted(BUILDING_TYPES, key=lambda b: b['min_amount'], reverse=True):
+        threshold = building['min_amount'] - SLIPPAGE_TOLERANCE
+        max_count = building.get('max_count')
+        if max_count is None:
+            cursor.execute('''
+                UPDATE reconcile_parcels SET new_type = ?
+                WHERE new_type IS NULL AND purchase_amount >= ?
+            ''', (building['name'], threshold))
+        else:
+            # Unowned parcels holding the type still count against its limit
+            cursor.execute("SELECT COUNT(*) FROM parcels WHERE building_type = ? AND owner_address IS NULL", (building['name'],))
+            slots = max(max_count - cursor.fetchone()[0], 0)
+            cursor.execute('''
+                UPDATE reconcile_parcels SET new_type = ?
+                WHERE id IN (
+                    SELECT id FROM reconcile_parcels
+                    WHERE new_type IS NULL AND purchase_amount >= ?
+                    ORDER BY current_type IS ? DESC, id
+                    LIMIT ?
+                )
+            ''', (building['name'], threshold, building['name'], slots))
+
+    cursor.execute("DELETE FROM reconcile_parcels WHERE new_type IS NULL OR new_type IS current_type")
+    cursor.execute("SELECT COUNT(*) FROM reconcile_parcels")
+    reassigned = cursor.fetchone()[0]
+
+    if reassigned:
+        # New type, its characteristics, and the current variant when it exists for the new type (replaced below otherwise)
+        cursor.execute('''
+            UPDATE parcels
+            SET building_type = (SELECT new_type FROM reconcile_parcels r WHERE r.id = parcels.id)
+            WHERE id IN (SELECT id FROM reconcile_parcels)
+        ''')
+        cursor.execute('''
+            UPDATE parcels
+            SET last_fee_amount = (SELECT fee_amount FROM building_types WHERE name = parcels.building_type),
+                fee_frequency = (SELECT fee_frequency FROM building_types WHERE name = parcels.building_type),
+                energy_consumption = (SELECT energy_consumption FROM building_types WHERE name = parcels.building_type),
+                energy_production = (SELECT energy_production FROM building_types WHERE name = parcels.building_type),
+                zkaspa_production = (SELECT zkaspa_production FROM building_types WHERE name = parcels.building_type)
+            WHERE id IN (SELECT id FROM reconcile_parcels)
+        ''')
+        cursor.execute('''
+            SELECT new_type, COUNT(*) AS count FROM reconcile_parcels GROUP BY new_type
+        ''')
+        for row in cursor.fetchall():
+            log_message(f"{row['count']} parcels reassigned to type '{row['new_type']}'")
+
+    # Random variants only for the parcels whose variant no longer exists
+    cursor.execute('''
+        SELECT p.id, p.building_type
+        FROM parcels p
+        WHERE p.owner_address IS NOT NULL
+          AND p.building_type IN (SELECT building_type FROM reconcile_variants)
+          AND NOT EXISTS (SELECT 1 FROM reconcile_variants v
+                          WHERE v.building_type = p.building_type AND v.variant = p.building_variant)
+    ''')
+    invalid_variants = cursor.fetchall()
+    variants_by_type = {building['name']: building['variants'] for building in BUILDING_TYPES}
+    cursor.executemany("UPDATE parcels SET building_variant = ? WHERE id = ?", [
+        (random.choices([v[0] for v in variants_by_type[row['building_type']]],
+                        weights=[v[1] for v in variants_by_type[row['building_type']]])[0], row['id'])
+        for row in invalid_variants
+    ])
+
+    cursor.execute("DROP TABLE temp.reconcile_parcels")
+    cursor.execute("DROP TABLE temp.reconcile_variants")
+    return {"reassigned": reassigned, "variants": len(invalid_variants)}
+
+'''
+init_db():
+Initializes and updates the game's database.
+
+Process:
+1. Creates necessary tables if they don't exist, applies the pending schema migrations
+   (see SCHEMA_MIGRATIONS) and checks the query plans of the hot-path queries.
+2. Updates existing building types and adds new types.
+3. Updates building variants.
+4. Updates characteristics of existing plots for each building type.
+5. Checks and updates all building types for existing plots in a single pass:
+   - Handles both changes to existing types and newly added types.
+   - Updates all relevant characteristics (fee_amount, fee_frequency, energy_consumption, etc.).
+6. Adds new plots if necessary to reach the desired total number.
+7. Recalculates the map size.
+8. Updates game statistics and parameters.
+9. Handles updating variants for existing plots, ensuring they are valid.
+10. Saves modifications and logs important information at each step.
+
+This function ensures the database is up to date with the latest building configurations,
+including newly added types and modifications to existing characteristics,
+while preserving data integrity and optimizing the update process.
+
+'''
+def init_db():
+    global MAP_SIZE
+    start_time = time.perf_counter()
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        log_message("Initializing database...")
+
+        # Block for table creation
+        try:   
+            # Create tables if they don't already exist
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS parcels (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    owner_address TEXT,
+                    building_type TEXT,
+                    building_variant TEXT,
+                    purchase_amount REAL,
+                    purchase_date REAL,
+                    last_fee_payment REAL,
+                    last_fee_check REAL,
+                    last_fee_amount REAL,
+                    fee_frequency INTEGER,
+                    next_fee_date REAL,
+                    x INTEGER,
+                    y INTEGER,
+                    energy_production INTEGER DEFAULT 0,
+                    energy_consumption INTEGER DEFAULT 0,
+                    zkaspa_production REAL DEFAULT 0,
+                    zkaspa_balance REAL DEFAULT 0,
+                    is_special BOOLEAN DEFAULT 0,
+                    is_for_sale BOOLEAN DEFAULT 0,
+                    sale_price REAL,
+                    type TEXT DEFAULT 'grass',
+                    rarity TEXT
+                )
+            ''')
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS processed_transactions (
+                    transaction_id TEXT PRIMARY KEY,
+                    processed_at REAL
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS wallets (
+                    address TEXT PRIMARY KEY,
+                    total_amount REAL,
+                    transaction_count INTEGER,
+                    last_transaction_id TEXT,
+                    last_transaction_timestamp REAL
+                )
+            ''')
+            
+            # Create a new table to store game parameters
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS game_parameters (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            ''')
+
+            # Create the table for building types
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS building_types (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT UNIQUE,
+                    min_amount REAL,
+                    max_amount REAL,
+                    fee_amount REAL,
+                    fee_frequency INTEGER,
+                    building_category TEXT,
+                    energy_production INTEGER,
+                    energy_consumption INTEGER,
+                    zkaspa_production REAL,
+                    max_count INTEGER
+                )
+            ''')
+
+            # Create the table for building variants
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS building_variants (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    building_type TEXT,
+                    variant TEXT,
+                    probability REAL,
+                    UNIQUE(building_type, variant)
+                )
+            ''')
+
+            # Create the table for fee payments
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS fee_payments (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    parcel_id INTEGER,
+                    payment_date REAL,
+                    amount REAL,
+                    building_type TEXT,
+                    transaction_id TEXT,
+                    FOREIGN KEY (parcel_id) REFERENCES parcels(id)
+                )
+            ''')
+
+            # Create the table for random events
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    event_type TEXT,
+                    start_time REAL,
+                    end_time REAL,
                     description TEXT,
                     energy_multiplier REAL,
                     zkaspa_multiplier REAL
@@ -576,6 +1942,8 @@ def init_db():
                     parcel_id INTEGER NOT NULL,
                     created_at REAL NOT NULL,
                     status TEXT DEFAULT 'pending',
+                    last_seen_tx_id TEXT,
+                    last_seen_block_time INTEGER,
                     FOREIGN KEY (parcel_id) REFERENCES parcels(id)
                 )
             ''')
@@ -584,149 +1952,94 @@ def init_db():
             log_message(f"Error creating tables: {e}")
             raise  
 
-        # Get the current list of building types (allows to know which buildings have been added to the building type list from existing ones)
-        cursor.execute("SELECT name FROM building_types")
-        existing_building_types = set(row['name'] for row in cursor.fetchall())
-       
-        # Initialize the set for new building types
-        new_building_types = set()
-
-        log_message("Updating building types and existing parcels...")
-
-        for building in BUILDING_TYPES:
-            cursor.execute('''
-                SELECT fee_frequency
-                FROM building_types
-                WHERE name = ?
-            ''', (building['name'],))
-            old_frequency = cursor.fetchone()
-            
-            cursor.execute('''
-                INSERT OR REPLACE INTO building_types 
-                (name, min_amount, max_amount, fee_amount, fee_frequency, building_category,
-                energy_production, energy_consumption, zkaspa_production, max_count)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                building['name'],
-                building['min_amount'],
-                building['max_amount'],
-                building['fee_amount'],
-                building['fee_frequency'],
-                building['building_category'],
-                building.get('energy_production', 0),
-                building.get('energy_consumption', 0),
-                building['zkaspa_production'],
-                building.get('max_count', None)
-            ))
-            new_building_types.add(building['name'])
-
-            if old_frequency and old_frequency[0] != building['fee_frequency']:
-                update_fee_dates_for_building_type(conn, cursor, building['name'], building['fee_frequency'])
-
-            log_message(f"Building type '{building['name']}' updated in the database.")
-
-            # Update existing parcels with new values
-            cursor.execute('''
-                UPDATE parcels
-                SET last_fee_amount = ?,
-                    fee_frequency = ?,
-                    energy_production = ?,
-                    energy_consumption = ?,
-                    zkaspa_production = ?
-                WHERE building_type = ?
-            ''', (
-                building.get('fee_amount', 0),
-                building.get('fee_frequency', 0),
-                building.get('energy_production', 0),
-                building.get('energy_consumption', 0),
-                building.get('zkaspa_production', 0),
-                building['name']
-            ))
-                                    
-            updated_rows = cursor.rowcount
-            log_message(f"{updated_rows} parcels updated for type '{building['name']}'.")
-
-            # Modify this part to insert variants with their probabilities
-            cursor.executemany('''
-                INSERT OR REPLACE INTO building_variants (building_type, variant, probability)
-                VALUES (?, ?, ?)
-            ''', [(building['name'], variant, probability) for variant, probability in building['variants']])
-            log_message(f"Variants updated for type '{building['name']}'.")
-
-        # Refresh the list of building types after updates
-        cursor.execute('''
-            SELECT bt.*, 
-                GROUP_CONCAT(bv.variant || ':' || bv.probability, ';') as variants
-            FROM building_types bt
-            LEFT JOIN building_variants bv ON bt.name = bv.building_type
-            GROUP BY bt.name
-            ORDER BY bt.min_amount DESC
-        ''')
-        building_types = [dict(row) for row in cursor.fetchall()]
+        # Apply the pending schema migrations, then check that the hot-path queries use the indexes
+        conn.commit()
+        run_migrations(conn)
+        ensure_archive_schema(conn)
+        check_query_plans(conn)
 
-        # Convertir la chaîne de variantes en liste de tuples
-        for bt in building_types:
-            if bt['variants']:
-                bt['variants'] = [tuple(v.split(':')) for v in bt['variants'].split(';')]
-                bt['variants'] = [(v[0], float(v[1])) for v in bt['variants']]
-            else:
-                bt['variants'] = []
+        timings = {"tables and migrations": time.perf_counter() - start_time}
 
-        log_message(f"Updated building types: {[b['name'] for b in building_types]}")
+        # The building configuration is only synchronized when it has changed since the last startup
+        fingerprint = building_types_fingerprint()
+        cursor.execute("SELECT value FROM game_parameters WHERE key = 'building_types_fingerprint'")
+        stored_fingerprint = cursor.fetchone()
+        config_changed = stored_fingerprint is None or stored_fingerprint['value'] != fingerprint
 
-        # Check updated parcels
-        cursor.execute('''
-            SELECT building_type, COUNT(*) as count
-            FROM parcels
-            WHERE owner_address IS NOT NULL
-            GROUP BY building_type
-        ''')
-        building_counts = cursor.fetchall()
-        for building_type, count in building_counts:
-            log_message(f"{building_type}: {count} parcels")
-
-        # Check for newly added building types
-        added_building_types = new_building_types - existing_building_types
+        if not config_changed:
+            log_message("Building configuration unchanged, reconciliation of the parcels skipped.")
+        else:
+            phase_start = time.perf_counter()
+            log_message("Updating building types and existing parcels...")
 
-        # Single check for all parcels
-        log_message("\nVerification and update of building types for all parcels:")
-        cursor.execute('''
-            SELECT id, building_type, building_variant, purchase_amount, owner_address
-            FROM parcels
-            WHERE owner_address IS NOT NULL
-        ''')
-        all_parcels = cursor.fetchall()
+            for building in BUILDING_TYPES:
+                cursor.execute('''
+                    SELECT fee_frequency
+                    FROM building_types
+                    WHERE name = ?
+                ''', (building['name'],))
+                old_frequency = cursor.fetchone()
 
-        for parcel in all_parcels:
-            parcel_id, current_building_type, current_building_variant, purchase_amount, owner_address = parcel
-            new_building_type, new_variant = determine_building_type(purchase_amount, current_building_variant, building_types)
-            
-            # Check if the building type has changed, if it's a new type, or if an update is necessary
-            if new_building_type != current_building_type or new_building_type in added_building_types:
+                cursor.execute('''
+                    INSERT OR REPLACE INTO building_types 
+                    (name, min_amount, max_amount, fee_amount, fee_frequency, building_category,
+                    energy_production, energy_consumption, zkaspa_production, max_count)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    building['name'],
+                    building['min_amount'],
+                    building['max_amount'],
+                    building['fee_amount'],
+                    building['fee_frequency'],
+                    building['building_category'],
+                    building.get('energy_production', 0),
+                    building.get('energy_consumption', 0),
+                    building['zkaspa_production'],
+                    building.get('max_count', None)
+                ))
+
+                if old_frequency and old_frequency[0] != building['fee_frequency']:
+                    update_fee_dates_for_building_type(conn, cursor, building['name'], building['fee_frequency'])
+
+                # Update existing parcels with new values
                 cursor.execute('''
                     UPDATE parcels
-                    SET building_type = ?, building_variant = ?
-                    WHERE id = ?
-                ''', (new_building_type, new_variant, parcel_id))
-                
-                building_info = next((b for b in BUILDING_TYPES if b['name'] == new_building_type), None)
-                if building_info:
-                    cursor.execute('''
-                        UPDATE parcels
-                        SET last_fee_amount = ?, fee_frequency = ?, 
-                            energy_consumption = ?, energy_production = ?, zkaspa_production = ?
-                        WHERE id = ?
-                    ''', (building_info['fee_amount'], building_info['fee_frequency'],
-                        building_info.get('energy_consumption', 0), building_info.get('energy_production', 0),
-                        building_info.get('zkaspa_production', 0), parcel_id))
-                log_message(f"Parcel {parcel_id} updated: {current_building_type} -> {new_building_type}")
-            elif not new_building_type:
-                log_message(f"No appropriate new building type found for parcel {parcel_id}. Current type retained: {current_building_type}")
-
-        for new_type in added_building_types:
-            log_message(f"Checking newly added building type(s): {new_type}")   
+                    SET last_fee_amount = ?,
+                        fee_frequency = ?,
+                        energy_production = ?,
+                        energy_consumption = ?,
+                        zkaspa_production = ?
+                    WHERE building_type = ?
+                ''', (
+                    building.get('fee_amount', 0),
+                    building.get('fee_frequency', 0),
+                    building.get('energy_production', 0),
+                    building.get('energy_consumption', 0),
+                    building.get('zkaspa_production', 0),
+                    building['name']
+                ))
+                log_message(f"Building type '{building['name']}' updated in the database, {cursor.rowcount} parcels updated.")
+
+                cursor.executemany('''
+                    INSERT OR REPLACE INTO building_variants (building_type, variant, probability, rarity, rarity_multiplier)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', [(building['name'], variant, probability, *determine_rarity_and_multiplier(probability))
+                      for variant, probability in building['variants']])
+            timings["building types"] = time.perf_counter() - phase_start
+
+            # Reassign the building types and the variants of the owned parcels
+            phase_start = time.perf_counter()
+            reconciliation = reconcile_parcel_buildings(cursor)
+            # The variant probabilities, hence the rarity tiers, may have changed
+            refresh_variant_rarity(cursor)
+            sync_parcel_rarity(cursor)
+            rebuild_production_totals(cursor)
+            timings["parcel reconciliation"] = time.perf_counter() - phase_start
+            log_message(f"Parcel reconciliation: {reconciliation['reassigned']} parcels reassigned, "
+                        f"{reconciliation['variants']} variants replaced.")
 
         # Check the number of existing parcels
+        phase_start = time.perf_counter()
         log_message("Checking existing parcels...")
         cursor.execute("SELECT COUNT(*) FROM parcels")
         existing_parcels = cursor.fetchone()[0]
@@ -762,69 +2075,48 @@ def init_db():
 
             log_message("New parcels added.")
 
-        # Calculate the new map size
-        MAP_SIZE = max((TOTAL_PARCELS_DESIRED - 1) // PARCELS_PER_ROW + 1, PARCELS_PER_ROW)
-
-        log_message(f"Final number of parcels: {existing_parcels}")
-        log_message(f"Final map size: {MAP_SIZE}x{PARCELS_PER_ROW}")
-
-        cursor.execute("SELECT MIN(x), MAX(x), MIN(y), MAX(y) FROM parcels")
-        min_max = cursor.fetchone()
-        log_message(f"Coordinate range: x({min_max[0]}-{min_max[1]}), y({min_max[2]}-{min_max[3]})")
-
-        # Update the map size in the database
-        cursor.execute("INSERT OR REPLACE INTO game_parameters (key, value) VALUES (?, ?)", ('map_size', str(MAP_SIZE)))
-
-        log_message("\nChecking updated parcels:")
-        for building in BUILDING_TYPES:
-            cursor.execute('''
-                SELECT COUNT(*) as count, building_type, fee_frequency, energy_consumption, energy_production, zkaspa_production
-                FROM parcels
-                WHERE building_type = ?
-                GROUP BY building_type, fee_frequency, energy_consumption, energy_production, zkaspa_production
-            ''', (building['name'],))
-            result = cursor.fetchone()
-            if result:
-                log_message(f"{building['name']}: {result['count']} parcels, "
-                    f"fee_frequency={result['fee_frequency']}, "
-                    f"energy_consumption={result['energy_consumption']}, "
-                    f"energy_production={result['energy_production']}, "
-                    f"zkaspa_production={result['zkaspa_production']}")
-            else:
-                log_message(f"{building['name']}: No parcels found")
+        # Calculate the new map size
+        MAP_SIZE = max((TOTAL_PARCELS_DESIRED - 1) // PARCELS_PER_ROW + 1, PARCELS_PER_ROW)
 
-        log_message(f"\nFinal number of parcels: {existing_parcels}")
+        log_message(f"Final number of parcels: {existing_parcels}")
         log_message(f"Final map size: {MAP_SIZE}x{PARCELS_PER_ROW}")
 
         cursor.execute("SELECT MIN(x), MAX(x), MIN(y), MAX(y) FROM parcels")
         min_max = cursor.fetchone()
         log_message(f"Coordinate range: x({min_max[0]}-{min_max[1]}), y({min_max[2]}-{min_max[3]})")
 
-        # Handle updating variants for existing parcels
-        log_message("\nUpdating variants for existing parcels:")
-        for building in BUILDING_TYPES:
+        # Update the map size in the database
+        cursor.execute("INSERT OR REPLACE INTO game_parameters (key, value) VALUES (?, ?)", ('map_size', str(MAP_SIZE)))
+
+        timings["parcels and map"] = time.perf_counter() - phase_start
+
+        if config_changed:
+            log_message("\nChecking updated parcels:")
             cursor.execute('''
-                SELECT id, building_variant
+                SELECT building_type, COUNT(*) as count, MIN(fee_frequency) as fee_frequency, MIN(energy_consumption) as energy_consumption,
+                       MIN(energy_production) as energy_production, MIN(zkaspa_production) as zkaspa_production
                 FROM parcels
-                WHERE building_type = ? AND owner_address IS NOT NULL
-            ''', (building['name'],))
-            
-            parcels_to_update = cursor.fetchall()
-            
-            for parcel in parcels_to_update:
-                current_variant = parcel['building_variant']
-                if current_variant not in [v[0] for v in building['variants']]:
-                    # Choose a new random variant if the old one no longer exists
-                    new_variant = random.choices([v[0] for v in building['variants']], 
-                                                weights=[v[1] for v in building['variants']])[0]
-                    cursor.execute('''
-                        UPDATE parcels
-                        SET building_variant = ?
-                        WHERE id = ?
-                    ''', (new_variant, parcel['id']))
-                    log_message(f"Parcel {parcel['id']} updated: old variant {current_variant} -> new variant {new_variant}")
+                WHERE building_type IS NOT NULL
+                GROUP BY building_type
+            ''')
+            counts = {row['building_type']: row for row in cursor.fetchall()}
+            for building in BUILDING_TYPES:
+                result = counts.get(building['name'])
+                if result:
+                    log_message(f"{building['name']}: {result['count']} parcels, "
+                        f"fee_frequency={result['fee_frequency']}, "
+                        f"energy_consumption={result['energy_consumption']}, "
+                        f"energy_production={result['energy_production']}, "
+                        f"zkaspa_production={result['zkaspa_production']}")
+                else:
+                    log_message(f"{building['name']}: No parcels found")
+
+            # Saved with the reconciliation, so an interrupted startup reconciles again
+            cursor.execute("INSERT OR REPLACE INTO game_parameters (key, value) VALUES ('building_types_fingerprint', ?)", (fingerprint,))
 
         conn.commit()
+        timings["total"] = time.perf_counter() - start_time
+        log_message("Startup timing: " + ", ".join(f"{phase} {duration:.3f} s" for phase, duration in timings.items()))
         log_message("Database initialization completed successfully.")
 
 
@@ -842,64 +2134,211 @@ def init_db():
 # Call init_db() at application startup
 init_db()
       
+"""
+get_ingestion_cursor():
+Retrieves the ingestion cursor of the main Kaspa address.
+
+The cursor is the block_time and the ID of the most recent transaction
+that has been fully ingested. It is stored in the game_parameters table.
+
+Returns:
+- tuple: (block_time, tx_id), or (None, None) if no cursor has been saved yet
+"""
+def get_ingestion_cursor():
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT key, value FROM game_parameters
+            WHERE key IN ('ingest_cursor_block_time', 'ingest_cursor_tx_id')
+        ''')
+        values = {row['key']: row['value'] for row in cursor.fetchall()}
+
+        block_time = values.get('ingest_cursor_block_time')
+        tx_id = values.get('ingest_cursor_tx_id')
+        if block_time is None or tx_id is None:
+            return None, None
+        return int(block_time), tx_id
+
+    except Exception as e:
+        log_message(f"Error while retrieving the ingestion cursor: {e}")
+        return None, None
+
+    finally:
+        if conn:
+            conn.close()
+
+"""
+save_ingestion_cursor(block_time, tx_id):
+Saves the ingestion cursor of the main Kaspa address in game_parameters.
+
+Parameters:
+- block_time (int): Block time (milliseconds) of the most recent ingested transaction
+- tx_id (str): ID of the most recent ingested transaction
+"""
+@db_writer.task
+def save_ingestion_cursor(block_time, tx_id):
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.executemany("INSERT OR REPLACE INTO game_parameters (key, value) VALUES (?, ?)", [
+            ('ingest_cursor_block_time', str(block_time)),
+            ('ingest_cursor_tx_id', tx_id)
+        ])
+        conn.commit()
+
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        log_message(f"Error while saving the ingestion cursor: {e}")
+
+    finally:
+        if conn:
+            conn.close()
+
 '''
-check_new_transactions():
+check_new_transactions(attempt=0):
 Checks and processes new transactions for the main Kaspa address.
 
-- Retrieves and sorts recent transactions.
-- Processes each new transaction not yet recorded.
+- Pages forward through the address history until the ingestion cursor is reached,
+  so a burst of any size between two polls is fully drained.
+- Processes each new transaction not yet recorded, oldest first. Deposits are
+  applied in batches through apply_transaction_batch() (one SQLite transaction per page).
+- Advances the cursor to the newest transaction, but never past a transaction
+  that could not be recorded (it will be fetched again on the next poll).
+- Keeps the cursor if it was not reached within KASPA_INGEST_MAX_PAGES pages: the
+  transactions retrieved are applied, the older ones are fetched by the next polls.
+- If the API cannot be reached, re-enqueues the poll with schedule_retry() (backoff with jitter)
+  instead of sleeping; attempt is the number of the retry (0 for the periodic run).
+- With a push transaction source (see UtxoSubscriptionSource), deposits are applied as they are
+  notified and the poll only runs when transaction_source.poll_due() (gap-filler).
 - Handles errors in data access and processing.
 - Logs records for processed transactions and errors.
 '''
-def check_new_transactions():
-    with app.app_context():
-        try:
-            transactions = get_recent_transactions(KASPA_MAIN_ADDRESS)
-            
-            # Sort transactions by timestamp
-            sorted_transactions = sorted(transactions, key=itemgetter('block_time'))
-            
-            for tx in sorted_transactions:
+def check_new_transactions(attempt=0):
+    # The periodic poll and its re-enqueued retries never run concurrently
+    if not ingestion_lock.acquire(blocking=False):
+        return
+    try:
+        # With a push source, the poll only runs as a periodic gap-filler
+        if not transaction_source.poll_due():
+            return
+        with app.app_context():
+            try:
+                cursor_block_time, cursor_tx_id = get_ingestion_cursor()
                 try:
-                    tx_id = tx['transaction_id']
-                    if not transaction_already_processed(tx_id):
-                        for output in tx['outputs']:
-                            if output['script_public_key_address'] == KASPA_MAIN_ADDRESS:
-                                try:
-                                    amount = output['amount'] / 100000000  # Conversion to KAS
-                                    from_address = tx['inputs'][0].get('previous_outpoint_address', 'Unknown')
-                                    
-                                    # Process the transaction for fees and upgrades/allocations
-                                    process_new_transaction(from_address, amount, tx_id, tx['block_time'])
-                                    log_message(f"New transaction processed for {from_address}: {amount} KAS")
-                                except KeyError as e:
-                                    log_message(f"Error accessing transaction data: {e}")
-                                except Exception as e:
-                                    log_message(f"Unexpected error while processing transaction: {e}")
-                except KeyError as e:
-                    log_message(f"Error accessing transaction data: {e}")
-                except Exception as e:
-                    log_message(f"Unexpected error while processing transaction: {e}")
-        except Exception as e:
-            log_message(f"Error retrieving recent transactions: {e}")
-            
+                    transactions, cursor_reached = get_transactions_since(KASPA_MAIN_ADDRESS, cursor_block_time, cursor_tx_id)
+                except (RequestException, ValueError) as e:
+                    # Re-enqueue the poll with backoff instead of holding the worker thread
+                    schedule_retry('retry_check_new_transactions', check_new_transactions, attempt, e)
+                    return
+                transaction_source.mark_polled()
+                if not transactions:
+                    return
+
+                deposits, recorded_ids = apply_new_transactions(transactions)
+
+                # Transactions older than the pages retrieved are missing: the cursor must not skip them
+                if not cursor_reached:
+                    return
+
+                # Sort transactions by timestamp
+                sorted_transactions = sorted(transactions, key=itemgetter('block_time'))
+
+                # Advance the cursor up to the first deposit that could not be recorded
+                deposit_ids = {deposit['tx_id'] for deposit in deposits}
+                new_cursor = None
+                for tx in sorted_transactions:
+                    if tx['transaction_id'] in deposit_ids and tx['transaction_id'] not in recorded_ids:
+                        # Keep the cursor before this transaction so it is retried on the next poll
+                        log_message(f"Transaction {tx['transaction_id']} could not be recorded, ingestion cursor held back.")
+                        break
+                    new_cursor = (tx['block_time'], tx['transaction_id'])
+
+                if new_cursor and new_cursor != (cursor_block_time, cursor_tx_id):
+                    save_ingestion_cursor(*new_cursor)
+            except Exception as e:
+                log_message(f"Error retrieving recent transactions: {e}")
+    finally:
+        ingestion_lock.release()
+
+"""
+apply_new_transactions(transactions):
+Records the deposits to the main address found in a list of fetched transactions.
+
+Used by the polling path (check_new_transactions) and by the push path (ingest_pushed_transactions).
+The caller must hold ingestion_lock, so that a transaction received by both paths is applied once.
+
+- Discards the transactions already recorded in one query.
+- Classifies the others into deposits to the game address, oldest first
+  (only the first output to the game address of a transaction is taken into account).
+- Applies the deposits page by page, each page in a single SQLite transaction.
+
+Parameters:
+- transactions (list): Transactions in the format of the full-transactions endpoint
+
+Returns:
+- tuple: (list of deposits found, set of the IDs of the deposits recorded)
 """
-get_total_amount_sent(address):
+def apply_new_transactions(transactions):
+    # Discard already processed transactions in one pass
+    new_transactions = filter_unprocessed_transactions(transactions)
+
+    # Sort transactions by timestamp
+    sorted_transactions = sorted(transactions, key=itemgetter('block_time'))
+    new_tx_ids = {tx['transaction_id'] for tx in new_transactions}
+
+    # Classify the new transactions into deposits to the game address
+    deposits = []
+    for tx in sorted_transactions:
+        if tx['transaction_id'] not in new_tx_ids:
+            continue
+        try:
+            for output in tx['outputs']:
+                if output['script_public_key_address'] == KASPA_MAIN_ADDRESS:
+                    deposits.append({
+                        "from_address": tx['inputs'][0].get('previous_outpoint_address', 'Unknown'),
+                        "amount": output['amount'] / 100000000,  # Conversion to KAS
+                        "tx_id": tx['transaction_id'],
+                        "timestamp": tx['block_time']
+                    })
+                    break  # A transaction is processed only once
+        except (KeyError, IndexError) as e:
+            log_message(f"Error accessing transaction data: {e}")
+
+    # Apply the deposits page by page, each page in a single SQLite transaction
+    recorded_ids = set()
+    for start in range(0, len(deposits), KASPA_API_PAGE_SIZE):
+        batch = deposits[start:start + KASPA_API_PAGE_SIZE]
+        results = apply_transaction_batch(batch)
+        for deposit, result in zip(batch, results):
+            if result.get('recorded'):
+                recorded_ids.add(deposit['tx_id'])
+                log_message(f"New transaction processed for {deposit['from_address']}: {deposit['amount']} KAS")
+
+    return deposits, recorded_ids
+
+"""
+get_total_amount_sent(address, conn=None):
 Retrieves the total amount sent by a specific address.
 
 Parameters:
 - address (str): The wallet address to check.
+- conn (sqlite3.Connection, optional): Connection to use. If not provided, a new one is opened and closed.
 
 Returns:
 - float: The total amount sent, or 0 in case of error.
 
 Used to determine a player's eligibility for certain game actions.
 """
-def get_total_amount_sent(address):
-    conn = None
+def get_total_amount_sent(address, conn=None):
+    own_connection = conn is None
     total_amount = 0
     try:
-        conn = get_db_connection()
+        if own_connection:
+            conn = get_db_connection()
         cursor = conn.cursor()
         try:
             cursor.execute("SELECT SUM(total_amount) FROM wallets WHERE address = ?", (address,))
@@ -911,7 +2350,7 @@ def get_total_amount_sent(address):
     except Exception as e:
         log_message(f"Unexpected error while retrieving total amount for address {address}: {e}")
     finally:
-        if conn:
+        if own_connection and conn:
             try:
                 conn.close()
             except Exception as e:
@@ -919,32 +2358,43 @@ def get_total_amount_sent(address):
     return total_amount
 
 """
-get_unassigned_parcel():
+get_unassigned_parcel(conn=None):
 Randomly retrieves an unassigned plot from the database.
 
+The plot is drawn from the free-parcel pool (see migrate_free_parcels): a random slot between 1 and
+the number of free plots, so the cost does not depend on the number of free plots. The pool is kept
+by triggers, so plots freed by the fee check (collect_fees) or process_parcel_purchase are available again at once.
+
+Parameters:
+- conn (sqlite3.Connection, optional): Connection to use. If not provided, a new one is opened and closed.
+
 Returns:
 - tuple: (id, x, y) of the plot if available, None otherwise.
 
 Used when assigning a new plot to a player.
 """
-def get_unassigned_parcel():
-    conn = None
+def get_unassigned_parcel(conn=None):
+    own_connection = conn is None
     try:
-        conn = get_db_connection()
+        if own_connection:
+            conn = get_db_connection()
         cursor = conn.cursor()
         try:
-            cursor.execute("""
-                SELECT id, x, y 
-                FROM parcels 
-                WHERE owner_address IS NULL 
-                  AND (purchase_amount IS NULL OR purchase_amount = 0)
-            """)
-            unassigned_parcels = cursor.fetchall()
-            
-            if unassigned_parcels:
-                return random.choice(unassigned_parcels)
-            else:
+            cursor.execute("SELECT MAX(slot) FROM free_parcels")
+            free_count = cursor.fetchone()[0]
+            if not free_count:
                 return None
+
+            # Slots are dense, the range query only guards against a gap
+            cursor.execute("""
+                SELECT p.id, p.x, p.y
+                FROM free_parcels f
+                JOIN parcels p ON p.id = f.parcel_id
+                WHERE f.slot >= ?
+                ORDER BY f.slot
+                LIMIT 1
+            """, (random.randint(1, free_count),))
+            return cursor.fetchone()
         except sqlite3.Error as e:
             log_message(f"SQLite error while retrieving unassigned parcels: {e}")
             return None
@@ -952,14 +2402,14 @@ def get_unassigned_parcel():
         log_message(f"Unexpected error while retrieving unassigned parcels: {e}")
         return None
     finally:
-        if conn:
+        if own_connection and conn:
             try:
                 conn.close()
             except Exception as e:
                 log_message(f"Error closing connection: {e}")
 
 """
-process_new_transaction(from_address, amount, tx_id, timestamp):
+process_new_transaction(from_address, amount, tx_id, timestamp, check_processed=True):
 Processes a new transaction for a given address.
 
 Parameters:
@@ -967,138 +2417,191 @@ Parameters:
 - amount (float): Transaction amount in KAS.
 - tx_id (str): Unique transaction ID.
 - timestamp (float): Transaction timestamp.
+- check_processed (bool): Checks if the transaction has already been processed.
+  Callers that already deduplicated the transaction pass False.
+
+Returns:
+- dict: Processing result with status and message.
+
+The transaction is applied as a batch of one through apply_transaction_batch().
+"""
+def process_new_transaction(from_address, amount, tx_id, timestamp, check_processed=True):
+    if check_processed and transaction_already_processed(tx_id):
+        return {"success": False, "message": "Transaction already processed.", "recorded": True}
+
+    deposit = {"from_address": from_address, "amount": amount, "tx_id": tx_id, "timestamp": timestamp}
+    return apply_transaction_batch([deposit])[0]
+
+"""
+apply_transaction_batch(deposits):
+Applies a batch of classified deposits through a single connection and a single SQLite transaction.
+
+Parameters:
+- deposits (list): Dicts with from_address, amount, tx_id and timestamp, in processing order.
+
+Returns:
+- list: One processing result per deposit (same order). A result contains 'recorded': True
+  when the transaction has been marked as processed.
+
+Each deposit runs inside its own savepoint: if it fails, only its own changes (wallet update
+included) are rolled back and it is not marked as processed, so it will be retried on the next poll.
+The whole batch is committed once at the end.
+"""
+@db_writer.batch_task
+def apply_transaction_batch(deposits):
+    results = []
+    if not deposits:
+        return results
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        conn.execute("BEGIN TRANSACTION")
+
+        for deposit in deposits:
+            cursor.execute("SAVEPOINT deposit")
+            try:
+                result = apply_deposit(conn, cursor, deposit['from_address'], deposit['amount'],
+                                       deposit['tx_id'], deposit['timestamp'])
+                cursor.execute("RELEASE SAVEPOINT deposit")
+                results.append(result)
+            except Exception as e:
+                cursor.execute("ROLLBACK TO SAVEPOINT deposit")
+                cursor.execute("RELEASE SAVEPOINT deposit")
+                log_message(f"Error while processing transaction {deposit['tx_id']}: {e}")
+                results.append({"success": False, "message": "Error while processing the transaction."})
+
+        conn.commit()
+
+        recorded_ids = [deposit['tx_id'] for deposit, result in zip(deposits, results) if result.get('recorded')]
+        remember_processed_transactions(recorded_ids)
+        log_message(f"Transaction batch applied: {len(recorded_ids)}/{len(deposits)} transactions recorded.")
+
+    except sqlite3.Error as e:
+        if conn:
+            conn.rollback()
+        log_message(f"SQL error while applying the transaction batch: {e}")
+        results = [{"success": False, "message": "Error connecting to the database."} for _ in deposits]
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        log_message(f"Unexpected error while applying the transaction batch: {e}")
+        results = [{"success": False, "message": "Unexpected error while processing the transaction."} for _ in deposits]
+    finally:
+        if conn:
+            try:
+                conn.close()
+            except Exception as e:
+                log_message(f"Error while closing the connection: {e}")
+
+    return results
+
+"""
+apply_deposit(conn, cursor, from_address, amount, tx_id, timestamp):
+Applies a single deposit inside a transaction owned by the caller (nothing is committed here).
+
+Parameters:
+- conn: Database connection
+- cursor: Database cursor
+- from_address (str): Origin address of the transaction.
+- amount (float): Transaction amount in KAS.
+- tx_id (str): Unique transaction ID.
+- timestamp (float): Transaction timestamp.
 
 Returns:
 - dict: Processing result with status and message.
 
 Operation:
-1. Checks if the transaction has already been processed.
-2. Updates or inserts wallet information.
-3. Checks the total amount sent by the address.
-4. Determines the action to take based on the amount:
+1. Updates or inserts wallet information.
+2. Checks the total amount sent by the address.
+3. Determines the action to take based on the amount:
    - Plot listing for sale (about 0.2 KAS)
    - Sale cancellation (about 0.3 KAS)
    - Normal processing (other amounts)
-5. For normal processing:
+4. For normal processing:
    - If the address already has a plot:
      * Checks if the plot is for sale and updates the price if necessary
      * Otherwise, processes fee payment and attempts an upgrade
    - If the address doesn't have a plot and the total amount is sufficient:
      * Assigns a new plot
    - Otherwise, returns an error message for insufficient amount
-6. Marks the transaction as processed.
+5. Marks the transaction as processed.
 
 Handles various actions such as fee payment, building upgrade,
 plot listing for sale, sale cancellation, and new plot assignment.
-Updates the database accordingly and modifies the game state based on the type
-and amount of the transaction.
-
-Note:
-- Uses a database connection for all operations.
-- Handles database errors and unexpected exceptions.
-- Logs detailed messages for transaction processing tracking.
+Database errors are raised so that the caller can roll back the deposit.
 """
-def process_new_transaction(from_address, amount, tx_id, timestamp):
-    conn = None
-    result = {"success": False, "message": "Unexpected error while processing the transaction."}
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+def apply_deposit(conn, cursor, from_address, amount, tx_id, timestamp):
+    # Update or insert wallet information
+    update_wallet_info(from_address, amount, tx_id, timestamp, conn=conn)
 
-        if transaction_already_processed(tx_id):
-            return {"success": False, "message": "Transaction already processed."}
+    # Check the total amount sent by this address
+    total_amount = get_total_amount_sent(from_address, conn=conn)
 
-        try:
-            # Update or insert wallet information
-            update_wallet_info(from_address, amount, tx_id, timestamp)
-            
-            # Check the total amount sent by this address
-            total_amount = get_total_amount_sent(from_address)
-            
-            current_time = datetime.now().timestamp()
-
-            # Check if the address already has a parcel
-            cursor.execute("SELECT * FROM parcels WHERE owner_address = ?", (from_address,))
-            existing_parcel = cursor.fetchone()
-
-            # Tolerate a margin of error for the sale action
-            if abs(amount - 0.2) < 0.01:
-                if existing_parcel:
-                    # Process as a sale listing request or price update
-                    if process_sale_listing(conn, cursor, from_address, tx_id):
-                        result = {"success": True, "message": "Parcel successfully listed for sale or price updated."}
-                    else:
-                        result = {"success": False, "message": "Failed to list parcel for sale or update price."}
-                else:
-                    result = {"success": False, "message": "Unable to list for sale: you don't have a parcel."}
-            # Tolerate a margin of error for the sale cancellation action
-            elif abs(amount - 0.3) < 0.01:
-                if existing_parcel:
-                    # Process as a sale cancellation request
-                    if process_sale_cancellation(conn, cursor, from_address, tx_id):
-                        result = {"success": True, "message": "Sale cancellation successful."}
-                    else:
-                        result = {"success": False, "message": "Failed to cancel the sale."}
-                else:
-                    result = {"success": False, "message": "Unable to cancel sale: you don't have a parcel."}
+    current_time = datetime.now().timestamp()
 
-            else:
-                # New code: Check if the amount corresponds to a sale listing with multiplier
-                multiplier = None
-                tolerance = 0.01  # Adjust the tolerance as needed
-                for key_amount in PRICE_MULTIPLIERS.keys():
-                    if abs(amount - key_amount) < tolerance:
-                        multiplier = PRICE_MULTIPLIERS[key_amount]
-                        break
+    # Check if the address already has a parcel
+    cursor.execute("SELECT * FROM parcels WHERE owner_address = ?", (from_address,))
+    existing_parcel = cursor.fetchone()
 
-                if existing_parcel and multiplier:
-                    # Process as a sale listing with multiplier
-                    if process_sale_listing(conn, cursor, from_address, tx_id, multiplier=multiplier):
-                        result = {"success": True, "message": f"Parcel listed for sale with price multiplier {multiplier}."}
+    # Tolerate a margin of error for the sale action
+    if abs(amount - 0.2) < 0.01:
+        if existing_parcel:
+            # Process as a sale listing request or price update
+            if process_sale_listing(conn, cursor, from_address, tx_id, manage_transaction=False):
+                result = {"success": True, "message": "Parcel successfully listed for sale or price updated."}
+            else:
+                result = {"success": False, "message": "Failed to list parcel for sale or update price."}
+        else:
+            result = {"success": False, "message": "Unable to list for sale: you don't have a parcel."}
+    # Tolerate a margin of error for the sale cancellation action
+    elif abs(amount - 0.3) < 0.01:
+        if existing_parcel:
+            # Process as a sale cancellation request
+            if process_sale_cancellation(conn, cursor, from_address, tx_id, manage_transaction=False):
+                result = {"success": True, "message": "Sale cancellation successful."}
+            else:
+                result = {"success": False, "message": "Failed to cancel the sale."}
+        else:
+            result = {"success": False, "message": "Unable to cancel sale: you don't have a parcel."}
+
+    else:
+        # New code: Check if the amount corresponds to a sale listing with multiplier
+        multiplier = None
+        tolerance = 0.01  # Adjust the tolerance as needed
+        for key_amount in PRICE_MULTIPLIERS.keys():
+            if abs(amount - key_amount) < tolerance:
+                multiplier = PRICE_MULTIPLIERS[key_amount]
+                break
+
+        if existing_parcel and multiplier:
+            # Process as a sale listing with multiplier
+            if process_sale_listing(conn, cursor, from_address, tx_id, multiplier=multiplier, manage_transaction=False):
+                result = {"success": True, "message": f"Parcel listed for sale with price multiplier {multiplier}."}
+            else:
+                result = {"success": False, "message": "Failed to list parcel for sale with multiplier."}
+        else:
+            # If it's not a special action, process as a normal transaction
+            if existing_parcel:
+                # Check if the parcel is already for sale
+                if existing_parcel['is_for_sale']:
+                    # Update the sale price
+                    if process_sale_listing(conn, cursor, from_address, tx_id, manage_transaction=False):
+                        result = {"success": True, "message": f"Sale price successfully updated. New amount: {total_amount} KAS"}
                     else:
-                        result = {"success": False, "message": "Failed to list parcel for sale with multiplier."}
+                        result = {"success": False, "message": "Failed to update sale price."}
                 else:
-                    # If it's not a special action, process as a normal transaction
-                    if existing_parcel:
-                        # Check if the parcel is already for sale
-                        if existing_parcel['is_for_sale']:
-                            # Update the sale price
-                            if process_sale_listing(conn, cursor, from_address, tx_id):
-                                result = {"success": True, "message": f"Sale price successfully updated. New amount: {total_amount} KAS"}
-                            else:
-                                result = {"success": False, "message": "Failed to update sale price."}
-                        else:
-                            result = process_existing_parcel(conn, cursor, from_address, amount, existing_parcel, current_time, tx_id)
-                    elif total_amount >= (MINIMUM_PURCHASE_AMOUNT - SLIPPAGE_TOLERANCE):
-                        result = process_new_parcel(conn, cursor, from_address, total_amount, current_time)
-                    else:
-                        result = {"success": False, "message": f"Montant insuffisant. Le montant minimum requis est de {MINIMUM_PURCHASE_AMOUNT} KAS."}
-
-            # Mark the transaction as processed
-            cursor.execute("INSERT INTO processed_transactions (transaction_id, processed_at) VALUES (?, ?)", (tx_id, time.time()))
-            conn.commit()
-            log_message(f"New transaction processed: {amount} KAS received from {from_address}. Result: {result['message']}")
-
-        except sqlite3.Error as e:
-            conn.rollback()
-            log_message(f"SQL error while processing the transaction: {e}")
-            result = {"success": False, "message": "Error while processing the transaction."}
-        except Exception as e:
-            conn.rollback()
-            log_message(f"Unexpected error while processing the transaction: {e}")
+                    result = process_existing_parcel(conn, cursor, from_address, amount, existing_parcel, current_time, tx_id, manage_transaction=False)
+            elif total_amount >= (MINIMUM_PURCHASE_AMOUNT - SLIPPAGE_TOLERANCE):
+                result = process_new_parcel(conn, cursor, from_address, total_amount, current_time, manage_transaction=False)
+            else:
+                result = {"success": False, "message": f"Montant insuffisant. Le montant minimum requis est de {MINIMUM_PURCHASE_AMOUNT} KAS."}
 
-    except sqlite3.Error as e:
-        log_message(f"SQL error while connecting to the database: {e}")
-        result = {"success": False, "message": "Error connecting to the database."}
-    except Exception as e:
-        log_message(f"Unexpected error while connecting to the database: {e}")
-    finally:
-        if conn:
-            try:
-                conn.close()
-            except Exception as e:
-                log_message(f"Error while closing the connection: {e}")
-    
+    # Mark the transaction as processed
+    cursor.execute("INSERT INTO processed_transactions (transaction_id, processed_at) VALUES (?, ?)", (tx_id_to_blob(tx_id), time.time()))
+    result['recorded'] = True
+    log_message(f"New transaction processed: {amount} KAS received from {from_address}. Result: {result['message']}")
     return result
 
 """
@@ -1112,13 +2615,15 @@ Parameters:
 - existing_parcel (dict): Existing plot data.
 - current_time (float): Current timestamp.
 - tx_id (str): Transaction ID.
+- manage_transaction (bool): Manages the SQL transaction if True. Otherwise errors are raised
+  to the caller, which owns the transaction.
 
 Returns:
 - dict: Processing result with details on actions taken.
 
 Processes fee payment and attempts a building upgrade, using the total amount for the upgrade regardless of fee payment.
 """
-def process_existing_parcel(conn, cursor, from_address, amount, existing_parcel, current_time, tx_id):
+def process_existing_parcel(conn, cursor, from_address, amount, existing_parcel, current_time, tx_id, manage_transaction=True):
     try:
         fee_paid = False
         upgrade_performed = False
@@ -1145,15 +2650,17 @@ def process_existing_parcel(conn, cursor, from_address, amount, existing_parcel,
                     fee_paid = True
                     log_message(f"Fees of {fee_amount} KAS paid for {from_address}")
                 except sqlite3.Error as e:
-                    conn.rollback()
                     log_message(f"Error updating fees for {from_address}: {e}")
+                    if not manage_transaction:
+                        raise
+                    conn.rollback()
                     return {"success": False, "message": "Error while paying fees."}
             else:
                 log_message(f"Insufficient payment to cover fees for {from_address}")
                 return {"success": False, "message": "Insufficient payment to cover fees."}
 
         # Attempt upgrade with the total amount, regardless of fee payment
-        upgrade_result = upgrade_building(conn, from_address, amount, is_buy_parcel=False, manage_transaction=True)
+        upgrade_result = upgrade_building(conn, from_address, amount, is_buy_parcel=False, manage_transaction=manage_transaction)
         upgrade_performed = upgrade_result['success'] if 'success' in upgrade_result else False
 
         # Prepare the result message
@@ -1176,12 +2683,14 @@ def process_existing_parcel(conn, cursor, from_address, amount, existing_parcel,
         return final_result
 
     except Exception as e:
-        conn.rollback()
         log_message(f"Unexpected error while processing existing parcel for {from_address}: {e}")
+        if not manage_transaction:
+            raise
+        conn.rollback()
         return {"success": False, "message": "Unexpected error while processing existing parcel."}
     
 """
-process_new_parcel(conn, cursor, from_address, total_amount, current_time):
+process_new_parcel(conn, cursor, from_address, total_amount, current_time, manage_transaction=True):
 Assigns a new plot to a new user.
 
 Parameters:
@@ -1190,20 +2699,22 @@ Parameters:
 - from_address (str): Buyer's address
 - total_amount (float): Total amount sent
 - current_time (float): Current timestamp
+- manage_transaction (bool): Commits the assignment if True. Otherwise errors are raised
+  to the caller, which owns the transaction.
 
 Returns:
 - dict: Assignment result with plot details or error message
 """
-def process_new_parcel(conn, cursor, from_address, total_amount, current_time):
+def process_new_parcel(conn, cursor, from_address, total_amount, current_time, manage_transaction=True):
     try:
-        unassigned_parcel = get_unassigned_parcel()
+        unassigned_parcel = get_unassigned_parcel(conn)
         if not unassigned_parcel:
             return {"success": False, "message": "No unassigned parcel available."}
 
         parcel_id, x, y = unassigned_parcel
         
-        building_type, building_variant = determine_building_type(total_amount)
-        building_info = get_building_info(building_type)
+        building_type, building_variant = determine_building_type(total_amount, conn=conn)
+        building_info = get_building_info(building_type, conn=conn)
         
         # SHOULD NEVER enter this condition as we already check this in our determine_building_type function
         if not building_type or not building_variant or not building_info:
@@ -1211,12 +2722,7 @@ def process_new_parcel(conn, cursor, from_address, total_amount, current_time):
             return {"success": False, "message": "Error assigning the parcel."}
 
         # Check if the maximum number of this building type has been reached
-        cursor.execute('''
-            SELECT COUNT(*) 
-            FROM parcels 
-            WHERE building_type = ?
-        ''', (building_type,))
-        current_count = cursor.fetchone()[0]
+        current_count = get_building_count(cursor, building_type)
         
         if building_info['max_count'] is not None and current_count >= building_info['max_count']:
             return {"success": False, "message": f"The maximum number of buildings of type {building_type} has been reached."}
@@ -1232,15 +2738,16 @@ def process_new_parcel(conn, cursor, from_address, total_amount, current_time):
                 last_fee_check = ?, last_fee_amount = ?, fee_frequency = ?, next_fee_date = ?,
                 energy_production = ?, energy_consumption = ?, zkaspa_production = ?,
                 zkaspa_balance = ?, is_for_sale = ?, sale_price = ?,
-                type = ?, rarity = ?
+                type = ?
             WHERE id = ?
         """, (from_address, building_type, building_variant, total_amount, current_time, 
             current_time, current_time, fee_amount, fee_frequency, next_fee_date,
             building_info['energy_production'], building_info['energy_consumption'],
             building_info['zkaspa_production'], 0, False, None,
-            'grass', None, parcel_id))
+            'grass', parcel_id))
 
-        conn.commit()
+        if manage_transaction:
+            conn.commit()
 
         # Check that the update was successful
         cursor.execute("SELECT * FROM parcels WHERE id = ?", (parcel_id,))
@@ -1264,28 +2771,34 @@ def process_new_parcel(conn, cursor, from_address, total_amount, current_time):
         return result
 
     except sqlite3.Error as e:
-        conn.rollback()
         log_message(f"SQL error while processing new parcel for {from_address}: {e}")
+        if not manage_transaction:
+            raise
+        conn.rollback()
         return {"success": False, "message": "Error assigning the parcel."}
     except Exception as e:
-        conn.rollback()
         log_message(f"Unexpected error while processing new parcel for {from_address}: {e}")
+        if not manage_transaction:
+            raise
+        conn.rollback()
         return {"success": False, "message": "Unexpected error while assigning the parcel."}
 
 """
-get_building_info(building_type):
+get_building_info(building_type, conn=None):
 Retrieves information for a specific building type.
 
 Parameters:
 - building_type (str): Name of the building type
+- conn (sqlite3.Connection, optional): Connection to use. If not provided, a new one is opened and closed.
 
 Returns:
 - dict: Building characteristics or None if not found
 """
-def get_building_info(building_type):
-    conn = None
+def get_building_info(building_type, conn=None):
+    own_connection = conn is None
     try:
-        conn = get_db_connection()
+        if own_connection:
+            conn = get_db_connection()
         cursor = conn.cursor()
         cursor.execute("""
             SELECT fee_amount, fee_frequency, energy_production, energy_consumption, zkaspa_production, max_count
@@ -1318,58 +2831,363 @@ def get_building_info(building_type):
         log_message(f"Unexpected error while retrieving building information for {building_type}: {e}")
         return None
     finally:
-        if conn:
+        if own_connection and conn:
             try:
                 conn.close()
             except Exception as e:
                 log_message(f"Error while closing the connection: {e}")
 
 """
-get_recent_transactions(address, max_retries=3, retry_delay=5):
-Retrieves recent transactions for an address via the Kaspa API.
+CircuitOpenError:
+Raised instead of sending a request while the circuit of the API host is open.
+It is a RequestException, so callers handle it like any other API failure.
+"""
+class CircuitOpenError(RequestException):
+    def __init__(self, host, retry_in):
+        super().__init__(f"Circuit open for {host}, next attempt allowed in {retry_in:.0f} seconds")
+        self.host = host
+        self.retry_in = retry_in
+
+"""
+CircuitBreaker:
+Circuit breaker of one API host.
+
+- Closed: requests are sent. After KASPA_API_BREAKER_THRESHOLD consecutive failures, the circuit opens.
+- Open: requests are rejected immediately (no worker thread waits on a host known to be down)
+  until reset_timeout seconds have elapsed.
+- Half-open: a single probe request is let through. Its success closes the circuit,
+  its failure opens it again for another reset_timeout.
+"""
+class CircuitBreaker:
+    def __init__(self, host, failure_threshold, reset_timeout):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.lock = threading.Lock()
+
+    """
+    Returns the number of seconds before a request is allowed (0 if a request can be sent now).
+    In the open state, the first caller after reset_timeout becomes the half-open probe.
+    """
+    def acquire(self):
+        with self.lock:
+            if self.state == 'closed':
+                return 0
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if self.state == 'open' and remaining <= 0:
+                self.state = 'half_open'
+                return 0
+            # Open, or a probe is already in flight
+            return max(remaining, 1)
+
+    def record_success(self):
+        with self.lock:
+            if self.state != 'closed':
+                log_message(f"Kaspa API circuit for {self.host} closed, the host is responding again.")
+            self.state = 'closed'
+            self.consecutive_failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.consecutive_failures += 1
+            if self.state == 'half_open' or (self.state == 'closed' and self.consecutive_failures >= self.failure_threshold):
+                log_message(f"Kaspa API circuit for {self.host} opened after {self.consecutive_failures} consecutive failures, "
+                            f"requests suspended for {self.reset_timeout} seconds.")
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+"""
+KaspaApiClient:
+Shared HTTP client for the Kaspa REST API.
+
+- Keeps warm keep-alive connections in a pooled requests.Session
+  (at most KASPA_API_MAX_CONNECTIONS connections per host).
+- Applies the configured connection and read timeouts to every request.
+- Sends every request through the circuit breaker of its host: while the host is down,
+  requests fail immediately with CircuitOpenError instead of waiting for a timeout.
+- Records per endpoint the number of calls, errors, rejected calls and latency.
+  Endpoints are recorded by route (e.g. /addresses/{address}/full-transactions),
+  not by address, so the counters stay bounded.
+
+The client never retries by itself: callers re-enqueue failed work with backoff_delay().
+"""
+class KaspaApiClient:
+    def __init__(self, base_url, connect_timeout, read_timeout, max_connections,
+                 breaker_threshold=KASPA_API_BREAKER_THRESHOLD, breaker_reset_timeout=KASPA_API_BREAKER_RESET_TIMEOUT):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections, pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset_timeout = breaker_reset_timeout
+        self.breakers = {}
+        self.breakers_lock = threading.Lock()
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+
+    """
+    Returns the circuit breaker of the host of url, created on first use.
+    """
+    def breaker_for(self, url):
+        host = urlparse(url).netloc
+        with self.breakers_lock:
+            if host not in self.breakers:
+                self.breakers[host] = CircuitBreaker(host, self.breaker_threshold, self.breaker_reset_timeout)
+            return self.breakers[host]
+
+    """
+    Returns the number of seconds before requests to the API base URL are allowed again (0 if the circuit is closed).
+    Does not change the state of the circuit.
+    """
+    def circuit_retry_in(self):
+        breaker = self.breaker_for(self.base_url)
+        with breaker.lock:
+            if breaker.state == 'closed':
+                return 0
+            return max(breaker.opened_at + breaker.reset_timeout - time.monotonic(), 0)
+
+    """
+    Sends a GET request and returns the decoded JSON response.
+
+    Parameters:
+    - path (str): Path of the request, relative to the API base URL
+    - endpoint (str): Route name used for the counters
+    - params (dict, optional): Query parameters
+
+    Raises CircuitOpenError if the circuit of the host is open, RequestException (including HTTP errors)
+    or ValueError (invalid JSON).
+    Timeouts, connection errors, 429 and 5xx responses and invalid JSON count as failures of the host.
+    """
+    def get(self, path, endpoint, params=None):
+        url = f"{self.base_url}{path}"
+        breaker = self.breaker_for(url)
+        retry_in = breaker.acquire()
+        if retry_in:
+            self._record(endpoint, 0.0, False, rejected=True)
+            raise CircuitOpenError(breaker.host, retry_in)
+
+        start_time = time.perf_counter()
+        success = False
+        client_error = False
+        try:
+            response = self.session.get(url, params=params, timeout=self.timeout)
+            # A client error (e.g. 404) still shows that the host is up
+            client_error = 400 <= response.status_code < 500 and response.status_code != 429
+            response.raise_for_status()  # Raises an HTTPError for bad responses
+            data = response.json()
+            success = True
+            return data
+        finally:
+            if success or client_error:
+                breaker.record_success()
+            else:
+                breaker.record_failure()
+            self._record(endpoint, time.perf_counter() - start_time, success)
+
+    def _record(self, endpoint, latency, success, rejected=False):
+        with self.stats_lock:
+            stats = self.stats.setdefault(endpoint, {"calls": 0, "errors": 0, "rejected": 0, "total_latency": 0.0, "max_latency": 0.0})
+            if rejected:
+                stats["rejected"] += 1
+                return
+            stats["calls"] += 1
+            if not success:
+                stats["errors"] += 1
+            stats["total_latency"] += latency
+            stats["max_latency"] = max(stats["max_latency"], latency)
+
+    """
+    Returns a copy of the counters with the average latency (seconds) per endpoint.
+    The counters are reset if reset is True.
+    """
+    def get_stats(self, reset=False):
+        with self.stats_lock:
+            report = {}
+            for endpoint, stats in self.stats.items():
+                report[endpoint] = dict(stats, avg_latency=stats["total_latency"] / stats["calls"] if stats["calls"] else 0.0)
+            if reset:
+                self.stats = {}
+            return report
+
+kaspa_api = KaspaApiClient(KASPA_API_BASE_URL, KASPA_API_CONNECT_TIMEOUT, KASPA_API_READ_TIMEOUT, KASPA_API_MAX_CONNECTIONS)
+
+"""
+log_kaspa_api_stats():
+Logs the Kaspa API counters (calls, errors, latency) per endpoint since the last report.
+"""
+def log_kaspa_api_stats():
+    stats = kaspa_api.get_stats(reset=True)
+    if not stats:
+        log_message("Kaspa API stats: no calls since the last report.")
+        return
+    for endpoint, endpoint_stats in stats.items():
+        log_message(f"Kaspa API stats for {endpoint}: {endpoint_stats['calls']} calls, {endpoint_stats['errors']} errors, "
+                    f"{endpoint_stats['rejected']} rejected by the circuit breaker, "
+                    f"avg latency {endpoint_stats['avg_latency'] * 1000:.0f} ms, max latency {endpoint_stats['max_latency'] * 1000:.0f} ms")
+
+"""
+backoff_delay(attempt, error=None):
+Returns the delay (seconds) before retrying a failed API call.
+
+Exponential backoff with full jitter: a random delay between 0 and
+KASPA_API_RETRY_BASE_DELAY * 2^attempt, capped at KASPA_API_RETRY_MAX_DELAY, so that retries
+of many callers do not hit the API at the same instant. The delay is never shorter than the
+Retry-After header of a 429 response, or than the time left before the circuit allows a probe.
+
+Parameters:
+- attempt (int): Number of attempts already failed, minus one (0 for the first retry)
+- error (Exception, optional): Error of the failed attempt
+"""
+def backoff_delay(attempt, error=None):
+    delay = random.uniform(0, min(KASPA_API_RETRY_MAX_DELAY, KASPA_API_RETRY_BASE_DELAY * 2 ** attempt))
+    if isinstance(error, CircuitOpenError):
+        delay = max(delay, error.retry_in)
+    elif isinstance(error, HTTPError) and error.response is not None:
+        retry_after = error.response.headers.get('Retry-After', '')
+        if retry_after.isdigit():
+            delay = max(delay, int(retry_after))
+    return max(delay, 1)
+
+"""
+schedule_retry(job_id, func, attempt, error, kwargs=None):
+Re-enqueues a failed task as a one-shot scheduler job instead of sleeping in the worker thread.
+
+The job runs after backoff_delay(attempt, error) with attempt=attempt + 1. A job with the same
+job_id replaces the pending one, so at most one retry per task is queued (a failed periodic
+run leaves an already queued retry untouched).
+After KASPA_API_MAX_RETRIES attempts, no retry is queued: the periodic run of the task takes over.
+
+Parameters:
+- job_id (str): Scheduler job ID of the retry
+- func (callable): Task to run, accepting an attempt keyword argument
+- attempt (int): Attempt that just failed (0 for the periodic run)
+- error (Exception): Error of the failed attempt
+- kwargs (dict, optional): Other keyword arguments of the task
+
+Returns:
+- bool: True if a retry was queued
+"""
+def schedule_retry(job_id, func, attempt, error, kwargs=None):
+    if attempt >= KASPA_API_MAX_RETRIES:
+        log_message(f"Maximum number of retries reached for {job_id}, waiting for the next periodic run.")
+        return False
+    delay = backoff_delay(attempt, error)
+    try:
+        if attempt == 0 and scheduler.get_job(job_id):
+            # A retry chain is already queued, keep its backoff
+            return True
+        scheduler.add_job(func=func, trigger="date", run_date=datetime.now() + timedelta(seconds=delay),
+                          kwargs=dict(kwargs or {}, attempt=attempt + 1), id=job_id, replace_existing=True,
+                          executor='minute_tasks', misfire_grace_time=None)
+    except Exception as e:
+        log_message(f"Error while scheduling the retry {job_id}: {e}")
+        return False
+    log_message(f"Retry {attempt + 1}/{KASPA_API_MAX_RETRIES} of {job_id} scheduled in {delay:.1f} seconds.")
+    return True
+
+"""
+get_recent_transactions(address, offset=0, limit=KASPA_API_PAGE_SIZE, raise_on_error=False):
+Retrieves recent transactions for an address via the shared Kaspa API client (newest first).
+
+A single attempt is made: the calling task re-enqueues itself with schedule_retry() on failure
+rather than blocking its worker thread.
 
 Parameters:
 - address (str): Kaspa address to check
-- max_retries (int): Maximum number of retry attempts
-- retry_delay (int): Delay between attempts in seconds
+- offset (int): Number of transactions to skip (used for paging)
+- limit (int): Maximum number of transactions to return
+- raise_on_error (bool): Re-raises the error instead of returning an empty list
 
 Returns:
 - list: Recent transactions or empty list in case of error
 """
-def get_recent_transactions(address, max_retries=3, retry_delay=5):
-    url = f"{KASPA_API_BASE_URL}/addresses/{address}/full-transactions"
+def get_recent_transactions(address, offset=0, limit=KASPA_API_PAGE_SIZE, raise_on_error=False):
     params = {
-        "limit": 50,
+        "limit": limit,
+        "offset": offset,
         "resolve_previous_outpoints": "light"
     }
-    
-    for attempt in range(max_retries):
-        try:
-            response = requests.get(url, params=params, timeout=50)
-            response.raise_for_status()  # Raises an HTTPError for bad responses
-            return response.json()
-        
-        except RequestException as e:
-            log_message(f"Error during attempt {attempt + 1} to retrieve transactions for address {address}: {str(e)}")
-            
-            if attempt < max_retries - 1:
-                log_message(f"Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
-            else:
-                log_message("Maximum number of attempts reached. Aborting transaction retrieval.")
-                return []
-        
-        except ValueError as e:
-            log_message(f"Error decoding JSON response for address {address}: {str(e)}")
-            return []
-        
-        except Exception as e:
-            log_message(f"Unexpected error while retrieving transactions for address {address}: {str(e)}")
-            return []
 
-    return []  # If we get here, all attempts have failed
+    try:
+        return kaspa_api.get(f"/addresses/{address}/full-transactions", "/addresses/{address}/full-transactions", params=params)
+
+    except CircuitOpenError:
+        # Already reported when the circuit opened
+        if raise_on_error:
+            raise
+        return []
+
+    except RequestException as e:
+        log_message(f"Error while retrieving transactions for address {address}: {str(e)}")
+        if raise_on_error:
+            raise
+        return []
+
+    except ValueError as e:
+        log_message(f"Error decoding JSON response for address {address}: {str(e)}")
+        if raise_on_error:
+            raise
+        return []
+
+    except Exception as e:
+        log_message(f"Unexpected error while retrieving transactions for address {address}: {str(e)}")
+        if raise_on_error:
+            raise
+        return []
+
+"""
+get_transactions_since(address, cursor_block_time, cursor_tx_id, limit=KASPA_API_PAGE_SIZE):
+Pages forward through the transactions of an address until a cursor is reached.
+
+Pages are requested newest first and paging stops at the first transaction that is
+the cursor itself or older than it, so each call only transfers new transactions.
+Without a cursor, only the first page is returned. Paging also stops after KASPA_INGEST_MAX_PAGES
+pages: the transactions between the cursor and the oldest one retrieved are then missing, and the
+caller must not advance its cursor (the next call pages again from the same cursor).
+
+Parameters:
+- address (str): Kaspa address to check
+- cursor_block_time (int): Block time (milliseconds) of the last ingested transaction, or None
+- cursor_tx_id (str): ID of the last ingested transaction, or None
+- limit (int): Page size
+
+Returns:
+- tuple: (transactions newer than the cursor (newest first), bool: True if the cursor was reached,
+  False if paging stopped at KASPA_INGEST_MAX_PAGES)
+
+Raises an exception if a page cannot be retrieved, so that the caller never
+advances its cursor over a gap.
+"""
+def get_transactions_since(address, cursor_block_time, cursor_tx_id, limit=KASPA_API_PAGE_SIZE):
+    new_transactions = []
+    seen_ids = set()
+    offset = 0
+
+    for page in range(KASPA_INGEST_MAX_PAGES):
+        transactions = get_recent_transactions(address, offset=offset, limit=limit, raise_on_error=True)
+
+        for tx in transactions:
+            if cursor_tx_id is not None and (tx['transaction_id'] == cursor_tx_id or tx['block_time'] < cursor_block_time):
+                return new_transactions, True
+            # New transactions arriving while paging shift the offsets, skip the repeated ones
+            if tx['transaction_id'] not in seen_ids:
+                seen_ids.add(tx['transaction_id'])
+                new_transactions.append(tx)
+
+        if cursor_tx_id is None or len(transactions) < limit:
+            return new_transactions, True
+        offset += limit
+
+    log_message(f"Ingestion cursor for {address} not reached after {KASPA_INGEST_MAX_PAGES} pages, "
+                f"{len(new_transactions)} transactions retrieved, cursor held back.")
+    return new_transactions, False
 """
-update_wallet_info(address, amount, tx_id, timestamp):
+update_wallet_info(address, amount, tx_id, timestamp, conn=None):
 Updates or inserts wallet information in the database.
 
 Parameters:
@@ -1377,14 +3195,17 @@ Parameters:
 - amount (float): Transaction amount
 - tx_id (str): Transaction ID
 - timestamp (float): Transaction timestamp
+- conn (sqlite3.Connection, optional): Connection of an ongoing transaction. The update is then
+  neither committed nor rolled back here, and errors are raised to the caller.
 
 Returns:
 - bool: True if successful, False otherwise
 """
-def update_wallet_info(address, amount, tx_id, timestamp):
-    conn = None
+def update_wallet_info(address, amount, tx_id, timestamp, conn=None):
+    own_connection = conn is None
     try:
-        conn = get_db_connection()
+        if own_connection:
+            conn = get_db_connection()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -1397,7 +3218,8 @@ def update_wallet_info(address, amount, tx_id, timestamp):
             last_transaction_timestamp = ?
         ''', (address, amount, tx_id, timestamp, amount, tx_id, timestamp))
         
-        conn.commit()
+        if own_connection:
+            conn.commit()
         
         # Check that the update was successful
         cursor.execute("SELECT * FROM wallets WHERE address = ?", (address,))
@@ -1411,18 +3233,22 @@ def update_wallet_info(address, amount, tx_id, timestamp):
     
     except sqlite3.Error as e:
         log_message(f"SQLite error while updating wallet information for {address}: {e}")
+        if not own_connection:
+            raise
         if conn:
             conn.rollback()
         return False
     
     except Exception as e:
         log_message(f"Unexpected error while updating wallet information for {address}: {e}")
+        if not own_connection:
+            raise
         if conn:
             conn.rollback()
         return False
     
     finally:
-        if conn:
+        if own_connection and conn:
             conn.close()
 """
 transaction_already_processed(tx_id):
@@ -1435,27 +3261,135 @@ Returns:
 - bool: True if already processed, False otherwise
 """
 def transaction_already_processed(tx_id):
+    with recent_processed_tx_lock:
+        if tx_id in recent_processed_tx_ids:
+            return True
+
     conn = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
-        
-        cursor.execute("SELECT 1 FROM processed_transactions WHERE transaction_id = ?", (tx_id,))
+
+        # Also looks in the archive: the transaction may have been processed before the archive horizon
+        cursor.execute("SELECT 1 FROM history_processed_transactions WHERE transaction_id = ?", (tx_id_to_blob(tx_id),))
         result = cursor.fetchone()
-        
+
         return result is not None
-    
+
     except sqlite3.Error as e:
         log_message(f"SQLite error while checking transaction {tx_id}: {e}")
         return False  # In case of error, we assume the transaction has not been processed
-    
+
     except Exception as e:
         log_message(f"Unexpected error while checking transaction {tx_id}: {e}")
         return False  # In case of error, we assume the transaction has not been processed
-    
+
+    finally:
+        if conn:
+            conn.close()
+
+"""
+remember_processed_transactions(tx_ids):
+Adds transaction IDs to the in-memory set of recently processed transactions.
+The oldest IDs are evicted once RECENT_TX_CACHE_SIZE is reached.
+
+Parameters:
+- tx_ids (iterable): Transaction IDs that are recorded in processed_transactions
+"""
+def remember_processed_transactions(tx_ids):
+    with recent_processed_tx_lock:
+        for tx_id in tx_ids:
+            recent_processed_tx_ids[tx_id] = True
+            recent_processed_tx_ids.move_to_end(tx_id)
+        while len(recent_processed_tx_ids) > RECENT_TX_CACHE_SIZE:
+            recent_processed_tx_ids.popitem(last=False)
+
+"""
+warm_recent_transactions_cache():
+Loads the most recently processed transaction IDs into memory at startup,
+so that the first polls can discard already seen transactions without DB round trips.
+"""
+def warm_recent_transactions_cache():
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT transaction_id FROM processed_transactions
+            ORDER BY processed_at DESC
+            LIMIT ?
+        ''', (RECENT_TX_CACHE_SIZE,))
+        # Insert oldest first so that eviction order matches processing order
+        tx_ids = [tx_id_from_blob(row['transaction_id']) for row in cursor.fetchall()]
+        remember_processed_transactions(reversed(tx_ids))
+        log_message(f"Recent transactions cache warmed with {len(tx_ids)} transaction IDs.")
+
+    except Exception as e:
+        log_message(f"Error while warming the recent transactions cache: {e}")
+
+    finally:
+        if conn:
+            conn.close()
+
+"""
+filter_unprocessed_transactions(transactions):
+Removes already processed transactions from a fetched page.
+
+IDs found in the in-memory set are discarded directly, the remaining ones are checked
+with a single set-membership query against processed_transactions. Transactions older than
+the archive horizon (see archive_history) are also looked up in the archive.
+
+Parameters:
+- transactions (list): Transactions as returned by the Kaspa API
+
+Returns:
+- list: Transactions that have not been processed yet (same order)
+"""
+def filter_unprocessed_transactions(transactions):
+    with recent_processed_tx_lock:
+        candidates = [tx for tx in transactions if tx['transaction_id'] not in recent_processed_tx_ids]
+    if not candidates:
+        return []
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        # Keys are looked up in their stored (binary) form and mapped back to the API IDs
+        candidate_ids = {tx_id_to_blob(tx['transaction_id']): tx['transaction_id'] for tx in candidates}
+        blobs = list(candidate_ids)
+        processed_ids = set()
+        # Stay well below SQLite's limit on the number of bound parameters
+        for start in range(0, len(blobs), 500):
+            chunk = blobs[start:start + 500]
+            cursor.execute(f'''
+                SELECT transaction_id FROM processed_transactions
+                WHERE transaction_id IN ({",".join("?" * len(chunk))})
+            ''', chunk)
+            processed_ids.update(candidate_ids[row['transaction_id']] for row in cursor.fetchall())
+
+        # Rows are archived on their processing time, which is later than the block time: a transaction
+        # whose block time is more than a day within the horizon cannot have been archived
+        archive_limit = (time.time() - (ARCHIVE_HORIZON_DAYS - 1) * 24 * 60 * 60) * 1000
+        old_ids = list({tx_id_to_blob(tx['transaction_id']) for tx in candidates
+                        if tx['transaction_id'] not in processed_ids and (tx.get('block_time') or 0) < archive_limit})
+        for start in range(0, len(old_ids), 500):
+            chunk = old_ids[start:start + 500]
+            cursor.execute(f'''
+                SELECT transaction_id FROM archive.processed_transactions
+                WHERE transaction_id IN ({",".join("?" * len(chunk))})
+            ''', chunk)
+            processed_ids.update(candidate_ids[row['transaction_id']] for row in cursor.fetchall())
+
+        if processed_ids:
+            remember_processed_transactions(processed_ids)
+        return [tx for tx in candidates if tx['transaction_id'] not in processed_ids]
+
     finally:
         if conn:
             conn.close()
+
 """
 format_timestamp(timestamp):
 Converts a Unix timestamp to a readable date/time string (Berlin time).
@@ -1479,7 +3413,8 @@ Parameters:
 - address (str): Owner's address
 - amount (float): Upgrade or purchase amount
 - is_buy_parcel (bool): Indicates if it's a purchase of another player's plot
-- manage_transaction (bool): Manages the SQL transaction if True
+- manage_transaction (bool): Manages the SQL transaction if True. If False, errors are raised to the caller,
+  which rolls back its transaction (or savepoint), instead of being returned as a failure result
 
 Calculates the new total amount, determines the new building type, and updates the plot's characteristics and information. Handles differently the cases of plot purchase and normal upgrades.
 
@@ -1538,8 +3473,7 @@ def upgrade_building(conn, address, amount, is_buy_parcel, current_variant=None,
                     
                     # Check max_count if applicable
                     if building['max_count'] is not None:
-                        cursor.execute('SELECT COUNT(*) FROM parcels WHERE building_type = ?', (building['name'],))
-                        count = cursor.fetchone()[0]
+                        count = get_building_count(cursor, building['name'])
                         if count >= building['max_count']:
                             log_message(f"max_count limit reached for {building['name']}")
                             continue
@@ -1561,6 +3495,8 @@ def upgrade_building(conn, address, amount, is_buy_parcel, current_variant=None,
 
         except Exception as e:
             log_message(f"Unexpected error while selecting building type: {e}")
+            if not manage_transaction:
+                raise
             return {"success": False, "message": "Error while selecting building type"}
 
         try:
@@ -1571,9 +3507,13 @@ def upgrade_building(conn, address, amount, is_buy_parcel, current_variant=None,
             new_zkaspa_production = building_info['zkaspa_production']
         except KeyError as e:
             log_message(f"Missing key in building_info: {e}")
+            if not manage_transaction:
+                raise
             return {"success": False, "message": "Incomplete building information"}
         except Exception as e:
             log_message(f"Unexpected error while extracting building information: {e}")
+            if not manage_transaction:
+                raise
             return {"success": False, "message": "Error while extracting building information"}
 
         current_time = datetime.now().timestamp()
@@ -1643,15 +3583,17 @@ def upgrade_building(conn, address, amount, is_buy_parcel, current_variant=None,
         }
     
     except sqlite3.Error as e:
-        if manage_transaction:
-            conn.rollback()
         log_message(f"SQLite error while upgrading building for address {address}: {e}")
+        if not manage_transaction:
+            raise
+        conn.rollback()
         return {"success": False, "message": "Database error during upgrade"}
     
     except Exception as e:
-        if manage_transaction:
-            conn.rollback()
         log_message(f"Unexpected error while upgrading building for address {address}: {e}")
+        if not manage_transaction:
+            raise
+        conn.rollback()
         return {"success": False, "message": "Unexpected error during upgrade"}
     
     finally:
@@ -1659,110 +3601,84 @@ def upgrade_building(conn, address, amount, is_buy_parcel, current_variant=None,
             cursor.close()
             
 """
-check_all_fees():
-Checks all plots for due fees and resets those unpaid after the grace period.
+collect_fees(cursor, current_time):
+Checks all plots for due fees and resets those unpaid after the grace period, in the transaction of the caller.
+
+Returns:
+- tuple: (parcels reset, parcels in grace period)
 """
-def check_all_fees():
-    log_message("check_all_fees function called.")
-    conn = None
-    cursor = None
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Start a transaction
-        conn.execute("BEGIN TRANSACTION")
-        
-        current_time = datetime.now().timestamp()
-        
-        # Retrieve all parcels with overdue payments
-        cursor.execute("""
-            SELECT p.id, p.owner_address, p.building_type, p.last_fee_payment, p.next_fee_date,
-                   b.fee_amount, b.fee_frequency
-            FROM parcels p
-            JOIN building_types b ON p.building_type = b.name
-            WHERE p.next_fee_date < ?
-        """, (current_time,))
-        
-        overdue_parcels = cursor.fetchall()
-        
-        parcels_reset = 0
-        parcels_grace_period = 0
-        
-        for parcel in overdue_parcels:
-            parcel_id = parcel['id']
-            address = parcel['owner_address']
-            building_type = parcel['building_type']
-            fee_amount = parcel['fee_amount']
-            fee_frequency = parcel['fee_frequency']
-            
-            grace_period_end = parcel['next_fee_date'] + timedelta(days=GRACE_PERIOD_DAYS).total_seconds()
-            
-            if not GRACE_PERIOD_ENABLED or current_time > grace_period_end:
-                # Reset the parcel
-                cursor.execute("""
-                    UPDATE parcels
-                    SET owner_address = NULL, building_type = NULL, building_variant = NULL, 
-                        purchase_amount = NULL, purchase_date = NULL, 
-                        last_fee_payment = NULL, last_fee_check = NULL,
-                        last_fee_amount = NULL, fee_frequency = NULL, next_fee_date = NULL,
-                        energy_production = 0, energy_consumption = 0,
-                        zkaspa_production = 0, zkaspa_balance = 0,
-                        is_special = 0, is_for_sale = 0, sale_price = NULL, rarity = NULL
-                    WHERE id = ?
-                """, (parcel_id,))
-                
-                if cursor.rowcount == 1:
-                    parcels_reset += 1
-                    log_message(f"Parcel {parcel_id} reset for address: {address} due to non-payment of fees.")
-                else:
-                    log_message(f"Error while resetting parcel {parcel_id} for address: {address}")
+def collect_fees(cursor, current_time):
+    # Retrieve all parcels with overdue payments
+    cursor.execute("""
+        SELECT p.id, p.owner_address, p.building_type, p.last_fee_payment, p.next_fee_date,
+               b.fee_amount, b.fee_frequency
+        FROM parcels p
+        JOIN building_types b ON p.building_type = b.name
+        WHERE p.next_fee_date < ?
+    """, (current_time,))
 
-                # Then, delete the entry from the wallets table
-                cursor.execute("""
-                    DELETE FROM wallets
-                    WHERE address = ?
-                """, (address,))
-                
-                if cursor.rowcount == 1:
-                    log_message(f"Wallet entry deleted for address: {address}")
-                else:
-                    log_message(f"No wallet entry found or error while deleting for address: {address}")
-            
-            elif GRACE_PERIOD_ENABLED:
-                # Update the last fee check
-                cursor.execute("""
-                    UPDATE parcels
-                    SET last_fee_check = ?,
-                        last_fee_amount = ?
-                    WHERE id = ?
-                """, (current_time, fee_amount, parcel_id))
-                
-                if cursor.rowcount == 1:
-                    parcels_grace_period += 1
-                    log_message(f"Parcel {parcel_id} (address: {address}) in grace period. Amount due: {fee_amount} KAS")
-                else:
-                    log_message(f"Error while updating parcel {parcel_id} for address: {address}")
-        
-        conn.commit()
-        log_message(f"Fee check completed. {parcels_reset} parcels reset, {parcels_grace_period} in grace period.")
+    overdue_parcels = cursor.fetchall()
+
+    parcels_reset = 0
+    parcels_grace_period = 0
+
+    for parcel in overdue_parcels:
+        parcel_id = parcel['id']
+        address = parcel['owner_address']
+        building_type = parcel['building_type']
+        fee_amount = parcel['fee_amount']
+        fee_frequency = parcel['fee_frequency']
+
+        grace_period_end = parcel['next_fee_date'] + timedelta(days=GRACE_PERIOD_DAYS).total_seconds()
+
+        if not GRACE_PERIOD_ENABLED or current_time > grace_period_end:
+            # Reset the parcel
+            cursor.execute("""
+                UPDATE parcels
+                SET owner_address = NULL, building_type = NULL, building_variant = NULL, 
+                    purchase_amount = NULL, purchase_date = NULL, 
+                    last_fee_payment = NULL, last_fee_check = NULL,
+                    last_fee_amount = NULL, fee_frequency = NULL, next_fee_date = NULL,
+                    energy_production = 0, energy_consumption = 0,
+                    zkaspa_production = 0, zkaspa_balance = 0,
+                    is_special = 0, is_for_sale = 0, sale_price = NULL, rarity = NULL
+                WHERE id = ?
+            """, (parcel_id,))
+
+            if cursor.rowcount == 1:
+                parcels_reset += 1
+                log_message(f"Parcel {parcel_id} reset for address: {address} due to non-payment of fees.")
+            else:
+                log_message(f"Error while resetting parcel {parcel_id} for address: {address}")
+
+            # Then, delete the entry from the wallets table
+            cursor.execute("""
+                DELETE FROM wallets
+                WHERE address = ?
+            """, (address,))
+
+            if cursor.rowcount == 1:
+                log_message(f"Wallet entry deleted for address: {address}")
+            else:
+                log_message(f"No wallet entry found or error while deleting for address: {address}")
+
+        elif GRACE_PERIOD_ENABLED:
+            # Update the last fee check
+            cursor.execute("""
+                UPDATE parcels
+                SET last_fee_check = ?,
+                    last_fee_amount = ?
+                WHERE id = ?
+            """, (current_time, fee_amount, parcel_id))
+
+            if cursor.rowcount == 1:
+                parcels_grace_period += 1
+                log_message(f"Parcel {parcel_id} (address: {address}) in grace period. Amount due: {fee_amount} KAS")
+            else:
+                log_message(f"Error while updating parcel {parcel_id} for address: {address}")
+
+    return parcels_reset, parcels_grace_period
 
-    except sqlite3.Error as e:
-        log_message(f"SQLite error during fee check: {e}")
-        if conn:
-            conn.rollback()
-    
-    except Exception as e:
-        log_message(f"Unexpected error during fee check: {e}")
-        if conn:
-            conn.rollback()
-    
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
-  
 """
 is_kasland_full():
 Checks if all plots in KasLand are occupied.
@@ -1776,11 +3692,9 @@ def is_kasland_full():
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        cursor.execute("SELECT COUNT(*) FROM parcels")
-        total_parcels = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM parcels WHERE owner_address IS NOT NULL")
-        occupied_parcels = cursor.fetchone()[0]
+        # Counters materialized by the parcel triggers (see migrate_parcel_counters)
+        cursor.execute("SELECT total, occupied FROM parcel_occupancy WHERE id = 1")
+        total_parcels, occupied_parcels = cursor.fetchone()
         
         return total_parcels == occupied_parcels
 
@@ -1792,212 +3706,364 @@ def is_kasland_full():
         if conn:
             conn.close()
 """
-generate_random_event():
-Randomly generates events affecting energy and zkaspa production.
+EventEffectsCache:
+Process-wide cache of the current event effects (see get_current_event_effects), so that the production
+computations made per API request do not query the events table.
+
+An entry is valid until the end of the active event or, without an active event, until the next daily
+event roll (see next_event_roll_time). run_end_of_day invalidates the cache after each committed day.
+A lookup that started before an invalidation does not store its (possibly stale) result.
 """
-def generate_random_event():
-    conn = None
-    try:
-        current_time = time.time()
-        event_duration = 24 * 60 * 60  # 24 hours in seconds
-
-        total_event_chance = 0.33  # 33% chance that an event will occur
-
-        events = [
-            {
-                "type": "solar_flare",
-                "description": "A solar flare has caused a general blackout! Energy production is interrupted for 24 hours.",
-                "probability": 0.05, 
-                "energy_multiplier": 0.0,
-                "zkaspa_multiplier": 1
-            },
-            {
-                "type": "maintenance",
-                "description": "Electrical grid maintenance in progress. Energy production is reduced by 75% for 24 hours.",
-                "probability": 0.1, 
-                "energy_multiplier": 0.25,
-                "zkaspa_multiplier": 1
-            },
-            {
-                "type": "energy_surge",
-                "description": "Power surge! Some lines are damaged. Energy production is reduced by 50% for 24 hours.",
-                "probability": 0.1,
-                "energy_multiplier": 0.5,
-                "zkaspa_multiplier": 1
-            },
-            {
-                "type": "windy_weather",
-                "description": "Strong winds boost wind turbine production! Energy production is increased by 25% for 24 hours.",
-                "probability": 0.1,
-                "energy_multiplier": 1.25,  
-                "zkaspa_multiplier": 1
-            },
-            {
-                "type": "power_failure",
-                "description": "A major power outage! Energy production drops by 80% for 24 hours.",
-                "probability": 0.1,
-                "energy_multiplier": 0.2,
-                "zkaspa_multiplier": 1
-            },
-            {
-                "type": "natural_disaster",
-                "description": "A natural disaster strikes! Energy and zkaspa production is reduced by 75% for 24 hours.",
-                "probability": 0.05,
-                "energy_multiplier": 0.25,
-                "zkaspa_multiplier": 0.25  
-            },
-            {
-                "type": "mining_difficulty_spike",
-                "description": "Sudden increase in mining difficulty! Zkaspa production decreases by 60% for 24 hours.",
-                "probability": 0.08,
-                "energy_multiplier": 1,
-                "zkaspa_multiplier": 0.4
-            },
-            {
-                "type": "technical_glitch",
-                "description": "A critical bug in mining software reduces zkaspa production by 50% for 24 hours.",
-                "probability": 0.08,
-                "energy_multiplier": 1,
-                "zkaspa_multiplier": 0.5
-            },
-            {
-                "type": "economic_crisis",
-                "description": "A severe economic crisis hits the crypto market! Zkaspa production falls by 70% for 24 hours.",
-                "probability": 0.05,
-                "energy_multiplier": 1,
-                "zkaspa_multiplier": 0.3
-            },
-            {
-                "type": "mining_hardware_shortage",
-                "description": "Global shortage of mining hardware components! Zkaspa production decreases by 45% for 24 hours.",
-                "probability": 0.06,
-                "energy_multiplier": 1,
-                "zkaspa_multiplier": 0.55
-            }
-        ]
+class EventEffectsCache:
+    def __init__(self):
+        self.effects = None
+        self.expires_at = 0.0
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    """
+    Returns (effects, generation): a copy of the cached effects, or None if there is no valid entry,
+    and the generation to pass to store() after the effects have been read from the database.
+    """
+    def lookup(self, now):
+        with self.lock:
+            if self.effects is not None and now < self.expires_at:
+                return dict(self.effects), self.generation
+            return None, self.generation
+
+    def store(self, effects, expires_at, generation):
+        with self.lock:
+            if generation == self.generation:
+                self.effects = dict(effects)
+                self.expires_at = expires_at
+
+    def invalidate(self):
+        with self.lock:
+            self.generation += 1
+            self.effects = None
+            self.expires_at = 0.0
+
+event_effects_cache = EventEffectsCache()
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
+"""
+next_event_roll_time(now):
+Returns the timestamp of the next daily event roll (run_end_of_day rolls the event of the new day at midnight).
+"""
+def next_event_roll_time(now):
+    return (datetime.fromtimestamp(now) + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+
+"""
+roll_random_event(cursor, current_time):
+Randomly generates an event affecting energy and zkaspa production, in the transaction of the caller
+(no new event while one is in progress). The caller invalidates event_effects_cache after its commit.
+
+Returns:
+- dict: The selected event, None if no event was generated
+"""
+def roll_random_event(cursor, current_time):
+    event_duration = 24 * 60 * 60  # 24 hours in seconds
+
+    total_event_chance = 0.33  # 33% chance that an event will occur
+
+    events = [
+        {
+            "type": "solar_flare",
+            "description": "A solar flare has caused a general blackout! Energy production is interrupted for 24 hours.",
+            "probability": 0.05, 
+            "energy_multiplier": 0.0,
+            "zkaspa_multiplier": 1
+        },
+        {
+            "type": "maintenance",
+            "description": "Electrical grid maintenance in progress. Energy production is reduced by 75% for 24 hours.",
+            "probability": 0.1, 
+            "energy_multiplier": 0.25,
+            "zkaspa_multiplier": 1
+        },
+        {
+            "type": "energy_surge",
+            "description": "Power surge! Some lines are damaged. Energy production is reduced by 50% for 24 hours.",
+            "probability": 0.1,
+            "energy_multiplier": 0.5,
+            "zkaspa_multiplier": 1
+        },
+        {
+            "type": "windy_weather",
+            "description": "Strong winds boost wind turbine production! Energy production is increased by 25% for 24 hours.",
+            "probability": 0.1,
+            "energy_multiplier": 1.25,  
+            "zkaspa_multiplier": 1
+        },
+        {
+            "type": "power_failure",
+            "description": "A major power outage! Energy production drops by 80% for 24 hours.",
+            "probability": 0.1,
+            "energy_multiplier": 0.2,
+            "zkaspa_multiplier": 1
+        },
+        {
+            "type": "natural_disaster",
+            "description": "A natural disaster strikes! Energy and zkaspa production is reduced by 75% for 24 hours.",
+            "probability": 0.05,
+            "energy_multiplier": 0.25,
+            "zkaspa_multiplier": 0.25  
+        },
+        {
+            "type": "mining_difficulty_spike",
+            "description": "Sudden increase in mining difficulty! Zkaspa production decreases by 60% for 24 hours.",
+            "probability": 0.08,
+            "energy_multiplier": 1,
+            "zkaspa_multiplier": 0.4
+        },
+        {
+            "type": "technical_glitch",
+            "description": "A critical bug in mining software reduces zkaspa production by 50% for 24 hours.",
+            "probability": 0.08,
+            "energy_multiplier": 1,
+            "zkaspa_multiplier": 0.5
+        },
+        {
+            "type": "economic_crisis",
+            "description": "A severe economic crisis hits the crypto market! Zkaspa production falls by 70% for 24 hours.",
+            "probability": 0.05,
+            "energy_multiplier": 1,
+            "zkaspa_multiplier": 0.3
+        },
+        {
+            "type": "mining_hardware_shortage",
+            "description": "Global shortage of mining hardware components! Zkaspa production decreases by 45% for 24 hours.",
+            "probability": 0.06,
+            "energy_multiplier": 1,
+            "zkaspa_multiplier": 0.55
+        }
+    ]
+
+    cursor.execute('''
+        SELECT * FROM events 
+        WHERE end_time > ?
+    ''', (current_time,))
+
+    existing_event = cursor.fetchone()
+
+    if existing_event:
+        log_message("An event is already in progress. No new event generated.")
+        return None
 
+    # Calculate the total event probability (sum of weights)
+    total_event_weight = sum(event['probability'] for event in events)
+
+    # Determine if an event occurs
+    if random.random() < total_event_chance:
+        # Select an event based on relative weights
+        event_weights = [event['probability'] / total_event_weight for event in events]
+        selected_event = random.choices(events, weights=event_weights, k=1)[0]
+
+        # Insert the selected event into the database
         cursor.execute('''
-            SELECT * FROM events 
-            WHERE end_time > ?
-        ''', (current_time,))
+            INSERT INTO events (event_type, start_time, end_time, description, energy_multiplier, zkaspa_multiplier)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (selected_event['type'], current_time, current_time + event_duration, selected_event['description'], 
+              selected_event['energy_multiplier'], selected_event['zkaspa_multiplier']))
 
-        existing_event = cursor.fetchone()
+        log_message(f"New event generated: {selected_event['type']}")
+        return selected_event
 
-        if existing_event:
-            log_message("An event is already in progress. No new event generated.")
-            return
+    log_message("No new event generated today.")
+    return None
+
+"""
+read_event_effects(cursor, current_time):
+Reads the effects of the event active at current_time with the given cursor (hence within its transaction).
+
+Returns:
+- tuple: (effects dict as returned by get_current_event_effects, time until which they are valid)
+"""
+def read_event_effects(cursor, current_time):
+    cursor.execute('''
+        SELECT event_type, energy_multiplier, zkaspa_multiplier, end_time
+        FROM events 
+        WHERE ? BETWEEN start_time AND end_time
+        ORDER BY start_time DESC
+        LIMIT 1
+    ''', (current_time,))
+    
+    current_event = cursor.fetchone()
+    
+    if current_event:
+        effects = {
+            "event_type": current_event['event_type'],
+            "energy_multiplier": current_event['energy_multiplier'],
+            "zkaspa_multiplier": current_event['zkaspa_multiplier']
+        }
+        return effects, current_event['end_time']
 
-        # Calculate the total event probability (sum of weights)
-        total_event_weight = sum(event['probability'] for event in events)
+    effects = {
+        "event_type": None,
+        "energy_multiplier": 1.0,
+        "zkaspa_multiplier": 1.0
+    }
+    return effects, next_event_roll_time(current_time)
 
-        # Determine if an event occurs
-        if random.random() < total_event_chance:
-            # Select an event based on relative weights
-            event_weights = [event['probability'] / total_event_weight for event in events]
-            selected_event = random.choices(events, weights=event_weights, k=1)[0]
+"""
+get_current_event_effects(log_execution=True):
+Retrieves the effects of the current event in the game.
+Served from event_effects_cache while the active event (or the absence of event) has not changed.
 
-            # Insert the selected event into the database
-            cursor.execute('''
-                INSERT INTO events (event_type, start_time, end_time, description, energy_multiplier, zkaspa_multiplier)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (selected_event['type'], current_time, current_time + event_duration, selected_event['description'], 
-                  selected_event['energy_multiplier'], selected_event['zkaspa_multiplier']))
-            
-            conn.commit()
-            log_message(f"New event generated: {selected_event['type']}")
-            return
-        else:
-            log_message("No new event generated today.")
+Parameters:
+- log_execution (bool): Activates logging if True
 
-    except Exception as e:
-        if conn:
-            conn.rollback()
-        log_message(f"Error while generating a random event: {e}")
+Returns:
+- dict: Current energy and zkaspa multipliers
+"""
+def get_current_event_effects(log_execution=True):
+    if log_execution:
+        log_message("get_current_event_effects function called.")
+    current_time = time.time()
+    cached_effects, generation = event_effects_cache.lookup(current_time)
+    if cached_effects is not None:
+        return cached_effects
 
+    conn = None
+    try:
+        # Read from the live database, not from an API read snapshot that may predate the last event
+        conn = db_pool.acquire() if DB_POOL_ENABLED else get_db_connection()
+        effects, expires_at = read_event_effects(conn.cursor(), current_time)
+        event_effects_cache.store(effects, expires_at, generation)
+        return effects
+    
+    except Exception as e:
+        log_message(f"Error while retrieving current event effects: {e}")
+        return {
+            "event_type": None,
+            "energy_multiplier": 1.0,
+            "zkaspa_multiplier": 1.0
+        }
+    
     finally:
         if conn:
             conn.close()
-            
+
 """
-get_current_event_effects(log_execution=True):
-Retrieves the effects of the current event in the game.
+Calculates total zkaspa and energy production for all parcels.
+
+Considers current event effects, building rarity, and special bonuses (e.g., wind turbines).
+Sets zkaspa production to zero if energy production is insufficient.
+
+The base production of the parcels is read from production_totals (one row per rarity tier and wind
+turbine flag, kept by triggers, see migrate_production_totals), so the cost does not depend on the
+number of parcels. calculate_production_from_parcels() is the reference computation over every parcel.
 
 Parameters:
-- log_execution (bool): Activates logging if True
+- conn (sqlite3.Connection, optional): Database connection
+- cursor (sqlite3.Cursor, optional): Database cursor
+- log_execution (bool): If True, logs detailed execution information
+- event_effects (dict, optional): Event effects to apply instead of the current ones (get_current_event_effects)
+
+Returns:
+- dict: Contains total energy production/consumption, zkaspa production, 
+        current event type and multipliers. Returns default values if an error occurs.
+"""
+def calculate_production(conn=None, cursor=None, log_execution=True, event_effects=None):
+    if log_execution:
+        log_message("calculate_production function called")
+    own_connection = cursor is None
+    try:
+        if own_connection:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+
+        if event_effects is None:
+            event_effects = get_current_event_effects(log_execution=False)
+        energy_multiplier = event_effects['energy_multiplier']
+        zkaspa_multiplier = event_effects['zkaspa_multiplier']
+
+        cursor.execute("SELECT * FROM production_totals WHERE parcels > 0")
+        totals = cursor.fetchall()
+
+        total_energy_production = 0.0
+        total_energy_consumption = 0.0
+        total_zkaspa_production = 0.0
+
+        for tier in totals:
+            rarity_multiplier = RARITY_MULTIPLIERS[tier['rarity']]
+            adjusted_energy_production = tier['energy_production'] * energy_multiplier
+            adjusted_zkaspa_production = tier['zkaspa_production'] * energy_multiplier * zkaspa_multiplier * rarity_multiplier
+            # Bonus spécial pour les éoliennes
+            if tier['wind_turbine']:
+                adjusted_zkaspa_production *= WIND_TURBINE_BONUS
+
+            total_energy_production += adjusted_energy_production
+            total_energy_consumption += tier['energy_consumption']
+            total_zkaspa_production += adjusted_zkaspa_production
+
+            if log_execution:
+                log_message(f"Rarity {tier['rarity']}{' (wind turbines)' if tier['wind_turbine'] else ''}: {tier['parcels']} parcels, "
+                            f"Energy prod: {adjusted_energy_production:.2f}, "
+                            f"Energy cons: {tier['energy_consumption']:.2f}, "
+                            f"zkaspa prod: {adjusted_zkaspa_production:.2f}")
+
+        # Vérifier s'il y a un déficit énergétique et ajuster la production de zkaspa en conséquence
+        if total_energy_production < total_energy_consumption:
+            total_zkaspa_production = 0.0
+            if log_execution:
+                log_message("Energy deficit detected. zkaspa production set to zero.")
+
+        if log_execution:
+            log_message(f"Total production: Energy: {total_energy_production:.2f}, "
+                        f"Consumption: {total_energy_consumption:.2f}, zkaspa: {total_zkaspa_production:.2f}")
+            log_message(f"Current event: {event_effects['event_type']}, "
+                        f"Energy multiplier: {energy_multiplier}, zkaspa: {zkaspa_multiplier}")
+
+        return {
+            "energy_production": total_energy_production,
+            "energy_consumption": total_energy_consumption,
+            "zkaspa_production": total_zkaspa_production,
+            "event_type": event_effects['event_type'],
+            "energy_multiplier": energy_multiplier,
+            "zkaspa_multiplier": zkaspa_multiplier
+        }
 
-Returns:
-- dict: Current energy and zkaspa multipliers
-"""
-def get_current_event_effects(log_execution=True):
-    if log_execution:
-        log_message("get_current_event_effects function called.")
-    conn = None
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        current_time = time.time()
-        cursor.execute('''
-            SELECT event_type, energy_multiplier, zkaspa_multiplier
-            FROM events 
-            WHERE ? BETWEEN start_time AND end_time
-            ORDER BY start_time DESC
-            LIMIT 1
-        ''', (current_time,))
-        
-        current_event = cursor.fetchone()
-        
-        if current_event:
-            return {
-                "event_type": current_event['event_type'],
-                "energy_multiplier": current_event['energy_multiplier'],
-                "zkaspa_multiplier": current_event['zkaspa_multiplier']
-            }
-        else:
-            return {
-                "event_type": None,
-                "energy_multiplier": 1.0,
-                "zkaspa_multiplier": 1.0
-            }
-    
     except Exception as e:
-        log_message(f"Error while retrieving current event effects: {e}")
+        log_message(f"Error during production calculation: {e}")
         return {
+            "energy_production": 0.0,
+            "energy_consumption": 0.0,
+            "zkaspa_production": 0.0,
             "event_type": None,
             "energy_multiplier": 1.0,
             "zkaspa_multiplier": 1.0
         }
-    
+
     finally:
-        if conn:
+        if own_connection and conn:
             conn.close()
 
 """
-Calculates total zkaspa and energy production for all parcels.
-
-Considers current event effects, building rarity, and special bonuses (e.g., wind turbines).
-Sets zkaspa production to zero if energy production is insufficient.
-
-Parameters:
-- conn (sqlite3.Connection, optional): Database connection
-- cursor (sqlite3.Cursor, optional): Database cursor
-- log_execution (bool): If True, logs detailed execution information
-
-Returns:
-- dict: Contains total energy production/consumption, zkaspa production, 
-        current event type and multipliers. Returns default values if an error occurs.
+calculate_production_from_parcels(cursor, log_execution=False, engine='python'):
+Reference computation of calculate_production: reads every parcel with its variant and recomputes the
+rarity of each one. Used to check the production aggregates; same result as calculate_production.
+With engine='numpy' (and log_execution False), the totals are computed on the columns of load_production_columns().
 """
-def calculate_production(conn=None, cursor=None, log_execution=True):
-    if log_execution:
-        log_message("calculate_production function called")
+def calculate_production_from_parcels(cursor, log_execution=False, engine='python'):
     try:
         event_effects = get_current_event_effects(log_execution=False)
         energy_multiplier = event_effects['energy_multiplier']
         zkaspa_multiplier = event_effects['zkaspa_multiplier']
 
+        if resolve_production_engine(engine) == 'numpy' and not log_execution:
+            columns = load_production_columns(cursor)
+            total_energy_production = float((columns['energy_production'] * energy_multiplier).sum())
+            total_energy_consumption = float(columns['energy_consumption'].sum())
+            total_zkaspa_production = float(zkaspa_credits_from_columns(columns, energy_multiplier, zkaspa_multiplier).sum())
+            return {
+                "energy_production": total_energy_production,
+                "energy_consumption": total_energy_consumption,
+                "zkaspa_production": total_zkaspa_production if total_energy_production >= total_energy_consumption else 0.0,
+                "event_type": event_effects['event_type'],
+                "energy_multiplier": energy_multiplier,
+                "zkaspa_multiplier": zkaspa_multiplier
+            }
+
         # Récupérer toutes les parcelles avec leurs variantes et probabilités
         cursor.execute('''
             SELECT p.id, p.building_type, p.building_variant,
@@ -2078,111 +4144,192 @@ def calculate_production(conn=None, cursor=None, log_execution=True):
         }
 
 """
-Distributes zkaspa daily to plots based on their production and various factors.
+resolve_production_engine(engine=None):
+Returns the engine computing the per-parcel production: engine (PRODUCTION_ENGINE by default), or 'python'
+(the reference loop) when 'numpy' is requested but NumPy is not installed.
+"""
+def resolve_production_engine(engine=None):
+    engine = engine or PRODUCTION_ENGINE
+    if engine == 'numpy' and numpy is None:
+        return 'python'
+    return engine
 
-This function:
-1. Calculates the total energy production and consumption.
-2. If production meets or exceeds consumption:
-   - Retrieves all parcels with their building types and variants.
-   - Calculates adjusted zkaspa production for each parcel based on:
-     * Base zkaspa production
-     * Current event's energy and zkaspa multipliers
-     * Building variant rarity multiplier
-     * Special bonus for wind turbines
-   - Updates zkaspa balance for each parcel.
-3. Logs the distribution process and results.
+"""
+load_production_columns(cursor):
+Loads the producing parcels (those with a known variant, as in calculate_production_from_parcels) as NumPy arrays.
 
 Returns:
-- tuple: Distribution statistics or None in case of error
+- dict: 'id', 'zkaspa_balance', 'energy_production', 'energy_consumption', 'zkaspa_production' (base values,
+        NULL read as 0), 'rarity_multiplier' (of the variant, see refresh_variant_rarity) and 'wind_turbine' (bool),
+        one entry per parcel
 """
-def distribute_zkaspa():
-    log_message("distribute_zkaspa function called.")
-    conn = None
-    cursor = None
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # Démarrer une transaction
-        conn.execute("BEGIN TRANSACTION")
+def load_production_columns(cursor):
+    # Plain tuples, converted in one call instead of reading sqlite3.Row objects one field at a time
+    columns_cursor = cursor.connection.cursor()
+    columns_cursor.row_factory = None
+    columns_cursor.execute('''
+        SELECT p.id, COALESCE(p.zkaspa_balance, 0), COALESCE(p.energy_production, 0), COALESCE(p.energy_consumption, 0),
+               COALESCE(p.zkaspa_production, 0), bv.rarity_multiplier, substr(p.building_type, 1, 12) = 'wind_turbine'
+        FROM parcels p
+        JOIN building_variants bv
+            ON p.building_type = bv.building_type AND p.building_variant = bv.variant
+        WHERE p.building_type IS NOT NULL
+    ''')
+    data = numpy.array(columns_cursor.fetchall(), dtype=numpy.float64).reshape(-1, 7)
+    return {
+        "id": data[:, 0].astype(numpy.int64),
+        "zkaspa_balance": data[:, 1],
+        "energy_production": data[:, 2],
+        "energy_consumption": data[:, 3],
+        "zkaspa_production": data[:, 4],
+        "rarity_multiplier": data[:, 5],
+        "wind_turbine": data[:, 6] != 0,
+    }
 
-        current_time = time.time()
-        current_date = datetime.fromtimestamp(current_time).date()
+"""
+zkaspa_credits_from_columns(columns, energy_multiplier, zkaspa_multiplier):
+Returns the adjusted zkaspa production of each parcel of load_production_columns() (NumPy array),
+with the same factors as the reference loop: event multipliers, rarity multiplier and wind turbine bonus.
+"""
+def zkaspa_credits_from_columns(columns, energy_multiplier, zkaspa_multiplier):
+    credits = columns['zkaspa_production'] * energy_multiplier * zkaspa_multiplier * columns['rarity_multiplier']
+    return numpy.where(columns['wind_turbine'], credits * WIND_TURBINE_BONUS, credits)
 
-        production = calculate_production(conn, cursor)
+"""
+compute_zkaspa_credits(cursor, energy_multiplier, zkaspa_multiplier, engine=None):
+Computes the daily zkaspa credit of every producing parcel (see credit_daily_zkaspa).
 
-        log_message(f"Current event: {production['event_type']}. Energy multiplier: {production['energy_multiplier']}, zkaspa multiplier: {production['zkaspa_multiplier']}")
-        log_message(f"Total production: {production['energy_production']}, Consumption: {production['energy_consumption']}")
+Parameters:
+- cursor (sqlite3.Cursor): Database cursor
+- energy_multiplier, zkaspa_multiplier (float): Multipliers of the current event
+- engine (str, optional): 'numpy' or 'python' (reference loop), PRODUCTION_ENGINE by default
 
-        if production['energy_production'] >= production['energy_consumption']:
-            # Récupérer toutes les parcelles avec leurs variantes et probabilités
-            cursor.execute('''
-                SELECT p.id, p.zkaspa_balance, p.zkaspa_production, p.building_type, p.building_variant,
-                       bv.probability
-                FROM parcels p
-                JOIN building_variants bv
-                    ON p.building_type = bv.building_type AND p.building_variant = bv.variant
-                WHERE p.building_type IS NOT NULL
-            ''')
+Returns:
+- tuple: ([(new zkaspa balance, parcel id), ...], total zkaspa credited)
+"""
+def compute_zkaspa_credits(cursor, energy_multiplier, zkaspa_multiplier, engine=None):
+    if resolve_production_engine(engine) == 'numpy':
+        columns = load_production_columns(cursor)
+        credits = zkaspa_credits_from_columns(columns, energy_multiplier, zkaspa_multiplier)
+        new_balances = columns['zkaspa_balance'] + credits
+        return list(zip(new_balances.tolist(), columns['id'].tolist())), float(credits.sum())
+
+    # Récupérer toutes les parcelles avec le multiplicateur de rareté de leur variante
+    cursor.execute('''
+        SELECT p.id, p.zkaspa_balance, p.zkaspa_production, p.building_type, p.building_variant,
+               bv.rarity_multiplier
+        FROM parcels p
+        JOIN building_variants bv
+            ON p.building_type = bv.building_type AND p.building_variant = bv.variant
+        WHERE p.building_type IS NOT NULL
+    ''')
 
-            parcels = cursor.fetchall()
+    parcels = cursor.fetchall()
 
-            total_zkaspa_distributed = 0.0
-            parcels_update_data = []
+    total_zkaspa_distributed = 0.0
+    parcels_update_data = []
 
-            for parcel in parcels:
-                zkaspa_balance = parcel['zkaspa_balance'] or 0.0
-                zkaspa_production = parcel['zkaspa_production'] or 0.0
-                probability = parcel['probability']
+    for parcel in parcels:
+        zkaspa_balance = parcel['zkaspa_balance'] or 0.0
+        zkaspa_production = parcel['zkaspa_production'] or 0.0
+        rarity_multiplier = parcel['rarity_multiplier']
 
-                # Déterminer la rareté et le multiplicateur
-                rarity, rarity_multiplier = determine_rarity_and_multiplier(probability)
+        # Calculer la production ajustée de zkaspa
+        adjusted_zkaspa_production = zkaspa_production * energy_multiplier * zkaspa_multiplier * rarity_multiplier
 
-                # Calculer la production ajustée de zkaspa
-                adjusted_zkaspa_production = zkaspa_production * production['energy_multiplier'] * production['zkaspa_multiplier'] * rarity_multiplier
+        # Bonus spécial pour les éoliennes
+        if parcel['building_type'].startswith('wind_turbine'):
+            adjusted_zkaspa_production *= WIND_TURBINE_BONUS
 
-                # Bonus spécial pour les éoliennes
-                if parcel['building_type'].startswith('wind_turbine'):
-                    adjusted_zkaspa_production *= WIND_TURBINE_BONUS
+        # Mettre à jour le solde zkaspa de la parcelle
+        new_zkaspa_balance = zkaspa_balance + adjusted_zkaspa_production
 
-                # Mettre à jour le solde zkaspa de la parcelle
-                new_zkaspa_balance = zkaspa_balance + adjusted_zkaspa_production
+        total_zkaspa_distributed += adjusted_zkaspa_production
 
-                total_zkaspa_distributed += adjusted_zkaspa_production
+        parcels_update_data.append((new_zkaspa_balance, parcel['id']))
 
-                parcels_update_data.append((new_zkaspa_balance, parcel['id']))
+    return parcels_update_data, total_zkaspa_distributed
 
-            # Mettre à jour les parcelles en une seule opération
-            cursor.executemany('''
-                UPDATE parcels
-                SET zkaspa_balance = ?
-                WHERE id = ?
-            ''', parcels_update_data)
+"""
+zkaspa_distribution_sql(energy_multiplier, zkaspa_multiplier):
+Builds the set-based distribution (see apply_zkaspa_distribution): the aggregate of the credits and the UPDATE
+of the balances, with the rarity multiplier stored with each variant (building_variants.rarity_multiplier).
+The credit is computed with the same operations, in the same order, as compute_zkaspa_credits (the wind
+turbine factor of the other buildings is 1.0, which leaves the product unchanged).
 
-            conn.commit()
-            log_message(f"zkaspa distribution completed. {len(parcels_update_data)} parcels updated. Total zkaspa distributed: {total_zkaspa_distributed}")
+Returns:
+- tuple: (aggregate query, update query, parameters of both)
+"""
+def zkaspa_distribution_sql(energy_multiplier, zkaspa_multiplier):
+    parameters = [energy_multiplier, zkaspa_multiplier, WIND_TURBINE_BONUS]
+
+    # Correlated lookups: the parcels are scanned once and each one finds its variant through the unique index
+    variant_match = "bv.building_type = parcels.building_type AND bv.variant = parcels.building_variant"
+    multiplier = f"(SELECT bv.rarity_multiplier FROM building_variants bv WHERE {variant_match})"
+    credit = (f"COALESCE(parcels.zkaspa_production, 0.0) * ? * ? * {multiplier}"
+              f" * CASE WHEN substr(parcels.building_type, 1, 12) = 'wind_turbine' THEN ? ELSE 1.0 END")
+    producing = f"parcels.building_type IS NOT NULL AND EXISTS (SELECT 1 FROM building_variants bv WHERE {variant_match})"
+    aggregate = f"SELECT COUNT(*), COALESCE(SUM({credit}), 0.0) FROM parcels WHERE {producing}"
+    update = f"UPDATE parcels SET zkaspa_balance = COALESCE(zkaspa_balance, 0.0) + {credit} WHERE {producing}"
+    return aggregate, update, parameters
 
-        else:
-            log_message(f"Not enough energy produced. Production: {production['energy_production']}, Consumption: {production['energy_consumption']}. No zkaspa distributed today.")
+"""
+apply_zkaspa_distribution(cursor, energy_multiplier, zkaspa_multiplier):
+Credits the daily zkaspa of every producing parcel with a single UPDATE, without reading the parcels into Python.
+The number of credited parcels and the total are read first with an aggregate over the same credits, in the
+transaction of the caller. Same balances as compute_zkaspa_credits (the reference), written back by executemany.
 
-            # Même si aucune zkaspa n'a été distribuée, il est important de confirmer la transaction
-            conn.commit()
+Returns:
+- tuple: (number of parcels credited, total zkaspa credited)
+"""
+def apply_zkaspa_distribution(cursor, energy_multiplier, zkaspa_multiplier):
+    aggregate, update, parameters = zkaspa_distribution_sql(energy_multiplier, zkaspa_multiplier)
+    cursor.execute(aggregate, parameters)
+    credited_parcels, total_zkaspa_distributed = cursor.fetchone()
+    cursor.execute(update, parameters)
+    return credited_parcels, total_zkaspa_distributed
 
-    except sqlite3.Error as e:
-        log_message(f"SQLite error during zkaspa distribution: {e}")
-        if conn:
-            conn.rollback()
+"""
+credit_daily_zkaspa(cursor, production):
+Distributes the daily zkaspa to the plots for the production computed by calculate_production, in the transaction
+of the caller (distribution stage of run_end_of_day). Nothing is credited when the energy production does not
+cover the consumption. Otherwise the balance of each producing parcel is credited with its adjusted zkaspa production:
+- Base zkaspa production
+- Energy and zkaspa multipliers of the event
+- Building variant rarity multiplier
+- Special bonus for wind turbines
+with a single UPDATE (ZKASPA_DISTRIBUTION_SQL, see apply_zkaspa_distribution), or computed by compute_zkaspa_credits
+and written back parcel by parcel.
 
-    except Exception as e:
-        log_message(f"Unexpected error during zkaspa distribution: {e}")
-        if conn:
-            conn.rollback()
+Returns:
+- tuple: (parcels updated, total zkaspa distributed), (0, 0.0) without distribution
+"""
+def credit_daily_zkaspa(cursor, production):
+    log_message(f"Current event: {production['event_type']}. Energy multiplier: {production['energy_multiplier']}, zkaspa multiplier: {production['zkaspa_multiplier']}")
+    log_message(f"Total production: {production['energy_production']}, Consumption: {production['energy_consumption']}")
+
+    if production['energy_production'] < production['energy_consumption']:
+        log_message(f"Not enough energy produced. Production: {production['energy_production']}, Consumption: {production['energy_consumption']}. No zkaspa distributed today.")
+        return 0, 0.0
+
+    if ZKASPA_DISTRIBUTION_SQL:
+        # Un seul UPDATE, sans lire les parcelles en Python
+        updated_parcels, total_zkaspa_distributed = apply_zkaspa_distribution(
+            cursor, production['energy_multiplier'], production['zkaspa_multiplier'])
+    else:
+        parcels_update_data, total_zkaspa_distributed = compute_zkaspa_credits(
+            cursor, production['energy_multiplier'], production['zkaspa_multiplier'])
+
+        # Mettre à jour les parcelles en une seule opération
+        cursor.executemany('''
+            UPDATE parcels
+            SET zkaspa_balance = ?
+            WHERE id = ?
+        ''', parcels_update_data)
+        updated_parcels = len(parcels_update_data)
 
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
+    log_message(f"zkaspa distribution completed. {updated_parcels} parcels updated. Total zkaspa distributed: {total_zkaspa_distributed}")
+    return updated_parcels, total_zkaspa_distributed
 
 """
 calculate_predicted_zkaspa_production():
@@ -2213,71 +4360,173 @@ def calculate_predicted_zkaspa_production():
             conn.close()
 
 """
-save_daily_stats():
-   Records daily statistics on energy and zkaspa production.
+record_daily_stats(cursor, stats_date, production_previous, production_current):
+Records the daily statistics of stats_date in the transaction of the caller: the production of the day that
+just ended (production_previous) and the zkaspa prediction with the event of the new day (production_current).
+
+Returns:
+- float: Current total zkaspa
+"""
+def record_daily_stats(cursor, stats_date, production_previous, production_current):
+    # Calculate total zkaspa
+    cursor.execute('SELECT SUM(zkaspa_balance) as total_zkaspa FROM parcels')
+    total_zkaspa = cursor.fetchone()['total_zkaspa'] or 0
+
+    # calculate_production sets the zkaspa production to zero on an energy deficit (see calculate_predicted_zkaspa_production)
+    predicted_zkaspa = production_current['zkaspa_production']
+
+    # Insert statistics into the database
+    cursor.execute('''
+        INSERT OR REPLACE INTO daily_stats
+        (date, total_energy_production, total_energy_consumption, total_zkaspa, predicted_zkaspa_production, actual_zkaspa_production)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (stats_date, production_previous['energy_production'], production_previous['energy_consumption'],
+          total_zkaspa, predicted_zkaspa, production_previous['zkaspa_production']))
+
+    log_message(f"Daily statistics successfully recorded for {stats_date}:")
+    log_message(f"  Previous event: {production_previous['event_type']}")
+    log_message(f"  Energy production (previous day): {production_previous['energy_production']}")
+    log_message(f"  Energy consumption (previous day): {production_previous['energy_consumption']}")
+    log_message(f"  zkaspa production (previous day): {production_previous['zkaspa_production']}")
+    log_message(f"  Current total zkaspa: {total_zkaspa}")
+    log_message(f"  New generated event: {production_current['event_type']}")
+    log_message(f"  zkaspa prediction for today: {predicted_zkaspa}")
+    log_message(f"  Current energy multiplier: {production_current['energy_multiplier']}")
+    log_message(f"  Current zkaspa multiplier: {production_current['zkaspa_multiplier']}")
+    return total_zkaspa
+
+"""
+read_end_of_day_checkpoint(cursor, today):
+Returns the last day completed by the end-of-day pipeline (game_parameters 'eod_last_completed_date').
+Without checkpoint (first run after an upgrade), it is initialised with the last day with daily statistics,
+or today on a new database, so that days processed by the former separate jobs are not credited a second time.
+"""
+def read_end_of_day_checkpoint(cursor, today):
+    cursor.execute("SELECT value FROM game_parameters WHERE key = 'eod_last_completed_date'")
+    row = cursor.fetchone()
+    if row:
+        return datetime.strptime(row['value'], '%Y-%m-%d').date()
+
+    cursor.execute("SELECT MAX(date) AS last_date FROM history_daily_stats")
+    row = cursor.fetchone()
+    last_completed = today
+    if row and row['last_date']:
+        last_completed = min(datetime.strptime(str(row['last_date'])[:10], '%Y-%m-%d').date(), today)
+    write_end_of_day_checkpoint(cursor, last_completed)
+    return last_completed
+
+"""
+write_end_of_day_checkpoint(cursor, day):
+Records day as the last day completed by the end-of-day pipeline, in the transaction of the caller.
+"""
+def write_end_of_day_checkpoint(cursor, day):
+    cursor.execute("INSERT OR REPLACE INTO game_parameters (key, value) VALUES ('eod_last_completed_date', ?)", (day.isoformat(),))
+
+"""
+run_end_of_day_stages(cursor, day, current_time, roll_event):
+Runs the end-of-day stages of day in the transaction of the caller (see run_end_of_day):
+1. fees (collect_fees),
+2. zkaspa distribution for the day that just ended, with the event active during that day (credit_daily_zkaspa),
+3. event roll for the new day, starting at midnight (roll_random_event), if roll_event,
+4. daily statistics (record_daily_stats),
+5. checkpoint of the completed day.
+The production is computed once from the production aggregates for the distribution and the statistics.
+
+Returns:
+- dict: Report of the day, with the duration of each stage (seconds)
+"""
+def run_end_of_day_stages(cursor, day, current_time, roll_event):
+    day_start = datetime.combine(day, datetime.min.time()).timestamp()
+    report = {'date': day.isoformat(), 'stages': {}}
+
+    step_start = time.perf_counter()
+    report['parcels_reset'], report['parcels_grace_period'] = collect_fees(cursor, current_time)
+    report['stages']['fees'] = time.perf_counter() - step_start
+
+    step_start = time.perf_counter()
+    # Effets de l'événement actif pendant la journée qui vient de se terminer
+    production_previous = calculate_production(cursor=cursor, log_execution=False,
+                                               event_effects=read_event_effects(cursor, day_start - 1)[0])
+    report['updated_parcels'], report['zkaspa_distributed'] = credit_daily_zkaspa(cursor, production_previous)
+    report['stages']['distribution'] = time.perf_counter() - step_start
+
+    step_start = time.perf_counter()
+    new_event = roll_random_event(cursor, day_start) if roll_event else None
+    report['event'] = new_event['type'] if new_event else None
+    report['stages']['event'] = time.perf_counter() - step_start
+
+    step_start = time.perf_counter()
+    production_current = calculate_production(cursor=cursor, log_execution=False,
+                                              event_effects=read_event_effects(cursor, day_start)[0])
+    report['total_zkaspa'] = record_daily_stats(cursor, day, production_previous, production_current)
+    report['stages']['stats'] = time.perf_counter() - step_start
+
+    write_end_of_day_checkpoint(cursor, day)
+    return report
+
+"""
+run_end_of_day():
+End-of-day pipeline, run at midnight and once at startup: fees, zkaspa distribution, event roll and daily
+statistics of each day not completed yet, one transaction per day (see run_end_of_day_stages).
+
+The last completed day is checkpointed in the same transaction, so a run interrupted by a crash is rolled back
+as a whole and replayed by the next run, and every day missed while the server was down is caught up in order,
+none is skipped. Running it again on a completed day does nothing: a day is never credited twice.
+
+Returns:
+- list: Reports of the completed days
 """
-def save_daily_stats():
-    log_message("save_daily_stats function called.")
+@db_writer.task
+def run_end_of_day():
+    log_message("run_end_of_day function called.")
+    reports = []
     conn = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
-        
-        current_date = datetime.now().date()
-        previous_date = current_date - timedelta(days=1)
-        
-        # Use calculate_production to get data for the previous day
-        production_previous = calculate_production(conn, cursor)
-        
-        # Calculate total zkaspa and zkaspa production for the previous day
-        cursor.execute('SELECT SUM(zkaspa_balance) as total_zkaspa FROM parcels')
-        total_zkaspa = cursor.fetchone()['total_zkaspa'] or 0
-        
-        # Calculate zkaspa prediction for the previous day
-        previous_predicted_zkaspa = calculate_predicted_zkaspa_production()
-        
-        # Generate a potential new event for the current day
-        generate_random_event()
-        
-        # Recalculate production with the potential new event
-        production_current = calculate_production(conn, cursor)
-        
-        # Calculate zkaspa prediction for the current day
-        predicted_zkaspa = calculate_predicted_zkaspa_production()
-        
-        # Insert statistics into the database
-        cursor.execute('''
-            INSERT OR REPLACE INTO daily_stats
-            (date, total_energy_production, total_energy_consumption, total_zkaspa, predicted_zkaspa_production, actual_zkaspa_production)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (current_date, production_previous['energy_production'], production_previous['energy_consumption'], 
-              total_zkaspa, predicted_zkaspa, production_previous['zkaspa_production']))
-        
+
+        current_time = time.time()
+        today = datetime.fromtimestamp(current_time).date()
+        last_completed = read_end_of_day_checkpoint(cursor, today)
         conn.commit()
-        
-        log_message(f"Daily statistics successfully recorded for {current_date}:")
-        log_message(f"  Previous event: {production_previous['event_type']}")
-        log_message(f"  Energy production (previous day): {production_previous['energy_production']}")
-        log_message(f"  Energy consumption (previous day): {production_previous['energy_consumption']}")
-        log_message(f"  zkaspa production (previous day): {production_previous['zkaspa_production']}")
-        log_message(f"  zkaspa prediction (previous day): {previous_predicted_zkaspa}")
-        log_message(f"  Current total zkaspa: {total_zkaspa}")
-        log_message(f"  New generated event: {production_current['event_type']}")
-        log_message(f"  zkaspa prediction for today: {predicted_zkaspa}")
-        log_message(f"  Current energy multiplier: {production_current['energy_multiplier']}")
-        log_message(f"  Current zkaspa multiplier: {production_current['zkaspa_multiplier']}")
-        
+        pending_days = (today - last_completed).days
+        if pending_days <= 0:
+            log_message(f"End of day already completed for {today}.")
+            return reports
+
+        for offset in range(pending_days - 1, -1, -1):
+            day = today - timedelta(days=offset)
+            catch_up = day != today
+            if catch_up:
+                log_message(f"Catching up the missed end of day of {day}.")
+            # Fees of a missed day are checked as of its midnight
+            day_time = datetime.combine(day, datetime.min.time()).timestamp() if catch_up else current_time
+
+            conn.execute("BEGIN TRANSACTION")
+            start_time = time.perf_counter()
+            report = run_end_of_day_stages(cursor, day, day_time, roll_event=not catch_up)
+            conn.commit()
+            event_effects_cache.invalidate()
+            report['seconds'] = time.perf_counter() - start_time
+            reports.append(report)
+
+            log_message(f"End of day {report['date']} completed in {report['seconds']:.3f} s "
+                        f"(" + ", ".join(f"{stage} {seconds:.3f} s" for stage, seconds in report['stages'].items()) + "): "
+                        f"{report['parcels_reset']} parcels reset, {report['updated_parcels']} parcels credited "
+                        f"with {report['zkaspa_distributed']} zkaspa, new event: {report['event']}")
+
     except Exception as e:
         if conn:
             conn.rollback()
-        log_message(f"Error while recording daily statistics: {e}")
-        
+        log_message(f"Error during the end of day, it will be resumed from the last completed day by the next run: {e}")
+
     finally:
         if conn:
             conn.close()
+    return reports
 
 """
-process_sale_listing(conn, cursor, from_address, tx_id):
+process_sale_listing(conn, cursor, from_address, tx_id, multiplier=None, manage_transaction=True):
 Handles listing a plot for sale or updating its price.
 
 Parameters:
@@ -2285,11 +4534,14 @@ Parameters:
 - cursor: Database cursor
 - from_address (str): Seller's address
 - tx_id (str): Transaction ID
+- multiplier (float, optional): Price multiplier applied to the total amount paid
+- manage_transaction (bool): Commits the listing if True. Otherwise errors are raised
+  to the caller, which owns the transaction.
 
 Returns:
 - bool: True if the operation succeeds, False otherwise
 """
-def process_sale_listing(conn, cursor, from_address, tx_id, multiplier=None):
+def process_sale_listing(conn, cursor, from_address, tx_id, multiplier=None, manage_transaction=True):
     try:
         # Check if the parcel is already for sale
         cursor.execute("SELECT id, is_for_sale FROM parcels WHERE owner_address = ?", (from_address,))
@@ -2315,9 +4567,10 @@ def process_sale_listing(conn, cursor, from_address, tx_id, multiplier=None):
                 if is_already_for_sale:
                     # Update the sale price
                     cursor.execute("UPDATE parcels SET sale_price = ? WHERE id = ?", (sale_price, parcel_id))
+                    # The sighting cursor is reset so that the new price is matched over the last 24 hours
                     cursor.execute("""
                         UPDATE wallets_to_monitor 
-                        SET expected_amount = ?
+                        SET expected_amount = ?, last_seen_tx_id = NULL, last_seen_block_time = NULL
                         WHERE address = ? AND parcel_id = ?
                     """, (sale_price, from_address, parcel_id))
                     action = "price update"
@@ -2334,7 +4587,8 @@ def process_sale_listing(conn, cursor, from_address, tx_id, multiplier=None):
                     """, (from_address, sale_price, parcel_id, current_time))
                     action = "listed for sale"
                 
-                conn.commit()
+                if manage_transaction:
+                    conn.commit()
                 log_message(f"Parcel {parcel_id} {action} by {from_address} for {sale_price} KAS")
                 return True
             else:
@@ -2345,12 +4599,14 @@ def process_sale_listing(conn, cursor, from_address, tx_id, multiplier=None):
             return False
     
     except Exception as e:
-        conn.rollback()
         log_message(f"Error while processing sale listing/price update: {e}")
+        if not manage_transaction:
+            raise
+        conn.rollback()
         return False
  
 """
-process_sale_cancellation(conn, cursor, from_address, tx_id):
+process_sale_cancellation(conn, cursor, from_address, tx_id, manage_transaction=True):
 Allows a seller to cancel the sale of their plot.
 
 Parameters:
@@ -2358,11 +4614,13 @@ Parameters:
 - cursor: Database cursor
 - from_address (str): Seller's address
 - tx_id (str): Transaction ID
+- manage_transaction (bool): Commits the cancellation if True. Otherwise errors are raised
+  to the caller, which owns the transaction.
 
 Returns:
 - bool: True if the cancellation succeeds, False otherwise
 """
-def process_sale_cancellation(conn, cursor, from_address, tx_id):
+def process_sale_cancellation(conn, cursor, from_address, tx_id, manage_transaction=True):
     try:
         log_message(f"Starting sale cancellation for {from_address}")
         
@@ -2394,7 +4652,7 @@ def process_sale_cancellation(conn, cursor, from_address, tx_id):
                 log_message(f"Total invested amount: {total_amount}")
                 
                 # Check if an upgrade is needed
-                new_building_type, _ = determine_building_type(total_amount)
+                new_building_type, _ = determine_building_type(total_amount, conn=conn)
                 log_message(f"New building type determined: {new_building_type}")
                 
                 if new_building_type != current_building_type:
@@ -2415,7 +4673,8 @@ def process_sale_cancellation(conn, cursor, from_address, tx_id):
             else:
                 log_message(f"No wallet information found for {from_address}")
             
-            conn.commit()
+            if manage_transaction:
+                conn.commit()
             log_message(f"Sale cancellation successful for parcel {parcel_id}")
             return True
         else:
@@ -2423,9 +4682,11 @@ def process_sale_cancellation(conn, cursor, from_address, tx_id):
             return False
     
     except Exception as e:
-        conn.rollback()
         log_message(f"Error during sale cancellation: {str(e)}")
         log_message(f"Error type: {type(e).__name__}")
+        if not manage_transaction:
+            raise
+        conn.rollback()
         return False
 
 """
@@ -2548,130 +4809,499 @@ def process_parcel_purchase(conn, cursor, buyer_address, new_parcel_id, wallet_m
 """
 Checks if an address has received a specific amount in the last 24 hours.
 
+Only the transactions newer than the sighting cursor of the address are fetched and matched
+(see get_transactions_since), with pages of MONITOR_PROBE_SIZE transactions, so an idle address
+costs a single small request. Without a cursor (first check), the latest page is scanned.
+
+A single attempt is made. If the API cannot be reached, "Verification error" is returned
+and the caller defers the address (see check_monitored_wallets) instead of sleeping.
+
 Parameters:
 - address (str): Address to check
 - amount (float): Expected amount
-- max_retries (int): Maximum number of retry attempts
-- retry_delay (int): Delay between attempts in seconds
+- last_seen_block_time (int, optional): Block time (milliseconds) of the sighting cursor
+- last_seen_tx_id (str, optional): Transaction ID of the sighting cursor
 
 Returns:
-- tuple: (transaction found, sender address, error message)
+- tuple: (transaction found, sender address, error message, new sighting cursor)
+  The new sighting cursor is the (block_time, transaction ID) of the newest transaction seen,
+  or None if no new transaction was seen, a matching transaction was found or the
+  sighting cursor was not reached within KASPA_INGEST_MAX_PAGES pages.
 """
-def check_and_find_transaction(address, amount, max_retries=5, retry_delay=10):
+def check_and_find_transaction(address, amount, last_seen_block_time=None, last_seen_tx_id=None):
     global last_log_time
     amount_somtoshis = int(round(amount * 100000000))
     twenty_four_hours_ago = datetime.now() - timedelta(hours=24)
     #log_message(f"Searching for transaction for {address}, amount: {amount} KAS ({amount_somtoshis} somtoshis)")
 
-    for attempt in range(max_retries):
-        try:
-            transactions = get_recent_transactions(address)
-            #log_message(f"Attempt {attempt + 1}: {len(transactions)} transactions retrieved")
-            
-            for tx in transactions:
-                # Convert block_time from milliseconds to seconds
-                block_time_seconds = tx['block_time'] / 1000
-                tx_time = datetime.fromtimestamp(block_time_seconds)
-                #log_message(f"Transaction {tx['transaction_id']}: timestamp {tx_time}")
-                
-                if tx_time < twenty_four_hours_ago:
-                    #log_message("Transaction too old, stopping processing")
-                    break  # Exit the loop if the transaction is too old
-
-                for output in tx['outputs']:
-                    slippage_somtoshis = int(round(SLIPPAGE_TOLERANCE * 100000000))
-                    if output['script_public_key_address'] == address and abs(output['amount'] - amount_somtoshis) <= slippage_somtoshis:
-                        # Transaction correspondante trouvée avec tolérance de slippage
-                        if tx['inputs'] and 'previous_outpoint_address' in tx['inputs'][0]:
-                            log_message(f"Transaction found for {address} with amount {amount} KAS")
-                            return True, tx['inputs'][0]['previous_outpoint_address'], None
-                        else:
-                            log_message(f"Transaction found for {address} with amount {amount} KAS, but sender could not be identified")
-                            return True, None, "Sender not identified"
-
-            current_time = datetime.now()
-            if last_log_time is None or current_time - last_log_time >= timedelta(hours=1):
-                log_message(f"No matching transaction found for {address} with amount {amount} KAS")
-                last_log_time = current_time
-            return False, None, "No transaction found"
+    try:
+        if last_seen_tx_id is None:
+            transactions, cursor_reached = get_recent_transactions(address, raise_on_error=True), True
+        else:
+            transactions, cursor_reached = get_transactions_since(address, last_seen_block_time, last_seen_tx_id, limit=MONITOR_PROBE_SIZE)
+        #log_message(f"{len(transactions)} transactions retrieved")
+        if not transactions:
+            return False, None, "No transaction found", None
+
+        for tx in transactions:
+            # Convert block_time from milliseconds to seconds
+            block_time_seconds = tx['block_time'] / 1000
+            tx_time = datetime.fromtimestamp(block_time_seconds)
+            #log_message(f"Transaction {tx['transaction_id']}: timestamp {tx_time}")
+
+            if tx_time < twenty_four_hours_ago:
+                #log_message("Transaction too old, stopping processing")
+                break  # Exit the loop if the transaction is too old
+
+            for output in tx['outputs']:
+                slippage_somtoshis = int(round(SLIPPAGE_TOLERANCE * 100000000))
+                if output['script_public_key_address'] == address and abs(output['amount'] - amount_somtoshis) <= slippage_somtoshis:
+                    # Transaction correspondante trouvée avec tolérance de slippage
+                    if tx['inputs'] and 'previous_outpoint_address' in tx['inputs'][0]:
+                        log_message(f"Transaction found for {address} with amount {amount} KAS")
+                        return True, tx['inputs'][0]['previous_outpoint_address'], None, None
+                    else:
+                        log_message(f"Transaction found for {address} with amount {amount} KAS, but sender could not be identified")
+                        return True, None, "Sender not identified", None
 
-        except Exception as e:
-            log_message(f"Error during attempt {attempt + 1} for address {address}: {str(e)}")
-            log_message(f"Error type: {type(e).__name__}")
+        current_time = datetime.now()
+        if last_log_time is None or current_time - last_log_time >= timedelta(hours=1):
+            log_message(f"No matching transaction found for {address} with amount {amount} KAS")
+            last_log_time = current_time
+        if not cursor_reached:
+            # Older transactions were not retrieved: keep the sighting cursor
+            return False, None, "No transaction found", None
+        newest = max(transactions, key=itemgetter('block_time'))
+        return False, None, "No transaction found", (newest['block_time'], newest['transaction_id'])
+
+    except CircuitOpenError:
+        # Already reported when the circuit opened
+        return False, None, "Verification error", None
 
-        if attempt < max_retries - 1:
-            log_message(f"Retrying in {retry_delay} seconds...")
-            time.sleep(retry_delay)
-        else:
-            log_message(f"Maximum number of attempts reached for address {address}. Aborting verification.")
+    except Exception as e:
+        log_message(f"Error while verifying address {address}: {str(e)}")
+        log_message(f"Error type: {type(e).__name__}")
+        return False, None, "Verification error", None
 
-    return False, None, "Verification error"
+# Watcher threads for the monitored wallets and checks still running from a previous cycle
+monitor_executor = WatcherPoolExecutor(max_workers=MONITOR_MAX_WORKERS, thread_name_prefix='wallet-watcher')
+monitor_in_flight = {}
+# Held during a check cycle (periodic, or triggered by a notification for a watched address)
+monitor_lock = threading.Lock()
+# Monitored wallets whose last check failed: wallet ID -> (consecutive failures, time.monotonic() of the next check)
+monitor_retry_state = {}
 
 """
 Periodically checks monitored addresses for payments of plots for sale.
+
+All pending addresses are fetched in parallel (at most MONITOR_MAX_WORKERS at a time), with a single
+attempt each. Results are applied once the checks have finished or MONITOR_CYCLE_DEADLINE has elapsed.
+Checks that are still running or have failed are not retried within the cycle, so a slow API never makes
+a cycle overrun the next one. An address whose check failed is re-enqueued for a later cycle with
+backoff_delay() (exponential backoff with jitter), and no check is started while the circuit of the
+API host is open.
+Cycles never overlap. Besides the periodic run, a push transaction source runs a cycle as soon as a
+pending address receives a transaction (the pending addresses are registered with it on each cycle).
 """
 def check_monitored_wallets():
-    with app.app_context():
+    with monitor_lock:
+        with app.app_context():
+            conn = get_db_connection()
+            cursor = conn.cursor()
+
+            try:
+                cursor.execute("SELECT * FROM wallets_to_monitor WHERE status = 'pending'")
+                wallets_to_check = cursor.fetchall()
+
+                # With a push source, payments to the pending addresses trigger a cycle as soon as they arrive
+                transaction_source.watch(wallet['address'] for wallet in wallets_to_check)
+
+                # Forget the checks of previous cycles that have finished in the meantime
+                for wallet_id in [wallet_id for wallet_id, future in monitor_in_flight.items() if future.done()]:
+                    del monitor_in_flight[wallet_id]
+                pending_ids = {wallet['id'] for wallet in wallets_to_check}
+                for wallet_id in [wallet_id for wallet_id in monitor_retry_state if wallet_id not in pending_ids]:
+                    del monitor_retry_state[wallet_id]
+
+                # The API host is known to be down: every check is deferred to a later cycle
+                if wallets_to_check and kaspa_api.circuit_retry_in() > 0:
+                    return
+
+                # Start the checks in parallel, skipping addresses whose previous check is still running
+                # or whose retry is not due yet
+                futures = {}
+                now = time.monotonic()
+                for wallet in wallets_to_check:
+                    previous_future = monitor_in_flight.get(wallet['id'])
+                    if previous_future is not None and not previous_future.done():
+                        continue
+                    if wallet['id'] in monitor_retry_state and monitor_retry_state[wallet['id']][1] > now:
+                        continue
+                    future = monitor_executor.submit(check_and_find_transaction, wallet['address'], wallet['expected_amount'],
+                                                     wallet['last_seen_block_time'], wallet['last_seen_tx_id'])
+                    monitor_in_flight[wallet['id']] = future
+                    futures[future] = wallet
+
+                done, not_done = wait_futures(futures, timeout=MONITOR_CYCLE_DEADLINE)
+                if not_done or len(futures) < len(wallets_to_check):
+                    log_message(f"Monitored wallets: {len(done)}/{len(wallets_to_check)} checked in this cycle, "
+                                f"the others are deferred to the next cycle.")
+
+                outcomes = []
+                for future in done:
+                    wallet = futures[future]
+                    monitor_in_flight.pop(wallet['id'], None)
+                    try:
+                        transaction_found, buyer_address, error_message, sighting_cursor = future.result()
+                    except Exception as e:
+                        log_message(f"Error while checking monitored wallet {wallet['address']}: {e}")
+                        continue
+                    if error_message == "Verification error":
+                        # The API could not be reached for this address, re-enqueue it with backoff
+                        failures = monitor_retry_state.get(wallet['id'], (0, 0))[0]
+                        monitor_retry_state[wallet['id']] = (failures + 1, time.monotonic() + backoff_delay(failures))
+                        continue
+                    monitor_retry_state.pop(wallet['id'], None)
+                    outcomes.append((wallet, transaction_found, buyer_address, sighting_cursor))
+
+                if outcomes:
+                    apply_monitor_results(outcomes)
+
+            except Exception as e:
+                log_message(f"Error while checking monitored wallets: {e}")
+
+            finally:
+                conn.close()
+
+"""
+apply_monitor_results(outcomes):
+Applies the results of the monitored wallet checks in one transaction, on the database writer thread.
+
+Parameters:
+- outcomes (list): (wallet row, transaction found, buyer address, sighting cursor) per checked wallet
+
+- A payment found with an identified buyer transfers the parcel (see process_parcel_purchase).
+- A wallet whose parcel is no longer for sale is removed from monitoring.
+- Otherwise, the sighting cursor of the wallet is advanced, unless the wallet changed since the check.
+"""
+@db_writer.task
+def apply_monitor_results(outcomes):
+    conn = None
+    try:
         conn = get_db_connection()
         cursor = conn.cursor()
 
-        try:
-            cursor.execute("SELECT * FROM wallets_to_monitor WHERE status = 'pending'")
-            wallets_to_check = cursor.fetchall()
-
-            for wallet in wallets_to_check:
-                transaction_found, buyer_address, error_message = check_and_find_transaction(wallet['address'], wallet['expected_amount'])
-                
-                if transaction_found:
-                    if buyer_address:
-                        process_parcel_purchase(conn, cursor, buyer_address, wallet['parcel_id'], wallet['id'], wallet['expected_amount'])
-                        log_message(f"Parcel purchase processed for {buyer_address}: {wallet['expected_amount']} KAS")
-                    else:
-                        log_message(f"Transaction found for {wallet['address']} but the buyer could not be identified")
+        for wallet, transaction_found, buyer_address, sighting_cursor in outcomes:
+            if transaction_found:
+                if buyer_address:
+                    process_parcel_purchase(conn, cursor, buyer_address, wallet['parcel_id'], wallet['id'], wallet['expected_amount'])
+                    log_message(f"Parcel purchase processed for {buyer_address}: {wallet['expected_amount']} KAS")
                 else:
-                    # Check if the parcel is still for sale
-                    cursor.execute("SELECT is_for_sale FROM parcels WHERE id = ?", (wallet['parcel_id'],))
-                    is_still_for_sale = cursor.fetchone()['is_for_sale']
-                    if not is_still_for_sale:
-                        cursor.execute("DELETE FROM wallets_to_monitor WHERE id = ?", (wallet['id'],))
-                        log_message(f"Address {wallet['address']} removed from monitoring because the parcel is no longer for sale.")
+                    log_message(f"Transaction found for {wallet['address']} but the buyer could not be identified")
+            else:
+                # Check if the parcel is still for sale
+                cursor.execute("SELECT is_for_sale FROM parcels WHERE id = ?", (wallet['parcel_id'],))
+                is_still_for_sale = cursor.fetchone()['is_for_sale']
+                if not is_still_for_sale:
+                    cursor.execute("DELETE FROM wallets_to_monitor WHERE id = ?", (wallet['id'],))
+                    log_message(f"Address {wallet['address']} removed from monitoring because the parcel is no longer for sale.")
+                elif sighting_cursor:
+                    # The next checks only fetch the transactions newer than the ones seen in this cycle.
+                    # The cursor is only advanced if the wallet is unchanged since the check: a price update
+                    # (process_sale_listing) resets it while the check runs, and that reset must be kept.
+                    cursor.execute("""
+                        UPDATE wallets_to_monitor SET last_seen_block_time = ?, last_seen_tx_id = ?
+                        WHERE id = ? AND status = 'pending' AND last_seen_tx_id IS ? AND expected_amount = ?
+                    """, (sighting_cursor[0], sighting_cursor[1], wallet['id'], wallet['last_seen_tx_id'], wallet['expected_amount']))
 
-            conn.commit()
+        conn.commit()
 
-        except Exception as e:
-            log_message(f"Error while checking monitored wallets: {e}")
+    except Exception as e:
+        log_message(f"Error while applying the monitored wallet checks: {e}")
+        if conn:
             conn.rollback()
 
-        finally:
+    finally:
+        if conn:
             conn.close()
 
 """
-Determines the rarity and corresponding multiplier of a building variant based on its probability.
+PollingTransactionSource:
+Default transaction source: check_new_transactions polls the main address every CHECK_INTERVAL
+and check_monitored_wallets polls the pending seller addresses.
+
+Transaction sources share this interface:
+- start() / stop(): start and stop receiving transactions
+- watch(addresses): sets the seller addresses to watch in addition to the main address
+- poll_due(): True if check_new_transactions must poll the API on this run
+- mark_polled(): called by check_new_transactions after a successful poll
+"""
+class PollingTransactionSource:
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def watch(self, addresses):
+        pass
+
+    def poll_due(self):
+        return True
+
+    def mark_polled(self):
+        pass
+
+"""
+UtxoSubscriptionSource:
+Push transaction source fed by UTXO change notifications for the main address and the watched seller addresses.
+
+- A notification for the main address fetches the notified transactions and applies them at once
+  (ingest_pushed_transactions), so deposits no longer wait for the next poll.
+- A notification for a watched seller address runs a check_monitored_wallets cycle at once.
+- Polling stays as gap-filler: check_new_transactions polls when the notifier is disconnected or has
+  reconnected since the last poll, when a pushed transaction could not be fetched, and otherwise every
+  gap_fill_interval seconds. The ingestion cursor is only advanced by these polls.
+
+The notifier must provide subscribe(addresses, callback), unsubscribe(addresses), start(), stop() and the
+connected (bool) and connected_at (time.monotonic() of the last connection) attributes. The callback is
+called with (address, list of IDs of the transactions that added UTXOs to the address).
+See WrpcUtxoNotifier, and LocalUtxoNotifier in tools/kaspa_api_stub.py for the local stand-in.
+"""
+class UtxoSubscriptionSource(PollingTransactionSource):
+    def __init__(self, notifier, gap_fill_interval=TRANSACTION_GAP_FILL_INTERVAL):
+        self.notifier = notifier
+        self.gap_fill_interval = gap_fill_interval
+        self.watched_addresses = set()
+        self.last_poll = None
+        self.poll_requested = False
+        self.monitor_check_pending = False
+        self.lock = threading.Lock()
+        # Notifications are handled outside of the notifier thread
+        self.executor = WatcherPoolExecutor(max_workers=2, thread_name_prefix='utxo-push')
+
+    def start(self):
+        self.notifier.subscribe([KASPA_MAIN_ADDRESS], self.on_utxos_changed)
+        self.notifier.start()
+
+    def stop(self):
+        self.notifier.stop()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def watch(self, addresses):
+        addresses = set(addresses) - {KASPA_MAIN_ADDRESS}
+        with self.lock:
+            added = addresses - self.watched_addresses
+            removed = self.watched_addresses - addresses
+            self.watched_addresses = addresses
+        if added:
+            self.notifier.subscribe(sorted(added), self.on_utxos_changed)
+        if removed:
+            self.notifier.unsubscribe(sorted(removed))
+
+    def poll_due(self):
+        with self.lock:
+            if self.last_poll is None or self.poll_requested or not self.notifier.connected:
+                return True
+            if self.notifier.connected_at is not None and self.notifier.connected_at > self.last_poll:
+                return True  # Transactions may have been missed while disconnected
+            return time.monotonic() - self.last_poll >= self.gap_fill_interval
+
+    def mark_polled(self):
+        with self.lock:
+            self.last_poll = time.monotonic()
+            self.poll_requested = False
+
+    """
+    Makes the next check_new_transactions run poll the API.
+    """
+    def request_poll(self):
+        with self.lock:
+            self.poll_requested = True
+
+    """
+    Notifier callback: transactions tx_ids added UTXOs to address.
+    """
+    def on_utxos_changed(self, address, tx_ids):
+        if address == KASPA_MAIN_ADDRESS:
+            self.executor.submit(ingest_pushed_transactions, list(tx_ids))
+            return
+        with self.lock:
+            if address not in self.watched_addresses or self.monitor_check_pending:
+                return
+            # A single cycle is queued for any number of notifications
+            self.monitor_check_pending = True
+        self.executor.submit(self.run_monitor_check)
+
+    def run_monitor_check(self):
+        with self.lock:
+            self.monitor_check_pending = False
+        check_monitored_wallets()
+
+"""
+WrpcUtxoNotifier:
+UTXO change notifications from a Kaspa node over its JSON wRPC endpoint (KASPA_WRPC_URL),
+using the optional websocket-client package.
+
+- Subscribes to the UTXO changes of the registered addresses, and subscribes them again after a reconnection.
+- Reconnects every reconnect_delay seconds while the node is unreachable (polling then takes over).
+- Calls the callback with the IDs of the transactions of the added UTXOs, grouped by address.
+"""
+class WrpcUtxoNotifier:
+    SUBSCRIBE_METHOD = 'subscribeUtxosChanged'
+    UNSUBSCRIBE_METHOD = 'unsubscribeUtxosChanged'
+    NOTIFICATION_METHOD = 'utxosChangedNotification'
+
+    def __init__(self, url, reconnect_delay=5):
+        if websocket is None:
+            raise RuntimeError("The websocket-client package is required for TRANSACTION_SOURCE = 'utxo_subscription'")
+        self.url = url
+        self.reconnect_delay = reconnect_delay
+        self.addresses = set()
+        self.callback = None
+        self.connected = False
+        self.connected_at = None
+        self.ws = None
+        self.request_id = 0
+        self.lock = threading.Lock()
+
+    def subscribe(self, addresses, callback):
+        self.callback = callback
+        with self.lock:
+            self.addresses.update(addresses)
+        if self.connected:
+            self.send(self.SUBSCRIBE_METHOD, addresses)
+
+    def unsubscribe(self, addresses):
+        with self.lock:
+            self.addresses.difference_update(addresses)
+        if self.connected:
+            self.send(self.UNSUBSCRIBE_METHOD, addresses)
+
+    def start(self):
+        self.ws = websocket.WebSocketApp(self.url, on_open=self.on_open, on_message=self.on_message,
+                                         on_error=self.on_error, on_close=self.on_close)
+        thread = threading.Thread(target=self.ws.run_forever, kwargs={"reconnect": self.reconnect_delay, "ping_interval": 30},
+                                  name='wrpc-notifier', daemon=True)
+        thread.start()
+
+    def stop(self):
+        if self.ws is not None:
+            self.ws.keep_running = False
+            self.ws.close()
+        self.connected = False
+
+    def send(self, method, addresses):
+        with self.lock:
+            self.request_id += 1
+            message = json.dumps({"id": self.request_id, "method": method, "params": {"addresses": list(addresses)}})
+        try:
+            self.ws.send(message)
+        except Exception as e:
+            log_message(f"Error while sending {method} to the Kaspa node: {e}")
+
+    def on_open(self, ws):
+        self.connected = True
+        self.connected_at = time.monotonic()
+        log_message(f"Connected to the Kaspa node notifications at {self.url}")
+        with self.lock:
+            addresses = sorted(self.addresses)
+        if addresses:
+            self.send(self.SUBSCRIBE_METHOD, addresses)
+
+    def on_message(self, ws, message):
+        try:
+            data = json.loads(message)
+        except ValueError:
+            log_message("Invalid message received from the Kaspa node notifications")
+            return
+        if data.get('error'):
+            log_message(f"Kaspa node notification error: {data['error']}")
+            return
+        if data.get('method') != self.NOTIFICATION_METHOD or self.callback is None:
+            return
+
+        tx_ids_by_address = {}
+        for entry in (data.get('params') or {}).get('added', []):
+            try:
+                tx_ids_by_address.setdefault(entry['address'], []).append(entry['outpoint']['transactionId'])
+            except (KeyError, TypeError) as e:
+                log_message(f"Error accessing UTXO notification data: {e}")
+        for address, tx_ids in tx_ids_by_address.items():
+            self.callback(address, tx_ids)
+
+    def on_error(self, ws, error):
+        log_message(f"Kaspa node notifications error: {error}")
+
+    def on_close(self, ws, status_code, reason):
+        if self.connected:
+            log_message("Disconnected from the Kaspa node notifications, polling takes over until reconnection.")
+        self.connected = False
+
+"""
+ingest_pushed_transactions(tx_ids):
+Fetches the transactions notified for the main address and applies their deposits at once.
+
+Transactions already recorded are skipped. A transaction that cannot be fetched (API error, not yet
+indexed) is left to the gap-filler poll, which is requested on the next check_new_transactions run.
 
 Parameters:
-- probability (float): Variant probability
+- tx_ids (list): IDs of the notified transactions
+"""
+def ingest_pushed_transactions(tx_ids):
+    with app.app_context():
+        transactions = []
+        for tx_id in dict.fromkeys(tx_ids):
+            if transaction_already_processed(tx_id):
+                continue
+            try:
+                transactions.append(kaspa_api.get(f"/transactions/{tx_id}", "/transactions/{transaction_id}",
+                                                  params={"resolve_previous_outpoints": "light"}))
+            except (RequestException, ValueError) as e:
+                log_message(f"Error retrieving pushed transaction {tx_id}, left to the next poll: {e}")
+                transaction_source.request_poll()
+        if not transactions:
+            return
+
+        with ingestion_lock:
+            try:
+                apply_new_transactions(transactions)
+            except Exception as e:
+                log_message(f"Error while applying pushed transactions: {e}")
+                transaction_source.request_poll()
 
-Returns:
-- tuple: A tuple containing two elements:
-    - str: Rarity level ('Mythic', 'Legendary', 'Epic', 'Rare', 'Uncommon', 'Common', or 'Basic')
-    - float: Corresponding rarity multiplier from the RARITY_MULTIPLIERS dictionary
 """
-def determine_rarity_and_multiplier(probability):
-    if probability <= 0.001:  # ≤0.1%
-        return 'Mythic', RARITY_MULTIPLIERS['Mythic']
-    elif probability <= 0.015:  # 0.1-1.5%
-        return 'Legendary', RARITY_MULTIPLIERS['Legendary']
-    elif probability <= 0.05:  # 1-5%
-        return 'Epic', RARITY_MULTIPLIERS['Epic']
-    elif probability <= 0.1:   # 5-10%
-        return 'Rare', RARITY_MULTIPLIERS['Rare']
-    elif probability <= 0.2:   # 10-20%
-        return 'Uncommon', RARITY_MULTIPLIERS['Uncommon']
-    elif probability <= 0.4:   # 20-40%
-        return 'Common', RARITY_MULTIPLIERS['Common']
-    else:                      # >40%
-        return 'Basic', RARITY_MULTIPLIERS['Basic']
-    
+create_transaction_source():
+Returns the transaction source selected by TRANSACTION_SOURCE.
+Falls back to polling if the push source cannot be created (e.g. websocket-client not installed).
+"""
+def create_transaction_source():
+    if TRANSACTION_SOURCE == 'utxo_subscription':
+        try:
+            return UtxoSubscriptionSource(WrpcUtxoNotifier(KASPA_WRPC_URL))
+        except RuntimeError as e:
+            log_message(f"{e}, falling back to polling.")
+    elif TRANSACTION_SOURCE != 'polling':
+        log_message(f"Unknown TRANSACTION_SOURCE '{TRANSACTION_SOURCE}', falling back to polling.")
+    return PollingTransactionSource()
+
+"""
+set_transaction_source(source):
+Replaces the current transaction source (stopped) with source (started).
+"""
+def set_transaction_source(source):
+    global transaction_source
+    transaction_source.stop()
+    transaction_source = source
+    transaction_source.start()
+
+# Load recently processed transactions before the first poll
+warm_recent_transactions_cache()
+
+# Receive new transactions (pushed ones are applied as soon as they are notified)
+transaction_source = create_transaction_source()
+transaction_source.start()
+
 # Configure the scheduler
 executors = {
     'default': ThreadPoolExecutor(max_workers=10),
@@ -2682,16 +5312,20 @@ executors = {
 scheduler = BackgroundScheduler(executors=executors)
 
 # Critical tasks
-# 1. Check and collect fees
-scheduler.add_job(func=check_all_fees, trigger="cron", hour=0, minute=0, executor='critical')
-# 2. Distribute zkaspa for the ending day
-scheduler.add_job(func=distribute_zkaspa, trigger="cron", hour=0, minute=1, executor='critical')
-# 3. Save statistics for the day that just ended, generate a new event, and predict zkaspa production
-scheduler.add_job(func=save_daily_stats, trigger="cron", hour=0, minute=2, executor='critical')
-# 4. Log rotation (daily check, but effective rotation every 30 days)
+# 1. End of day: collect fees, distribute zkaspa for the ending day, generate a new event and save the daily statistics
+scheduler.add_job(func=run_end_of_day, trigger="cron", hour=0, minute=0, executor='critical', misfire_grace_time=None)
+# 2. Catch up the end of day missed while the server was down
+scheduler.add_job(func=run_end_of_day, trigger="date", run_date=datetime.now() + timedelta(seconds=30), executor='critical')
+# 3. Log rotation (daily check, but effective rotation every 30 days)
 scheduler.add_job(func=rotate_logs, trigger="cron", hour=0, minute=30, executor='critical')
+# 4. Move old history rows to the archive database (before the backup, which then stays small)
+scheduler.add_job(func=archive_history, trigger="cron", hour=0, minute=45, executor='critical')
 # 5. Daily database backup
 scheduler.add_job(func=backup_database, trigger="cron", hour=1, minute=0, executor='critical')
+# 6. Hourly report of the Kaspa API latency and error counters
+scheduler.add_job(func=log_kaspa_api_stats, trigger="cron", minute=59, executor='default')
+# 7. Hourly report of the database writer queue
+scheduler.add_job(func=log_db_writer_stats, trigger="cron", minute=59, executor='default')
 
 # Minute tasks
 # 1. Check for new transactions (continuous task)
@@ -2756,27 +5390,20 @@ def api_all_parcels():
             map_size = MAP_SIZE  # Use the default value defined globally
 
         # Obtenir le nombre actuel pour chaque type de bâtiment
-        cursor.execute("""
-            SELECT building_type, COUNT(*) as count
-            FROM parcels
-            WHERE building_type IS NOT NULL
-            GROUP BY building_type
-        """)
+        cursor.execute("SELECT building_type, count FROM building_counts")
         building_counts = {row['building_type']: row['count'] for row in cursor.fetchall()}
 
         # Obtenir max_count pour chaque type de bâtiment
         cursor.execute("SELECT name, max_count FROM building_types")
         max_counts = {row['name']: row['max_count'] for row in cursor.fetchall()}
 
-        # Récupérer toutes les parcelles avec les probabilités
+        # Récupérer toutes les parcelles avec la rareté de leur variante (parcels.rarity, voir migrate_variant_rarity)
         cursor.execute("""
             SELECT p.id, p.owner_address, p.building_type, p.building_variant, p.purchase_amount, p.x, p.y,
                 p.purchase_date, p.last_fee_payment, p.last_fee_check, p.last_fee_amount, p.fee_frequency,
                 p.next_fee_date, p.energy_production, p.energy_consumption, p.zkaspa_production, p.zkaspa_balance,
-                p.is_for_sale, p.sale_price, p.type, bv.probability
+                p.is_for_sale, p.sale_price, p.type, p.rarity
             FROM parcels p
-            LEFT JOIN building_variants bv
-                ON p.building_type = bv.building_type AND p.building_variant = bv.variant
         """)
         parcels = cursor.fetchall()
 
@@ -2786,8 +5413,7 @@ def api_all_parcels():
         }
 
         for parcel in parcels:
-            probability = parcel['probability'] or 1.0  # Valeur par défaut si la probabilité n'est pas trouvée
-            rarity, _ = determine_rarity_and_multiplier(probability)
+            rarity = parcel['rarity'] or RARITY_TIERS[-1][0]  # Valeur par défaut si la variante n'est pas trouvée
 
             result['parcels'].append({
                 "id": parcel['id'],
@@ -2837,7 +5463,7 @@ def api_game_info():
     production = calculate_production(conn, cursor, log_execution=False)
 
     # Total number of parcels
-    cursor.execute("SELECT COUNT(*) FROM parcels")
+    cursor.execute("SELECT total FROM parcel_occupancy WHERE id = 1")
     total_parcels = cursor.fetchone()[0]
     
     # Total sum of parcel purchases
@@ -2857,7 +5483,7 @@ def api_game_info():
     
     # Retrieve data from 24 hours ago
     yesterday = (datetime.now().date() - timedelta(days=1)).isoformat()
-    cursor.execute('SELECT * FROM daily_stats WHERE date = ?', (yesterday,))
+    cursor.execute('SELECT * FROM history_daily_stats WHERE date = ?', (yesterday,))
     yesterday_stats = cursor.fetchone()
     
     conn.close()
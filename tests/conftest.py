@@ -0,0 +1,78 @@
+'''
+Shared fixtures of the KasLand tests.
+
+The application reads its settings from the deployment's config.py, which is not part of the repository.
+The tests import it once per session with a test configuration instead: scratch database, log file and
+sessions in a temporary directory, a local Kaspa API URL that is never called, and a small map.
+The scheduler is stopped, the tests run the jobs themselves.
+'''
+
+import os
+import sys
+import tempfile
+import types
+
+import pytest
+import pytz
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+VARIANTS = [('A', 0.5), ('B', 0.3), ('C', 0.15), ('D', 0.04), ('E', 0.009), ('F', 0.001)]
+
+"""
+Builds the test configuration module, with its files in work_dir.
+"""
+def make_config(work_dir):
+    config = types.ModuleType('config')
+    config.__dict__.update(
+        ALLOWED_ORIGINS=['http://localhost'],
+        RATE_LIMIT_DAY='100000 per day',
+        RATE_LIMIT_HOUR='10000 per hour',
+        LIMITER_STORAGE_URI='memory://',
+        SECRET_KEY='kasland-tests',
+        SESSION_TYPE='filesystem',
+        SESSION_FILE_DIR=os.path.join(work_dir, 'sessions'),
+        SESSION_COOKIE_HTTPONLY=True,
+        SESSION_COOKIE_SAMESITE='Lax',
+        SESSION_COOKIE_SECURE=False,
+        LOG_FILE_NAME=os.path.join(work_dir, 'kasland_tests.log'),
+        DB_NAME=os.path.join(work_dir, 'kasland_tests.db'),
+        KASPA_API_BASE_URL='http://127.0.0.1:9',
+        KASPA_MAIN_ADDRESS='kaspa:testsgameaddress',
+        CHECK_INTERVAL=24 * 60 * 60,
+        SLIPPAGE_TOLERANCE=0.05,
+        MINIMUM_PURCHASE_AMOUNT=5,
+        PRICE_MULTIPLIERS={4.1: 1.5, 4.2: 2.0},
+        GRACE_PERIOD_ENABLED=True,
+        GRACE_PERIOD_DAYS=7,
+        BERLIN_TZ=pytz.timezone('Europe/Berlin'),
+        RARITY_MULTIPLIERS={'Mythic': 2.5, 'Legendary': 2.0, 'Epic': 1.8, 'Rare': 1.6, 'Uncommon': 1.4, 'Common': 1.2, 'Basic': 1.0},
+        WIND_TURBINE_BONUS=1.25,
+        COMMUNITY_FUNDING_PERCENTAGE=0.15,
+        REDISTRIBUTION_PERCENTAGE=0.15,
+        TOTAL_PARCELS_DESIRED=200,
+        PARCELS_PER_ROW=20,
+        MAP_SIZE=10,
+        BUILDING_TYPES=[
+            dict(name='small_house', min_amount=5, max_amount=9.99, fee_amount=0.5, fee_frequency=90,
+                 building_category='residential', energy_consumption=5, zkaspa_production=0.1, variants=VARIANTS),
+            dict(name='wind_turbine_lvl1', min_amount=10, max_amount=19.99, fee_amount=1, fee_frequency=90,
+                 building_category='energy', energy_production=30, zkaspa_production=0, max_count=50, variants=VARIANTS),
+            dict(name='medium_house', min_amount=20, max_amount=39.99, fee_amount=2, fee_frequency=90,
+                 building_category='residential', energy_consumption=20, zkaspa_production=0.4, variants=VARIANTS),
+            dict(name='large_house', min_amount=40, max_amount=59.99, fee_amount=2, fee_frequency=90,
+                 building_category='residential', energy_consumption=40, zkaspa_production=0.8, max_count=20, variants=VARIANTS),
+        ],
+    )
+    return config
+
+@pytest.fixture(scope='session')
+def kasland():
+    work_dir = tempfile.mkdtemp(prefix='kasland_tests_')
+    sys.modules['config'] = make_config(work_dir)
+
+    import app as kasland
+    kasland.scheduler.shutdown(wait=False)
+    yield kasland
+    kasland.transaction_source.stop()
+    kasland.db_writer.stop()
@@ -0,0 +1,88 @@
+'''
+Checkpointing of the end-of-day pipeline (run_end_of_day): each day is completed once, in one transaction,
+a failure leaves the day to the next run, and missed days are caught up in order.
+'''
+
+import hashlib
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+@pytest.fixture
+def producing_parcels(kasland):
+    # Wind turbines cover the consumption of the houses, so that the days credit zkaspa
+    deposits = []
+    for index, amount in enumerate([10, 10, 5, 5, 20]):
+        address = f"kaspa:testsendofday{index}"
+        tx_id = hashlib.sha256(f"{address}-{time.time()}".encode()).hexdigest()
+        deposits.append({"from_address": address, "amount": amount, "tx_id": tx_id, "timestamp": int(time.time() * 1000)})
+    kasland.apply_transaction_batch(deposits)
+
+def set_checkpoint(kasland, day):
+    conn = kasland.get_db_connection()
+    try:
+        kasland.write_end_of_day_checkpoint(conn.cursor(), day)
+        conn.commit()
+    finally:
+        conn.close()
+
+def game_state(kasland):
+    conn = kasland.get_db_connection()
+    try:
+        checkpoint = conn.execute("SELECT value FROM game_parameters WHERE key = 'eod_last_completed_date'").fetchone()[0]
+        balances = dict(conn.execute("SELECT id, zkaspa_balance FROM parcels WHERE owner_address IS NOT NULL").fetchall())
+        stats = [tuple(row) for row in conn.execute("SELECT * FROM daily_stats ORDER BY date")]
+        events = conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+        return checkpoint, balances, stats, events
+    finally:
+        conn.close()
+
+def today():
+    return datetime.now().date()
+
+def test_second_run_is_a_no_op(kasland, producing_parcels):
+    set_checkpoint(kasland, today() - timedelta(days=1))
+    reports = kasland.run_end_of_day()
+    assert [report['date'] for report in reports] == [today().isoformat()]
+    assert reports[0]['updated_parcels'] > 0
+
+    state = game_state(kasland)
+    assert state[0] == today().isoformat()
+    assert kasland.run_end_of_day() == []
+    assert game_state(kasland) == state
+
+def test_failure_mid_stage_is_rolled_back_and_replayed(kasland, producing_parcels, monkeypatch):
+    set_checkpoint(kasland, today() - timedelta(days=1))
+    before = game_state(kasland)
+
+    # The statistics stage fails after the fees and the distribution have run
+    def fail(*args, **kwargs):
+        raise RuntimeError("crash during the statistics stage")
+    monkeypatch.setattr(kasland, 'record_daily_stats', fail)
+    assert kasland.run_end_of_day() == []
+    assert game_state(kasland) == before
+
+    monkeypatch.undo()
+    reports = kasland.run_end_of_day()
+    assert [report['date'] for report in reports] == [today().isoformat()]
+    checkpoint, balances, _, _ = game_state(kasland)
+    assert checkpoint == today().isoformat()
+    # The day is credited exactly once
+    assert sum(balances.values()) == pytest.approx(sum(before[1].values()) + reports[0]['zkaspa_distributed'])
+
+def test_gap_is_caught_up_in_order(kasland, producing_parcels):
+    set_checkpoint(kasland, today() - timedelta(days=3))
+    before = game_state(kasland)
+
+    reports = kasland.run_end_of_day()
+    assert [report['date'] for report in reports] == [(today() - timedelta(days=offset)).isoformat() for offset in (2, 1, 0)]
+    # Events are only rolled for the current day
+    assert all(report['event'] is None for report in reports[:-1])
+    assert all(set(report['stages']) == {'fees', 'distribution', 'event', 'stats'} for report in reports)
+
+    checkpoint, balances, stats, _ = game_state(kasland)
+    assert checkpoint == today().isoformat()
+    assert {report['date'] for report in reports} <= {str(row[0]) for row in stats}
+    assert sum(balances.values()) == pytest.approx(sum(before[1].values()) + sum(report['zkaspa_distributed'] for report in reports))
+    assert kasland.run_end_of_day() == []
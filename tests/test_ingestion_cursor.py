@@ -0,0 +1,57 @@
+'''
+The ingestion cursor of the main address (check_new_transactions) must only move over transactions that were
+actually retrieved: when get_transactions_since stops at KASPA_INGEST_MAX_PAGES before reaching the cursor,
+the cursor is kept and the next poll pages again from it.
+'''
+
+import pytest
+
+CURSOR = (1_000_000, 'tests-cursor')
+
+def make_transaction(index):
+    return {
+        "transaction_id": f"tests-burst-{index:05d}",
+        "block_time": CURSOR[0] + 1000 * index,
+        "inputs": [{"previous_outpoint_address": "kaspa:testssender"}],
+        "outputs": [{"script_public_key_address": "kaspa:testselsewhere", "amount": 100000000}],
+    }
+
+@pytest.fixture
+def burst(kasland, monkeypatch):
+    # Four pages of transactions newer than the cursor, then the cursor itself (newest first, as the API)
+    page_size = kasland.KASPA_API_PAGE_SIZE
+    history = [make_transaction(index) for index in range(4 * page_size, 0, -1)]
+    history.append({**make_transaction(0), "transaction_id": CURSOR[1], "block_time": CURSOR[0]})
+
+    def get_recent_transactions(address, offset=0, limit=page_size, raise_on_error=False):
+        return history[offset:offset + limit]
+
+    monkeypatch.setattr(kasland, 'get_recent_transactions', get_recent_transactions)
+    saved_cursor = kasland.get_ingestion_cursor()
+    kasland.save_ingestion_cursor(*CURSOR)
+    yield history
+    if saved_cursor[1] is not None:
+        kasland.save_ingestion_cursor(*saved_cursor)
+    else:
+        conn = kasland.get_db_connection()
+        conn.execute("DELETE FROM game_parameters WHERE key IN ('ingest_cursor_block_time', 'ingest_cursor_tx_id')")
+        conn.commit()
+        conn.close()
+
+def test_truncated_paging_keeps_the_cursor(kasland, monkeypatch, burst):
+    monkeypatch.setattr(kasland, 'KASPA_INGEST_MAX_PAGES', 2)
+    transactions, cursor_reached = kasland.get_transactions_since(kasland.KASPA_MAIN_ADDRESS, *CURSOR)
+    assert not cursor_reached
+    assert len(transactions) == 2 * kasland.KASPA_API_PAGE_SIZE
+
+    kasland.check_new_transactions()
+    assert kasland.get_ingestion_cursor() == CURSOR
+
+def test_complete_paging_advances_the_cursor(kasland, monkeypatch, burst):
+    monkeypatch.setattr(kasland, 'KASPA_INGEST_MAX_PAGES', 10)
+    transactions, cursor_reached = kasland.get_transactions_since(kasland.KASPA_MAIN_ADDRESS, *CURSOR)
+    assert cursor_reached
+    assert len(transactions) == len(burst) - 1
+
+    kasland.check_new_transactions()
+    assert kasland.get_ingestion_cursor() == (burst[0]['block_time'], burst[0]['transaction_id'])
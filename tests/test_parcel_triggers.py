@@ -0,0 +1,98 @@
+'''
+The materialized parcel counters (building_counts, parcel_occupancy, see migrate_parcel_counters) and the
+free-parcel pool (free_parcels, see migrate_free_parcels) are kept by triggers. After random purchases,
+upgrades, transfers and fee resets, they must still match what the parcels table says.
+'''
+
+import hashlib
+import random
+import time
+
+STEPS = 300
+
+def counters_from_parcels(conn):
+    building_counts = dict(conn.execute('''
+        SELECT building_type, COUNT(*) FROM parcels WHERE building_type IS NOT NULL GROUP BY building_type
+    ''').fetchall())
+    occupancy = tuple(conn.execute("SELECT COUNT(*), COUNT(owner_address) FROM parcels").fetchone())
+    free_ids = {row[0] for row in conn.execute("SELECT id FROM parcels WHERE owner_address IS NULL AND COALESCE(purchase_amount, 0) = 0")}
+    return building_counts, occupancy, free_ids
+
+def check_counters(kasland, step):
+    conn = kasland.get_db_connection()
+    try:
+        building_counts, occupancy, free_ids = counters_from_parcels(conn)
+
+        stored_counts = {building_type: count for building_type, count in conn.execute("SELECT building_type, count FROM building_counts") if count}
+        assert stored_counts == building_counts, f"building_counts differ after step {step}"
+        assert tuple(conn.execute("SELECT total, occupied FROM parcel_occupancy WHERE id = 1").fetchone()) == occupancy, \
+            f"parcel_occupancy differs after step {step}"
+
+        slots = conn.execute("SELECT slot, parcel_id FROM free_parcels ORDER BY slot").fetchall()
+        assert {parcel_id for _, parcel_id in slots} == free_ids, f"free_parcels differs after step {step}"
+        assert [slot for slot, _ in slots] == list(range(1, len(slots) + 1)), f"free_parcels slots are not dense after step {step}"
+    finally:
+        conn.close()
+
+def deposit(kasland, address, amount):
+    tx_id = hashlib.sha256(f"{address}-{random.random()}".encode()).hexdigest()
+    return {"from_address": address, "amount": amount, "tx_id": tx_id, "timestamp": int(time.time() * 1000)}
+
+def test_counters_follow_random_mutations(kasland):
+    rng = random.Random(20240613)
+    amounts = [building['min_amount'] for building in kasland.BUILDING_TYPES]
+    check_counters(kasland, 0)
+
+    for step in range(1, STEPS + 1):
+        conn = kasland.get_db_connection()
+        try:
+            owners = [row[0] for row in conn.execute("SELECT owner_address FROM parcels WHERE owner_address IS NOT NULL")]
+            action = rng.random()
+            if action < 0.45 or not owners:
+                # Purchase of a plot by a new player
+                kasland.apply_transaction_batch([deposit(kasland, f"kaspa:testsplayer{step:05d}", rng.choice(amounts))])
+            elif action < 0.6:
+                # Additional deposit of an owner (building upgrade)
+                kasland.apply_transaction_batch([deposit(kasland, rng.choice(owners), rng.choice(amounts))])
+            elif action < 0.75:
+                # Transfer of a plot to another player
+                conn.execute("UPDATE parcels SET owner_address = ? WHERE owner_address = ?",
+                             (f"kaspa:testsbuyer{step:05d}", rng.choice(owners)))
+                conn.commit()
+            else:
+                # Unpaid fees: the plot is reset by the fee check
+                conn.execute("BEGIN TRANSACTION")
+                conn.execute("UPDATE parcels SET next_fee_date = 0 WHERE owner_address = ?", (rng.choice(owners),))
+                kasland.collect_fees(conn.cursor(), time.time())
+                conn.commit()
+        finally:
+            conn.close()
+        check_counters(kasland, step)
+
+    conn = kasland.get_db_connection()
+    try:
+        # The run must have gone through every kind of mutation
+        assert conn.execute("SELECT COUNT(*) FROM parcels WHERE owner_address IS NOT NULL").fetchone()[0] > 0
+        assert conn.execute("SELECT COUNT(*) FROM free_parcels").fetchone()[0] > 0
+    finally:
+        conn.close()
+
+def test_rebuilds_match_the_triggers(kasland):
+    conn = kasland.get_db_connection()
+    try:
+        before = (conn.execute("SELECT building_type, count FROM building_counts WHERE count > 0 ORDER BY building_type").fetchall(),
+                  conn.execute("SELECT total, occupied FROM parcel_occupancy").fetchall(),
+                  {row[0] for row in conn.execute("SELECT parcel_id FROM free_parcels")})
+        cursor = conn.cursor()
+        conn.execute("BEGIN TRANSACTION")
+        kasland.rebuild_parcel_counters(cursor)
+        kasland.rebuild_free_parcels(cursor)
+        after = (conn.execute("SELECT building_type, count FROM building_counts WHERE count > 0 ORDER BY building_type").fetchall(),
+                 conn.execute("SELECT total, occupied FROM parcel_occupancy").fetchall(),
+                 {row[0] for row in conn.execute("SELECT parcel_id FROM free_parcels")})
+        conn.rollback()
+        assert [tuple(row) for row in before[0]] == [tuple(row) for row in after[0]]
+        assert [tuple(row) for row in before[1]] == [tuple(row) for row in after[1]]
+        assert before[2] == after[2]
+    finally:
+        conn.close()
@@ -0,0 +1,53 @@
+'''
+Inside the transaction of a caller (manage_transaction=False), upgrade_building must raise its errors instead of
+returning a failure result, so that the caller rolls back its transaction or savepoint.
+'''
+
+import pytest
+
+ADDRESS = "kaspa:testsupgrader"
+
+@pytest.fixture
+def owned_parcel(kasland):
+    conn = kasland.get_db_connection()
+    try:
+        parcel_id = conn.execute(
+            "SELECT id FROM parcels WHERE owner_address IS NULL AND COALESCE(purchase_amount, 0) = 0 ORDER BY id LIMIT 1").fetchone()[0]
+        conn.execute('''
+            UPDATE parcels SET owner_address = ?, purchase_amount = 5, building_type = 'small_house', building_variant = 'A',
+                               energy_production = 0, energy_consumption = 5, zkaspa_production = 0.1
+            WHERE id = ?
+        ''', (ADDRESS, parcel_id))
+        conn.commit()
+        yield parcel_id
+    finally:
+        conn.execute('''
+            UPDATE parcels SET owner_address = NULL, purchase_amount = 0, building_type = NULL, building_variant = NULL,
+                               energy_production = NULL, energy_consumption = NULL, zkaspa_production = NULL
+            WHERE id = ?
+        ''', (parcel_id,))
+        conn.commit()
+        conn.close()
+
+def test_errors_are_raised_inside_the_transaction_of_the_caller(kasland, monkeypatch, owned_parcel):
+    def get_building_count(cursor, building_type):
+        raise RuntimeError("building count unavailable")
+
+    # The upgrade to a wind turbine checks its max_count
+    monkeypatch.setattr(kasland, 'get_building_count', get_building_count)
+    conn = kasland.get_db_connection()
+    try:
+        conn.execute("BEGIN TRANSACTION")
+        conn.execute("SAVEPOINT upgrade")
+        with pytest.raises(RuntimeError):
+            kasland.upgrade_building(conn, ADDRESS, 10, is_buy_parcel=False, manage_transaction=False)
+        conn.execute("ROLLBACK TO SAVEPOINT upgrade")
+        conn.rollback()
+
+        # With its own transaction, the error is still returned as a failure result
+        result = kasland.upgrade_building(conn, ADDRESS, 10, is_buy_parcel=False)
+        assert not result['success']
+        parcel = conn.execute("SELECT building_type, purchase_amount FROM parcels WHERE id = ?", (owned_parcel,)).fetchone()
+        assert tuple(parcel) == ('small_house', 5)
+    finally:
+        conn.close()
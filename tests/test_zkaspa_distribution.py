@@ -0,0 +1,66 @@
+'''
+The set-based daily distribution (apply_zkaspa_distribution) must write exactly the balances of the reference
+computation (compute_zkaspa_credits), including for a variant without probability, which is 'Basic'.
+'''
+
+import pytest
+
+def build_parcel(conn, parcel_id, building_type, variant, balance):
+    conn.execute('''
+        UPDATE parcels SET owner_address = ?, purchase_amount = 5, building_type = ?, building_variant = ?,
+                           energy_production = 0, energy_consumption = 5, zkaspa_production = 0.1, zkaspa_balance = ?
+        WHERE id = ?
+    ''', (f"kaspa:testsdistribution{parcel_id}", building_type, variant, balance, parcel_id))
+
+def distribute(kasland, conn, engine):
+    cursor = conn.cursor()
+    conn.execute("BEGIN TRANSACTION")
+    if engine == 'sql':
+        result = kasland.apply_zkaspa_distribution(cursor, 1.0, 1.0)
+    else:
+        updates, total = kasland.compute_zkaspa_credits(cursor, 1.0, 1.0, engine)
+        cursor.executemany("UPDATE parcels SET zkaspa_balance = ? WHERE id = ?", updates)
+        result = (len(updates), total)
+    balances = dict(conn.execute("SELECT id, zkaspa_balance FROM parcels").fetchall())
+    conn.rollback()
+    return result, balances
+
+@pytest.fixture
+def unrated_variant_parcels(kasland):
+    conn = kasland.get_db_connection()
+    try:
+        parcel_ids = [row[0] for row in conn.execute(
+            "SELECT id FROM parcels WHERE owner_address IS NULL AND COALESCE(purchase_amount, 0) = 0 ORDER BY id LIMIT 2")]
+        conn.execute("INSERT OR REPLACE INTO building_variants (building_type, variant, probability) VALUES ('small_house', 'Z', NULL)")
+        kasland.refresh_variant_rarity(conn.cursor())
+        build_parcel(conn, parcel_ids[0], 'small_house', 'Z', 42.0)
+        build_parcel(conn, parcel_ids[1], 'small_house', 'A', 7.0)
+        conn.commit()
+        yield parcel_ids
+    finally:
+        conn.execute("UPDATE parcels SET building_variant = 'A' WHERE building_variant = 'Z'")
+        conn.execute("DELETE FROM building_variants WHERE building_type = 'small_house' AND variant = 'Z'")
+        conn.commit()
+        conn.close()
+
+def test_set_based_distribution_matches_the_reference(kasland, unrated_variant_parcels):
+    conn = kasland.get_db_connection()
+    try:
+        (credited, total), balances = distribute(kasland, conn, 'sql')
+        reference_result, reference_balances = distribute(kasland, conn, 'python')
+        assert balances == reference_balances
+        assert credited == reference_result[0]
+        assert total == pytest.approx(reference_result[1])
+
+        variant = conn.execute("SELECT rarity, rarity_multiplier FROM building_variants WHERE building_type = 'small_house' AND variant = 'Z'").fetchone()
+        assert tuple(variant) == ('Basic', kasland.RARITY_MULTIPLIERS['Basic'])
+        assert conn.execute("SELECT rarity FROM parcels WHERE id = ?", (unrated_variant_parcels[0],)).fetchone()[0] == 'Basic'
+
+        # The parcel of the variant without probability keeps its balance and is credited as 'Basic'
+        assert balances[unrated_variant_parcels[0]] == 42.0 + 0.1 * kasland.RARITY_MULTIPLIERS['Basic']
+
+        if kasland.resolve_production_engine('numpy') == 'numpy':
+            _, numpy_balances = distribute(kasland, conn, 'numpy')
+            assert numpy_balances == pytest.approx(reference_balances)
+    finally:
+        conn.close()
@@ -0,0 +1,183 @@
+'''
+Database access benchmark for KasLand: one connection per call with rollback journaling (DB_POOL_ENABLED = False)
+against the connection pool with WAL and tuned pragmas (DB_POOL_ENABLED = True), with the API endpoints reading
+either the live database or a read snapshot refreshed after each committed write (API_READ_SNAPSHOT).
+
+The driver imports the application with the deployment's config.py, but points it at a scratch database
+seeded with synthetic players, so the production database is never touched. For each mode it reports:
+- the latency of the API endpoints (Flask test client, no HTTP overhead),
+- the duration of the scheduler jobs that only use the database,
+- the latency of /api/all_parcels while a writer applies deposit batches, as check_new_transactions does
+  (with rollback journaling, readers wait for the writer or fail with "database is locked").
+
+Usage:
+    python tools/benchmark_db.py --players 2000 --requests 200
+    python tools/benchmark_db.py --players 500 --readers 8 --contention-seconds 10
+'''
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TOOLS_DIR))
+sys.path.insert(0, TOOLS_DIR)
+
+import kaspa_api_stub
+from benchmark_ingestion import load_application, percentile
+
+ENDPOINTS = ['/api/top_wallets', '/api/kasland_status', '/api/all_parcels', '/api/game_info',
+             '/api/energy_stats', '/api/current_events', '/api/parcels_for_sale']
+
+"""
+Switches the application between the database access modes.
+"""
+def set_mode(kasland, pooled, snapshot=False):
+    kasland.db_pool.close_all()
+    kasland.db_pool = kasland.ConnectionPool(kasland.DB_NAME)
+    kasland.DB_POOL_ENABLED = pooled
+    kasland.API_READ_SNAPSHOT = snapshot
+    if not pooled:
+        # The WAL journal mode is persistent, go back to the default rollback journal
+        conn = kasland.sqlite3.connect(kasland.DB_NAME)
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.close()
+
+"""
+Seeds the scratch database with one deposit per player.
+"""
+def seed_players(kasland, players):
+    amounts = sorted({building['min_amount'] for building in kasland.BUILDING_TYPES})
+    deposits = [{"from_address": f"kaspa:benchplayer{index:06d}", "amount": random.choice(amounts),
+                 "tx_id": kaspa_api_stub.make_transaction(kasland.KASPA_MAIN_ADDRESS, 1, "kaspa:seed")['transaction_id'],
+                 "timestamp": int(time.time() * 1000)} for index in range(players)]
+    for start in range(0, len(deposits), 100):
+        kasland.apply_transaction_batch(deposits[start:start + 100])
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+def print_latencies(title, latencies, errors=0):
+    if not latencies:
+        print(f"  {title}: no successful call ({errors} errors)")
+        return
+    print(f"  {title}: p50 {percentile(latencies, 0.5) * 1000:.2f} ms, p95 {percentile(latencies, 0.95) * 1000:.2f} ms, "
+          f"mean {statistics.mean(latencies) * 1000:.2f} ms" + (f", {errors} errors" if errors else ""))
+
+def run_endpoints(kasland, requests_count):
+    client = kasland.app.test_client()
+    for endpoint in ENDPOINTS:
+        client.get(endpoint)  # Warm-up
+        latencies = [timed(client.get, endpoint) for _ in range(requests_count)]
+        print_latencies(endpoint, latencies)
+
+"""
+Fee check of the end-of-day pipeline (collect_fees), rolled back so that every run sees the same parcels.
+"""
+def check_fees(kasland):
+    conn = kasland.get_db_connection()
+    try:
+        conn.execute("BEGIN TRANSACTION")
+        kasland.collect_fees(conn.cursor(), time.time())
+        conn.rollback()
+    finally:
+        conn.close()
+
+def run_jobs(kasland, repeat):
+    jobs = [
+        ("collect_fees", lambda: check_fees(kasland)),
+        ("calculate_production", lambda: kasland.calculate_production(log_execution=False)),
+        ("calculate_predicted_zkaspa_production", kasland.calculate_predicted_zkaspa_production),
+    ]
+    for name, job in jobs:
+        print_latencies(name, [timed(job) for _ in range(repeat)])
+
+    # Deposit batches of players already owning a plot (upgrade path), as applied by check_new_transactions
+    conn = kasland.get_db_connection()
+    try:
+        owners = [row['owner_address'] for row in conn.execute("SELECT owner_address FROM parcels WHERE owner_address IS NOT NULL LIMIT 50")]
+    finally:
+        conn.close()
+    batches = []
+    for _ in range(repeat):
+        batch = [{"from_address": owner, "amount": 0.01,
+                  "tx_id": kaspa_api_stub.make_transaction(kasland.KASPA_MAIN_ADDRESS, 1, owner)['transaction_id'],
+                  "timestamp": int(time.time() * 1000)} for owner in owners]
+        batches.append(timed(kasland.apply_transaction_batch, batch))
+    print_latencies(f"apply_transaction_batch ({len(owners)} deposits)", batches)
+
+def run_contention(kasland, readers, seconds):
+    stop = threading.Event()
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def writer():
+        conn = kasland.get_db_connection()
+        try:
+            owners = [row['owner_address'] for row in conn.execute("SELECT owner_address FROM parcels WHERE owner_address IS NOT NULL LIMIT 50")]
+        finally:
+            conn.close()
+        while not stop.is_set():
+            kasland.apply_transaction_batch([{"from_address": owner, "amount": 0.01,
+                                              "tx_id": kaspa_api_stub.make_transaction(kasland.KASPA_MAIN_ADDRESS, 1, owner)['transaction_id'],
+                                              "timestamp": int(time.time() * 1000)} for owner in owners])
+
+    def reader():
+        client = kasland.app.test_client()
+        while not stop.is_set():
+            start = time.perf_counter()
+            response = client.get('/api/all_parcels')
+            elapsed = time.perf_counter() - start
+            with lock:
+                if response.status_code == 200:
+                    latencies.append(elapsed)
+                else:
+                    errors.append(response.status_code)
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    print(f"  /api/all_parcels under write load: {len(latencies) / seconds:.1f} requests/s")
+    print_latencies(f"/api/all_parcels under write load ({readers} readers)", latencies, len(errors))
+
+def main():
+    parser = argparse.ArgumentParser(description="KasLand database access benchmark (per-call connections against the pool)")
+    parser.add_argument('--players', type=int, default=1000, help="Number of synthetic players (one plot each)")
+    parser.add_argument('--requests', type=int, default=100, help="Requests per API endpoint")
+    parser.add_argument('--repeat', type=int, default=10, help="Runs of each scheduler job")
+    parser.add_argument('--readers', type=int, default=4, help="Concurrent readers in the contention scenario")
+    parser.add_argument('--contention-seconds', type=float, default=5.0)
+    parser.add_argument('--work-dir', help="Directory for the scratch database (a temporary one by default)")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='kasland_db_benchmark_')
+    os.makedirs(work_dir, exist_ok=True)
+    # The Kaspa API is not used, the URL only has to be local
+    kasland = load_application(work_dir, "http://127.0.0.1:9", int(args.players * 1.2) + 10)
+    print(f"Scratch directory: {work_dir}")
+    seed_players(kasland, args.players)
+
+    modes = (("Per-call connections, rollback journal", False, False),
+             ("Connection pool, WAL and tuned pragmas", True, False),
+             ("Connection pool, API read snapshots", True, True))
+    for title, pooled, snapshot in modes:
+        set_mode(kasland, pooled, snapshot)
+        print(title)
+        run_endpoints(kasland, args.requests)
+        run_jobs(kasland, args.repeat)
+        run_contention(kasland, args.readers, args.contention_seconds)
+
+if __name__ == '__main__':
+    main()
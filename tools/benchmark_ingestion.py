@@ -0,0 +1,217 @@
+'''
+Ingestion benchmark for KasLand, run against the local Kaspa API stand-in (tools/kaspa_api_stub.py).
+
+The driver imports the application with the deployment's config.py, but points it at a scratch
+database and log file and at an in-process stub, so the live API and the production database
+are never touched. It then polls with check_new_transactions() (and check_monitored_wallets()
+for the plot sales scenario) and reports:
+- the ingestion throughput: transactions applied per second of polling time and of wall time,
+- the end-to-end lag: time between a transaction becoming visible on the API and being recorded.
+
+With --push, transactions are received through UTXO change notifications (UtxoSubscriptionSource fed by
+the stub's LocalUtxoNotifier) and polling only runs as gap-filler.
+
+Usage:
+    python tools/benchmark_ingestion.py --deposits 1000 --burst 250 --poll-interval 1
+    python tools/benchmark_ingestion.py --replay recorded_transactions.jsonl --speed 20 --error-429 0.05
+    python tools/benchmark_ingestion.py --deposits 200 --sales 20 --latency-ms 100
+    python tools/benchmark_ingestion.py --deposits 500 --rate 20 --sales 20 --push
+'''
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TOOLS_DIR))
+sys.path.insert(0, TOOLS_DIR)
+
+import kaspa_api_stub
+
+"""
+Imports the application against a scratch directory and the stub URL.
+"""
+def load_application(work_dir, api_url, total_parcels):
+    import config
+
+    config.DB_NAME = os.path.join(work_dir, 'kasland_benchmark.db')
+    config.LOG_FILE_NAME = os.path.join(work_dir, 'kasland_benchmark.log')
+    config.SESSION_FILE_DIR = os.path.join(work_dir, 'sessions')
+    config.KASPA_API_BASE_URL = api_url
+    # The benchmark drives the jobs itself
+    config.CHECK_INTERVAL = 24 * 60 * 60
+    config.MONITOR_CYCLE_DEADLINE = 30
+    config.TOTAL_PARCELS_DESIRED = max(config.TOTAL_PARCELS_DESIRED, total_parcels)
+
+    import app as kasland
+    kasland.scheduler.shutdown(wait=False)
+    return kasland
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def print_lags(title, lags):
+    if not lags:
+        print(f"{title}: no transaction recorded")
+        return
+    print(f"{title}: p50 {percentile(lags, 0.5):.3f} s, p95 {percentile(lags, 0.95):.3f} s, "
+          f"max {max(lags):.3f} s, mean {statistics.mean(lags):.3f} s")
+
+"""
+Returns {tx_id: processed_at} for all recorded transactions.
+"""
+def recorded_transactions(kasland):
+    conn = kasland.get_db_connection()
+    try:
+        rows = conn.execute("SELECT transaction_id, processed_at FROM processed_transactions").fetchall()
+        return {kasland.tx_id_from_blob(row['transaction_id']): row['processed_at'] for row in rows}
+    finally:
+        conn.close()
+
+"""
+Polls check_new_transactions() until the expected transactions are recorded or the timeout expires.
+Returns (recorded transactions, polling time, wall time).
+"""
+def drain(kasland, stream, expected_ids, poll_interval, timeout):
+    busy_time = 0.0
+    start = time.time()
+    recorded = {}
+    while time.time() - start < timeout:
+        poll_start = time.perf_counter()
+        kasland.check_new_transactions()
+        busy_time += time.perf_counter() - poll_start
+
+        recorded = recorded_transactions(kasland)
+        if expected_ids.issubset(recorded) and stream.pending_count() == 0:
+            break
+        time.sleep(poll_interval)
+    return recorded, busy_time, time.time() - start
+
+def run_ingestion(kasland, stream, transactions, delays, args):
+    stream.add(transactions, delays)
+    expected_ids = {tx['transaction_id'] for tx in transactions}
+
+    recorded, busy_time, wall_time = drain(kasland, stream, expected_ids, args.poll_interval, args.timeout)
+    applied = [tx_id for tx_id in expected_ids if tx_id in recorded]
+    lags = [recorded[tx_id] - stream.release_times[tx_id] for tx_id in applied]
+
+    print(f"Ingestion: {len(applied)}/{len(expected_ids)} transactions applied")
+    if args.push:
+        print(f"Throughput: {len(applied) / wall_time if wall_time else 0:.1f} tx/s of wall time (pushed)")
+    else:
+        print(f"Throughput: {len(applied) / busy_time if busy_time else 0:.1f} tx/s of polling time, "
+              f"{len(applied) / wall_time if wall_time else 0:.1f} tx/s of wall time")
+    print_lags("End-to-end lag", lags)
+    return applied
+
+"""
+Plot sales: owners list their plot (0.2 KAS to the game address), then a new player pays each
+seller the listed price. Reports how long it takes for check_monitored_wallets() to transfer the plots.
+"""
+def run_sales(kasland, stream, owners, args):
+    listings = [kaspa_api_stub.make_transaction(kasland.KASPA_MAIN_ADDRESS, 0.2, owner) for owner in owners]
+    stream.add(listings)
+    drain(kasland, stream, {tx['transaction_id'] for tx in listings}, args.poll_interval, args.timeout)
+
+    conn = kasland.get_db_connection()
+    try:
+        pending = conn.execute("SELECT id, address, expected_amount FROM wallets_to_monitor WHERE status = 'pending'").fetchall()
+        payments = {row['id']: kaspa_api_stub.make_transaction(row['address'], row['expected_amount'], f"kaspa:stubbuyer{row['id']:06d}")
+                    for row in pending}
+    finally:
+        conn.close()
+    # A first cycle registers the seller addresses with the transaction source
+    kasland.check_monitored_wallets()
+    stream.add(list(payments.values()))
+
+    completed_at = {}
+    start = time.time()
+    cycles = []
+    while len(completed_at) < len(payments) and time.time() - start < args.timeout:
+        # With --push, the notifications run the watcher cycles
+        if not args.push:
+            cycle_start = time.perf_counter()
+            kasland.check_monitored_wallets()
+            cycles.append(time.perf_counter() - cycle_start)
+        conn = kasland.get_db_connection()
+        try:
+            for row in conn.execute("SELECT id FROM wallets_to_monitor WHERE status = 'completed'").fetchall():
+                if row['id'] in payments and row['id'] not in completed_at:
+                    completed_at[row['id']] = time.time()
+        finally:
+            conn.close()
+        time.sleep(0.05 if args.push else args.poll_interval)
+
+    lags = [completed_at[wallet_id] - stream.release_times[payments[wallet_id]['transaction_id']] for wallet_id in completed_at]
+    print(f"Sales: {len(completed_at)}/{len(payments)} plots transferred in {len(cycles)} watcher cycles "
+          f"(mean cycle {statistics.mean(cycles) if cycles else 0:.3f} s)")
+    print_lags("Purchase lag", lags)
+
+def main():
+    parser = argparse.ArgumentParser(description="KasLand ingestion benchmark against the local Kaspa API stand-in")
+    parser.add_argument('--deposits', type=int, default=500, help="Number of synthetic deposits")
+    parser.add_argument('--replay', help="JSONL file of recorded transactions to replay instead of synthetic deposits")
+    parser.add_argument('--speed', type=float, default=1.0, help="Replay acceleration factor")
+    parser.add_argument('--rate', type=float, default=200.0, help="Synthetic deposits per second")
+    parser.add_argument('--burst', type=int, help="Release synthetic deposits by groups of this size")
+    parser.add_argument('--burst-interval', type=float, default=5.0)
+    parser.add_argument('--sales', type=int, default=0, help="Number of plot sales to run after ingestion")
+    parser.add_argument('--poll-interval', type=float, default=1.0, help="Delay between two polls (seconds)")
+    parser.add_argument('--timeout', type=float, default=300.0, help="Time limit of each phase (seconds)")
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--error-429', type=float, default=0.0)
+    parser.add_argument('--error-5xx', type=float, default=0.0)
+    parser.add_argument('--push', action='store_true', help="Receive transactions through the local UTXO notifier")
+    parser.add_argument('--gap-fill-interval', type=float, default=600.0, help="Gap-filler poll interval with --push (seconds)")
+    parser.add_argument('--work-dir', help="Directory for the scratch database (a temporary one by default)")
+    args = parser.parse_args()
+
+    stream = kaspa_api_stub.TransactionStream()
+    faults = kaspa_api_stub.Faults(args.latency_ms, args.jitter_ms, args.error_429, args.error_5xx)
+    server = kaspa_api_stub.start_in_thread(stream, faults)
+    api_url = f"http://127.0.0.1:{server.server_port}"
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='kasland_benchmark_')
+    os.makedirs(work_dir, exist_ok=True)
+    kasland = load_application(work_dir, api_url, int(args.deposits * 1.2) + 10)
+    print(f"Scratch directory: {work_dir}, stub API: {api_url}")
+    if args.push:
+        notifier = kaspa_api_stub.LocalUtxoNotifier(stream)
+        kasland.set_transaction_source(kasland.UtxoSubscriptionSource(notifier, gap_fill_interval=args.gap_fill_interval))
+
+    if args.replay:
+        transactions, delays = kaspa_api_stub.load_recording(args.replay, args.speed)
+    else:
+        amounts = sorted({building['min_amount'] for building in kasland.BUILDING_TYPES})
+        transactions, delays = kaspa_api_stub.generate_deposits(
+            kasland.KASPA_MAIN_ADDRESS, args.deposits, amounts=amounts,
+            rate=args.rate, burst=args.burst, burst_interval=args.burst_interval)
+
+    # The first poll only ingests the latest page, it initialises the ingestion cursor on a genesis transaction
+    stream.add([kaspa_api_stub.make_transaction(kasland.KASPA_MAIN_ADDRESS, 0.01, "kaspa:stubgenesis")])
+    kasland.check_new_transactions()
+    run_ingestion(kasland, stream, transactions, delays, args)
+
+    if args.sales:
+        conn = kasland.get_db_connection()
+        try:
+            owners = [row['owner_address'] for row in conn.execute("SELECT owner_address FROM parcels WHERE owner_address IS NOT NULL").fetchall()]
+        finally:
+            conn.close()
+        run_sales(kasland, stream, random.sample(owners, min(args.sales, len(owners))), args)
+
+    for endpoint, stats in kasland.kaspa_api.get_stats().items():
+        print(f"Kaspa API {endpoint}: {stats['calls']} calls, {stats['errors']} errors, "
+              f"avg latency {stats['avg_latency'] * 1000:.1f} ms")
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
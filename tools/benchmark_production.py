@@ -0,0 +1,175 @@
+'''
+Production benchmark for KasLand: the per-parcel reference loop (PRODUCTION_ENGINE = 'python') against the
+NumPy columnar engine (PRODUCTION_ENGINE = 'numpy'), at growing numbers of built parcels.
+
+The driver imports the application with the deployment's config.py, but points it at a scratch database
+whose parcels are built directly (random building types and variants of BUILDING_TYPES), so the production
+database is never touched. For each size it reports:
+- the production totals over every parcel (calculate_production_from_parcels) with each engine,
+  and calculate_production, which reads the production aggregates,
+- the daily zkaspa credits (compute_zkaspa_credits) with each engine, and for the NumPy engine the share of
+  loading the columns from SQLite and of the vector operations,
+- the distribution, credits and balance updates in one transaction (rolled back, so every run sees the same balances),
+  with each engine and with the set-based UPDATE of apply_zkaspa_distribution,
+and checks that all paths give the same results.
+
+Usage:
+    python tools/benchmark_production.py
+    python tools/benchmark_production.py --sizes 1000 10000 100000 --repeat 5
+'''
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TOOLS_DIR))
+sys.path.insert(0, TOOLS_DIR)
+
+from benchmark_ingestion import load_application, percentile
+
+ENGINES = ('python', 'numpy')
+
+"""
+Builds the parcels with ids in (first_id, last_id]: a random building type and variant each.
+"""
+def build_parcels(kasland, first_id, last_id):
+    conn = kasland.get_db_connection()
+    try:
+        variants = {}
+        for row in conn.execute("SELECT building_type, variant FROM building_variants"):
+            variants.setdefault(row['building_type'], []).append(row['variant'])
+        buildings = [building for building in kasland.BUILDING_TYPES if variants.get(building['name'])]
+        updates = []
+        for parcel_id in range(first_id + 1, last_id + 1):
+            building = random.choice(buildings)
+            updates.append((f"kaspa:benchowner{parcel_id:07d}", building['min_amount'], building['name'],
+                            random.choice(variants[building['name']]), building.get('energy_production', 0),
+                            building.get('energy_consumption', 0), building.get('zkaspa_production', 0),
+                            random.uniform(0, 100), parcel_id))
+        conn.executemany('''
+            UPDATE parcels SET owner_address = ?, purchase_amount = ?, building_type = ?, building_variant = ?,
+                               energy_production = ?, energy_consumption = ?, zkaspa_production = ?, zkaspa_balance = ?
+            WHERE id = ?
+        ''', updates)
+        conn.commit()
+    finally:
+        conn.close()
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+def print_timings(title, timings, baseline=None):
+    speedup = f", x{statistics.mean(baseline) / statistics.mean(timings):.1f}" if baseline else ""
+    print(f"  {title}: p50 {percentile(timings, 0.5) * 1000:.2f} ms, mean {statistics.mean(timings) * 1000:.2f} ms{speedup}")
+
+"""
+Credits and balance updates of the distribution stage (credit_daily_zkaspa), rolled back: computed with engine and written back parcel
+by parcel, or applied by the set-based UPDATE (engine 'sql'). Returns the balances after the distribution if
+read_balances is set.
+"""
+def distribution(kasland, engine, energy_multiplier, zkaspa_multiplier, read_balances=False):
+    conn = kasland.get_db_connection()
+    try:
+        cursor = conn.cursor()
+        conn.execute("BEGIN TRANSACTION")
+        if engine == 'sql':
+            kasland.apply_zkaspa_distribution(cursor, energy_multiplier, zkaspa_multiplier)
+        else:
+            updates, _ = kasland.compute_zkaspa_credits(cursor, energy_multiplier, zkaspa_multiplier, engine)
+            cursor.executemany("UPDATE parcels SET zkaspa_balance = ? WHERE id = ?", updates)
+        balances = dict(cursor.execute("SELECT id, zkaspa_balance FROM parcels").fetchall()) if read_balances else None
+        conn.rollback()
+        return balances
+    finally:
+        conn.close()
+
+def run_size(kasland, size, repeat):
+    effects = kasland.get_current_event_effects(log_execution=False)
+    multipliers = (effects['energy_multiplier'], effects['zkaspa_multiplier'])
+    conn = kasland.get_db_connection()
+    try:
+        cursor = conn.cursor()
+        totals = {}
+        credits = {}
+        timings = {}
+        for engine in ENGINES:
+            timings[('totals', engine)] = []
+            timings[('credits', engine)] = []
+            for _ in range(repeat):
+                elapsed, totals[engine] = timed(kasland.calculate_production_from_parcels, cursor, False, engine)
+                timings[('totals', engine)].append(elapsed)
+                elapsed, credits[engine] = timed(kasland.compute_zkaspa_credits, cursor, *multipliers, engine)
+                timings[('credits', engine)].append(elapsed)
+        aggregates = [timed(kasland.calculate_production, conn, cursor, False)[0] for _ in range(repeat)]
+        if kasland.resolve_production_engine('numpy') == 'numpy':
+            load_timings = []
+            compute_timings = []
+            for _ in range(repeat):
+                elapsed, columns = timed(kasland.load_production_columns, cursor)
+                load_timings.append(elapsed)
+                compute_timings.append(timed(kasland.zkaspa_credits_from_columns, columns, *multipliers)[0])
+    finally:
+        conn.close()
+    distributions = {engine: [timed(distribution, kasland, engine, *multipliers)[0] for _ in range(repeat)] for engine in ENGINES + ('sql',)}
+
+    print(f"{size} parcels ({len(credits['python'][0])} producing)")
+    for engine in ENGINES:
+        print_timings(f"production totals, {engine}", timings[('totals', engine)],
+                      timings[('totals', 'python')] if engine != 'python' else None)
+    print_timings("calculate_production (aggregates)", aggregates, timings[('totals', 'python')])
+    for engine in ENGINES:
+        print_timings(f"zkaspa credits, {engine}", timings[('credits', engine)],
+                      timings[('credits', 'python')] if engine != 'python' else None)
+    if kasland.resolve_production_engine('numpy') == 'numpy':
+        print_timings("  numpy column load", load_timings)
+        print_timings("  numpy vector computation", compute_timings)
+    for engine in ENGINES + ('sql',):
+        print_timings(f"distribution with balance updates, {engine}", distributions[engine],
+                      distributions['python'] if engine != 'python' else None)
+
+    # Both engines must agree (up to the summation order of the floats)
+    reference_balances = dict((parcel_id, balance) for balance, parcel_id in credits['python'][0])
+    balance_error = max((abs(reference_balances[parcel_id] - balance) for balance, parcel_id in credits['numpy'][0]), default=0.0)
+    total_error = max(abs(totals['python'][key] - totals['numpy'][key]) for key in ('energy_production', 'energy_consumption', 'zkaspa_production'))
+    matching = (set(reference_balances) == {parcel_id for _, parcel_id in credits['numpy'][0]}
+                and balance_error < 1e-9 and total_error < 1e-6 * max(1.0, totals['python']['energy_production']))
+    print(f"  engines agree: {'yes' if matching else 'NO'} (max balance difference {balance_error:.2e}, max total difference {total_error:.2e})")
+
+    # The set-based UPDATE must write exactly the balances of the reference path
+    identical = distribution(kasland, 'sql', *multipliers, True) == distribution(kasland, 'python', *multipliers, True)
+    print(f"  set-based distribution identical to the reference: {'yes' if identical else 'NO'}")
+    return matching and identical
+
+def main():
+    parser = argparse.ArgumentParser(description="KasLand production benchmark (reference loop against the NumPy engine)")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help="Numbers of built parcels")
+    parser.add_argument('--repeat', type=int, default=5, help="Runs of each computation")
+    parser.add_argument('--work-dir', help="Directory for the scratch database (a temporary one by default)")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='kasland_production_benchmark_')
+    os.makedirs(work_dir, exist_ok=True)
+    sizes = sorted(args.sizes)
+    # The Kaspa API is not used, the URL only has to be local
+    kasland = load_application(work_dir, "http://127.0.0.1:9", sizes[-1])
+    print(f"Scratch directory: {work_dir}")
+    if kasland.numpy is None:
+        print("NumPy is not installed (see requirements-numpy.txt), the 'numpy' engine falls back to the reference loop")
+
+    built = 0
+    matching = True
+    for size in sizes:
+        build_parcels(kasland, built, size)
+        built = size
+        matching = run_size(kasland, size, args.repeat) and matching
+    sys.exit(0 if matching else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,326 @@
+'''
+Local stand-in for the Kaspa REST API used by KasLand.
+
+Serves /addresses/<address>/full-transactions (limit/offset, newest first) from an in-memory
+transaction stream, so that ingestion (check_new_transactions), the monitored wallet checks
+(check_and_find_transaction) and plot purchases (process_parcel_purchase) can be exercised
+without the live API.
+
+The stream is either replayed from a JSONL file (one full-transactions object per line, as
+returned by the real API) or generated synthetically. Replayed transactions keep their relative
+spacing (optionally accelerated with --speed) and their block_time is rewritten to the moment
+they become visible, so the ingestion lag can be measured against it.
+
+Faults can be injected: fixed and random latency, a share of 429 and 5xx responses, and bursts
+(groups of transactions that become visible at the same instant).
+
+LocalUtxoNotifier stands in for the UTXO change notifications of a Kaspa node, to exercise the push
+transaction source (UtxoSubscriptionSource) in-process.
+
+Usage:
+    python tools/kaspa_api_stub.py --synthetic 500 --address kaspa:... --burst 100 --port 8765
+    python tools/kaspa_api_stub.py --replay recorded_transactions.jsonl --speed 10 --error-429 0.05
+'''
+
+import argparse
+import hashlib
+import itertools
+import json
+import logging
+import random
+import threading
+import time
+
+from flask import Flask, jsonify, request
+from werkzeug.serving import make_server
+
+"""
+Transaction stream shared by the HTTP handlers.
+Transactions are kept with the wall-clock time at which they become visible.
+"""
+class TransactionStream:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = []  # (release_time, tx) not yet visible, sorted by release_time
+        self.released = {}  # address -> list of visible transactions, oldest first
+        self.release_times = {}  # tx_id -> wall-clock release time (seconds)
+        self.listeners = []
+
+    """
+    Schedules transactions. delays (seconds from now) default to 0 (visible immediately).
+    """
+    def add(self, transactions, delays=None):
+        now = time.time()
+        with self.lock:
+            for index, tx in enumerate(transactions):
+                delay = delays[index] if delays else 0
+                self.pending.append((now + delay, tx))
+            self.pending.sort(key=lambda item: item[0])
+        self.release_due()
+
+    """
+    Makes visible the transactions whose release time has come and notifies the listeners
+    (see add_listener) with the list of newly visible transactions.
+    """
+    def release_due(self):
+        now = time.time()
+        newly_released = []
+        with self.lock:
+            while self.pending and self.pending[0][0] <= now:
+                release_time, tx = self.pending.pop(0)
+                tx['block_time'] = int(release_time * 1000)
+                self.release_times[tx['transaction_id']] = release_time
+                for address in transaction_addresses(tx):
+                    self.released.setdefault(address, []).append(tx)
+                newly_released.append(tx)
+            listeners = list(self.listeners)
+        if newly_released:
+            for listener in listeners:
+                listener(newly_released)
+        return newly_released
+
+    """
+    Registers a callable invoked with each group of newly visible transactions.
+    """
+    def add_listener(self, listener):
+        with self.lock:
+            self.listeners.append(listener)
+
+    def page(self, address, offset, limit):
+        self.release_due()
+        with self.lock:
+            transactions = self.released.get(address, [])
+            newest_first = transactions[::-1]
+            return newest_first[offset:offset + limit]
+
+    def find(self, tx_id):
+        self.release_due()
+        with self.lock:
+            for transactions in self.released.values():
+                for tx in transactions:
+                    if tx['transaction_id'] == tx_id:
+                        return tx
+        return None
+
+    def pending_count(self):
+        with self.lock:
+            return len(self.pending)
+
+"""
+Returns the set of addresses involved in a transaction (outputs and resolved inputs).
+"""
+def transaction_addresses(tx):
+    addresses = {output['script_public_key_address'] for output in tx.get('outputs', [])}
+    addresses.update(tx_input['previous_outpoint_address'] for tx_input in tx.get('inputs', [])
+                     if tx_input.get('previous_outpoint_address'))
+    return addresses
+
+_tx_counter = itertools.count()
+
+"""
+Builds a transaction in the format of the full-transactions endpoint.
+"""
+def make_transaction(to_address, amount_kas, from_address, block_time=None):
+    tx_id = hashlib.sha256(f"kasland-stub-{next(_tx_counter)}-{random.random()}".encode()).hexdigest()
+    return {
+        "transaction_id": tx_id,
+        "block_time": block_time or int(time.time() * 1000),
+        "inputs": [{"previous_outpoint_address": from_address}],
+        "outputs": [{"script_public_key_address": to_address, "amount": int(round(amount_kas * 100000000))}]
+    }
+
+"""
+Generates count deposits to address from distinct senders, with amounts drawn from amounts.
+Returns (transactions, delays): deposits arrive at rate per second, or by groups of burst
+deposits every burst_interval seconds if burst is set.
+"""
+def generate_deposits(address, count, amounts=(5, 10, 20, 40), rate=50.0, burst=None, burst_interval=5.0):
+    transactions = []
+    delays = []
+    for index in range(count):
+        transactions.append(make_transaction(address, random.choice(amounts), f"kaspa:stubplayer{index:06d}"))
+        if burst:
+            delays.append((index // burst) * burst_interval)
+        else:
+            delays.append(index / rate)
+    return transactions, delays
+
+"""
+Loads a recorded stream (JSONL, one transaction per line, any order).
+Returns (transactions, delays) preserving the recorded spacing divided by speed.
+"""
+def load_recording(path, speed=1.0):
+    with open(path) as recording:
+        transactions = [json.loads(line) for line in recording if line.strip()]
+    transactions.sort(key=lambda tx: tx['block_time'])
+    if not transactions:
+        return [], []
+    first_block_time = transactions[0]['block_time']
+    delays = [(tx['block_time'] - first_block_time) / 1000 / speed for tx in transactions]
+    return transactions, delays
+
+"""
+Fault injection settings, changeable at runtime through /_stub/faults.
+"""
+class Faults:
+    def __init__(self, latency_ms=0, jitter_ms=0, error_429=0.0, error_5xx=0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_429 = error_429
+        self.error_5xx = error_5xx
+
+"""
+Local stand-in for the Kaspa node UTXO change notifications (see UtxoSubscriptionSource in app.py).
+Notifies the subscribed addresses of the transactions of the stream as they become visible.
+"""
+class LocalUtxoNotifier:
+    def __init__(self, stream, tick=0.05):
+        self.stream = stream
+        self.tick = tick
+        self.addresses = set()
+        self.callback = None
+        self.connected = False
+        self.connected_at = None
+        self.lock = threading.Lock()
+        stream.add_listener(self.on_released)
+
+    def subscribe(self, addresses, callback):
+        self.callback = callback
+        with self.lock:
+            self.addresses.update(addresses)
+
+    def unsubscribe(self, addresses):
+        with self.lock:
+            self.addresses.difference_update(addresses)
+
+    def start(self):
+        self.connected = True
+        self.connected_at = time.monotonic()
+        # Delayed transactions become visible without anyone querying the API
+        threading.Thread(target=self.release_loop, name='utxo-notifier-stub', daemon=True).start()
+
+    def stop(self):
+        self.connected = False
+
+    def release_loop(self):
+        while self.connected:
+            self.stream.release_due()
+            time.sleep(self.tick)
+
+    def on_released(self, transactions):
+        if not self.connected or self.callback is None:
+            return
+        tx_ids_by_address = {}
+        with self.lock:
+            for tx in transactions:
+                for output in tx.get('outputs', []):
+                    address = output['script_public_key_address']
+                    if address in self.addresses:
+                        tx_ids_by_address.setdefault(address, []).append(tx['transaction_id'])
+        for address, tx_ids in tx_ids_by_address.items():
+            self.callback(address, tx_ids)
+
+"""
+Creates the stub Flask application.
+"""
+def create_app(stream, faults):
+    stub = Flask(__name__)
+    counters = {"requests": 0, "429": 0, "5xx": 0}
+    counters_lock = threading.Lock()
+
+    def count(key):
+        with counters_lock:
+            counters[key] += 1
+
+    def inject_faults():
+        count("requests")
+        delay = faults.latency_ms + random.uniform(0, faults.jitter_ms)
+        if delay:
+            time.sleep(delay / 1000)
+        draw = random.random()
+        if draw < faults.error_429:
+            count("429")
+            return jsonify({"detail": "Too Many Requests"}), 429
+        if draw < faults.error_429 + faults.error_5xx:
+            count("5xx")
+            return jsonify({"detail": "Internal Server Error"}), random.choice([500, 502, 503])
+        return None
+
+    @stub.route('/addresses/<address>/full-transactions', methods=['GET'])
+    def full_transactions(address):
+        fault = inject_faults()
+        if fault:
+            return fault
+        limit = min(int(request.args.get('limit', 50)), 500)
+        offset = int(request.args.get('offset', 0))
+        return jsonify(stream.page(address, offset, limit))
+
+    @stub.route('/transactions/<tx_id>', methods=['GET'])
+    def transaction(tx_id):
+        fault = inject_faults()
+        if fault:
+            return fault
+        tx = stream.find(tx_id)
+        if tx is None:
+            return jsonify({"detail": "Transaction not found"}), 404
+        return jsonify(tx)
+
+    # Control endpoints (not part of the Kaspa API)
+    @stub.route('/_stub/transactions', methods=['POST'])
+    def inject_transactions():
+        payload = request.get_json()
+        transactions = payload.get('transactions', [])
+        stream.add(transactions, payload.get('delays'))
+        return jsonify({"scheduled": len(transactions)})
+
+    @stub.route('/_stub/faults', methods=['POST'])
+    def set_faults():
+        for key, value in request.get_json().items():
+            if hasattr(faults, key):
+                setattr(faults, key, value)
+        return jsonify(vars(faults))
+
+    @stub.route('/_stub/stats', methods=['GET'])
+    def stats():
+        with counters_lock:
+            return jsonify(dict(counters, pending=stream.pending_count()))
+
+    return stub
+
+"""
+Runs the stub in a background thread. Returns the server (call shutdown() to stop it).
+"""
+def start_in_thread(stream, faults, host='127.0.0.1', port=0):
+    # Keep the benchmark output readable
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server(host, port, create_app(stream, faults), threaded=True)
+    thread = threading.Thread(target=server.serve_forever, name='kaspa-api-stub', daemon=True)
+    thread.start()
+    return server
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local stand-in for the Kaspa REST API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--replay', help="JSONL file of recorded full-transactions objects")
+    parser.add_argument('--speed', type=float, default=1.0, help="Replay acceleration factor")
+    parser.add_argument('--synthetic', type=int, default=0, help="Number of synthetic deposits to generate")
+    parser.add_argument('--address', default='kaspa:stubgameaddress', help="Destination of synthetic deposits")
+    parser.add_argument('--rate', type=float, default=50.0, help="Synthetic deposits per second")
+    parser.add_argument('--burst', type=int, help="Release synthetic deposits by groups of this size")
+    parser.add_argument('--burst-interval', type=float, default=5.0)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--error-429', type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument('--error-5xx', type=float, default=0.0, help="Share of requests answered with 5xx")
+    args = parser.parse_args()
+
+    stream = TransactionStream()
+    if args.replay:
+        stream.add(*load_recording(args.replay, args.speed))
+    if args.synthetic:
+        stream.add(*generate_deposits(args.address, args.synthetic, rate=args.rate,
+                                      burst=args.burst, burst_interval=args.burst_interval))
+
+    faults = Faults(args.latency_ms, args.jitter_ms, args.error_429, args.error_5xx)
+    create_app(stream, faults).run(host=args.host, port=args.port, threaded=True)